@@ -41,16 +41,17 @@ function buildConfig(env) {
 }
 
 export default {
-    async fetch(request, env) {
+    async fetch(request, env, ctx) {
         const url = new URL(request.url);
         const config = buildConfig(env);
-        const MAX_SCAN = 500; // number of recent records to scan for a valid fix
+        const POSITION_CACHE_SEC = 5; // edge cache for /api/position (gateway updates it every 5s)
         
         // CORS Headers
         const corsHeaders = {
             'Access-Control-Allow-Origin': '*',
             'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
+            'Access-Control-Expose-Headers': 'ETag, X-Next-Cursor',
             'Content-Type': 'application/json'
         };
 
@@ -62,45 +63,84 @@ export default {
         try {
             // Route: GET /api/position - Aktuelle Position
             if (url.pathname === '/api/position' && request.method === 'GET') {
-                const device = url.searchParams.get('device') || 'pi9';
-                const data = await queryDynamoDB(config, device, MAX_SCAN);
-
-                if (!data.Items || data.Items.length === 0) {
-                    return new Response('{}', { headers: corsHeaders });
-                }
-
-                // Parse newest entry (could be without fix/coords)
-                const latestEntry = data.Items.length > 0 ? parseItem(data.Items[0]) : null;
-                // Fallback to newest valid position (with fix) for coords if available
-                const fallbackPosition = findLatestValidPosition(data.Items);
-
-                // Combine: prefer newest entry (even ohne Fix), but backfill coords from last valid fix
-                const result = {
-                    ...latestEntry,
-                    ...(latestEntry && Number.isFinite(latestEntry.lat) && Number.isFinite(latestEntry.lon)
-                        ? {}
-                        : fallbackPosition),
-                    last_update_ts: latestEntry?.ts || fallbackPosition?.ts
-                };
-
-                return new Response(JSON.stringify(result), { headers: corsHeaders });
+                return edgeCached(request, ctx, POSITION_CACHE_SEC, async () => {
+                    const device = url.searchParams.get('device') || 'pi9';
+                    // Latest-state item kept by the gateway; scan only for gateways that don't send it
+                    const result = await readLatestPosition(config, device) ?? await scanPosition(config, device);
+                    return new Response(JSON.stringify(result), { headers: corsHeaders });
+                });
             }
 
             // Route: GET /api/track - Letzte Positionen
+            // ?since=<ts ms>: only newer points; ?cursor=: next page (X-Next-Cursor of the previous one)
             if (url.pathname === '/api/track' && request.method === 'GET') {
                 const device = url.searchParams.get('device') || 'pi9';
-                const limit = parseInt(url.searchParams.get('limit')) || 100;
-                
-                const data = await queryDynamoDB(config, device, limit);
+                const limit = Math.min(parseInt(url.searchParams.get('limit')) || 100, MAX_TRACK_PAGE);
+                const since = parseInt(url.searchParams.get('since')) || 0;
+                const cursor = url.searchParams.get('cursor');
+
+                let startKey;
+                try {
+                    startKey = cursor ? JSON.parse(atob(cursor)) : undefined;
+                } catch (e) {
+                    return new Response(
+                        JSON.stringify({ error: 'Invalid cursor' }),
+                        { status: 400, headers: corsHeaders }
+                    );
+                }
+
+                const data = await queryDynamoDB(config, device, limit, startKey);
 
                 if (!data.Items) {
                     return new Response('[]', { headers: corsHeaders });
                 }
 
                 // Return complete history including entries without GPS fix
-                const points = data.Items
-                    .map(parseItem);
-                return new Response(JSON.stringify(points), { headers: corsHeaders });
+                // (batch items from gateway backfill expand to their simplified points)
+                let points = data.Items
+                    .flatMap(expandItem);
+                let more = !!data.LastEvaluatedKey;
+                if (since) {
+                    // Applied to the newest-first page (works whatever type the rule gives the ts
+                    // sort key); clients polling with since use small pages and follow the cursor.
+                    // Items come newest first: once one is not newer than since, the rest are older too
+                    const newer = points.filter(p => Number(p.ts) > since);
+                    more = more && newer.length === points.length;
+                    points = newer;
+                }
+
+                const headers = more
+                    ? { ...corsHeaders, 'X-Next-Cursor': btoa(JSON.stringify(data.LastEvaluatedKey)) }
+                    : corsHeaders;
+                return new Response(JSON.stringify(points), { headers });
+            }
+
+            // Route: GET /api/trips - Ride summaries (segmented on the gateway)
+            if (url.pathname === '/api/trips' && request.method === 'GET') {
+                const device = url.searchParams.get('device') || 'pi9';
+                const limit = Math.min(parseInt(url.searchParams.get('limit')) || 20, 500);
+
+                // Summaries are stored under their own partition key "<device>#trips"
+                const data = await queryDynamoDB(config, `${device}#trips`, limit);
+                const trips = (data.Items || []).map(item => {
+                    const trip = fromDynamo(item.payload ?? item);
+                    return { ...trip, device: trip.bike || device };
+                });
+                return new Response(JSON.stringify(trips), { headers: corsHeaders });
+            }
+
+            // Route: GET /api/zones - Geofence enter/exit/dwell events (evaluated on the gateway)
+            if (url.pathname === '/api/zones' && request.method === 'GET') {
+                const device = url.searchParams.get('device') || 'pi9';
+                const limit = Math.min(parseInt(url.searchParams.get('limit')) || 20, 500);
+
+                // Events are stored under their own partition key "<device>#zones"
+                const data = await queryDynamoDB(config, `${device}#zones`, limit);
+                const events = (data.Items || []).map(item => {
+                    const event = fromDynamo(item.payload ?? item);
+                    return { ...event, device: event.bike || device };
+                });
+                return new Response(JSON.stringify(events), { headers: corsHeaders });
             }
 
             // Route: POST /api/stolen - Report/clear theft
@@ -125,9 +165,14 @@ export default {
                 // Get last known GPS position for Discord notification
                 let gpsData = null;
                 try {
-                    const posData = await queryDynamoDB(config, device, MAX_SCAN);
-                    if (posData.Items && posData.Items.length > 0) {
-                        gpsData = findLatestValidPosition(posData.Items);
+                    const latest = await readLatestPosition(config, device);
+                    if (latest) {
+                        gpsData = isValidPosition(latest) ? latest : null;
+                    } else {
+                        const posData = await queryDynamoDB(config, device, MAX_SCAN);
+                        if (posData.Items && posData.Items.length > 0) {
+                            gpsData = findLatestValidPosition(posData.Items);
+                        }
                     }
                 } catch (err) {
                     console.error('Failed to fetch GPS data for Discord:', err);
@@ -218,14 +263,18 @@ export default {
             if (url.pathname === '/api/status' && request.method === 'GET') {
                 const device = url.searchParams.get('device') || 'pi9';
                 
-            const status = await env.BIKE_STATUS?.get(`stolen:${device}`);
-            if (status) {
-                const parsed = JSON.parse(status);
-                return new Response(JSON.stringify(parsed), { headers: corsHeaders });
+                const status = await env.BIKE_STATUS?.get(`stolen:${device}`);
+                const body = status ? JSON.stringify(JSON.parse(status)) : JSON.stringify({ stolen: false });
+
+                // Conditional GET: pollers send If-None-Match and get an empty 304 when unchanged
+                const etag = `"${(await sha256(body)).slice(0, 16)}"`;
+                const statusHeaders = { ...corsHeaders, 'ETag': etag, 'Cache-Control': 'no-cache' };
+                if (request.headers.get('If-None-Match') === etag) {
+                    return new Response(null, { status: 304, headers: statusHeaders });
+                }
+
+                return new Response(body, { headers: statusHeaders });
             }
-            
-            return new Response(JSON.stringify({ stolen: false }), { headers: corsHeaders });
-        }
 
             // Route: POST /api/job/stop - Stop running scripts
             if (url.pathname === '/api/job/stop' && request.method === 'POST') {
@@ -255,6 +304,95 @@ export default {
                 return new Response(JSON.stringify({ job_id: jobId }), { headers: corsHeaders });
             }
 
+            // Route: GET /api/desired - Pi agents fetch their desired service states
+            if (url.pathname === '/api/desired' && request.method === 'GET') {
+                const piId = url.searchParams.get('pi_id');
+                if (!piId) {
+                    return new Response(
+                        JSON.stringify({ error: 'Missing pi_id' }),
+                        { status: 400, headers: corsHeaders }
+                    );
+                }
+
+                const doc = await env.JOB_QUEUE?.get(`desired:${piId}`);
+                const body = doc || JSON.stringify({ services: {}, version: 0 });
+
+                // Conditional GET like /api/status: pollers sync every 30s, mostly 304
+                const etag = `"${(await sha256(body)).slice(0, 16)}"`;
+                const desiredHeaders = { ...corsHeaders, 'ETag': etag, 'Cache-Control': 'no-cache' };
+                if (request.headers.get('If-None-Match') === etag) {
+                    return new Response(null, { status: 304, headers: desiredHeaders });
+                }
+                return new Response(body, { headers: desiredHeaders });
+            }
+
+            // Route: POST /api/desired/report - Pi agents report the converged (actual) state
+            if (url.pathname === '/api/desired/report' && request.method === 'POST') {
+                const body = await request.json();
+                const { pi_id, version = 0, services = {}, converged = false, errors = {} } = body || {};
+                if (!pi_id) {
+                    return new Response(
+                        JSON.stringify({ error: 'Missing pi_id' }),
+                        { status: 400, headers: corsHeaders }
+                    );
+                }
+                await env.JOB_QUEUE?.put(`actual:${pi_id}`, JSON.stringify({
+                    version, services, converged, errors, reported_at: Date.now()
+                }));
+                return new Response(JSON.stringify({ ok: true }), { headers: corsHeaders });
+            }
+
+            // Route: GET /api/services - Desired and reported service states of a Pi (frontend)
+            if (url.pathname === '/api/services' && request.method === 'GET') {
+                const piId = url.searchParams.get('pi_id') || 'gateway';
+                const [desired, actual] = await Promise.all([
+                    env.JOB_QUEUE?.get(`desired:${piId}`),
+                    env.JOB_QUEUE?.get(`actual:${piId}`)
+                ]);
+                return new Response(JSON.stringify({
+                    desired: desired ? JSON.parse(desired) : { services: {}, version: 0 },
+                    actual: actual ? JSON.parse(actual) : null
+                }), { headers: corsHeaders });
+            }
+
+            // Route: POST /api/fleet/report - Gateway sends the aggregated Pi heartbeats
+            // Body: { gateway, ts, base, patch } - patch is a JSON merge patch against
+            // document `base` (null = full document); 409 asks for a full one
+            if (url.pathname === '/api/fleet/report' && request.method === 'POST') {
+                const { gateway, ts, base = null, patch = {} } = (await request.json()) || {};
+                if (!gateway) {
+                    return new Response(
+                        JSON.stringify({ error: 'Missing gateway' }),
+                        { status: 400, headers: corsHeaders }
+                    );
+                }
+                const raw = await env.JOB_QUEUE?.get(`fleet:${gateway}`);
+                const doc = raw ? JSON.parse(raw) : { seq: 0, fleet: {} };
+                if (base !== null && base !== doc.seq) {
+                    return new Response(
+                        JSON.stringify({ error: 'Base mismatch', seq: doc.seq }),
+                        { status: 409, headers: corsHeaders }
+                    );
+                }
+                const next = {
+                    seq: doc.seq + 1,
+                    updated: ts || Date.now(),
+                    fleet: base === null ? patch : mergePatch(doc.fleet, patch)
+                };
+                await env.JOB_QUEUE?.put(`fleet:${gateway}`, JSON.stringify(next));
+                return new Response(JSON.stringify({ seq: next.seq }), { headers: corsHeaders });
+            }
+
+            // Route: GET /api/fleet - Fleet health as last reported by the gateway (frontend)
+            if (url.pathname === '/api/fleet' && request.method === 'GET') {
+                const gateway = url.searchParams.get('gateway') || 'gateway';
+                const raw = await env.JOB_QUEUE?.get(`fleet:${gateway}`);
+                const doc = raw ? JSON.parse(raw) : { seq: 0, updated: null, fleet: {} };
+                return new Response(JSON.stringify({ gateway, updated: doc.updated, fleet: doc.fleet }), {
+                    headers: corsHeaders
+                });
+            }
+
             // Route: POST /api/job - Create job (Frontend button)
             if (url.pathname === '/api/job' && request.method === 'POST') {
                 if (!env.JOB_QUEUE) {
@@ -267,6 +405,13 @@ export default {
                 const body = await request.json();
                 const { type = 'gps_read', target = 'gateway', params = {} } = body || {};
 
+                // Start/stop jobs also change the Pi's desired state, so a lost job is healed
+                // by the agent's next desired-state sync
+                if (SERVICE_JOBS[type]) {
+                    const [unit, state] = SERVICE_JOBS[type];
+                    await setDesiredService(env, target, unit, state);
+                }
+
                 const jobId = crypto.randomUUID();
                 const job = {
                     job_id: jobId,
@@ -394,7 +539,92 @@ export default {
 };
 
 // Execute DynamoDB Query
-async function queryDynamoDB(config, device, limit) {
+// Job types that switch a systemd unit on a Pi -> [unit, desired state]
+const SERVICE_JOBS = {
+    start_gps_reader: ['gps-reader', 'active'],
+    stop_gps_reader: ['gps-reader', 'inactive'],
+    mqtt_forward: ['mqtt-forwarder', 'active'],
+    stop_mqtt_forward: ['mqtt-forwarder', 'inactive'],
+    start_light_module: ['bike-light', 'active'],
+    stop_light_module: ['bike-light', 'inactive']
+};
+
+// Desired-state document of a Pi: { services: { unit: 'active' | 'inactive' }, version, updated_at }
+async function setDesiredService(env, piId, unit, state) {
+    const raw = await env.JOB_QUEUE.get(`desired:${piId}`);
+    const doc = raw ? JSON.parse(raw) : { services: {}, version: 0 };
+    if (doc.services[unit] === state) return doc;
+    doc.services[unit] = state;
+    doc.version += 1;
+    doc.updated_at = Date.now();
+    await env.JOB_QUEUE.put(`desired:${piId}`, JSON.stringify(doc));
+    return doc;
+}
+
+// JSON merge patch (RFC 7386): objects are merged recursively, null removes a key
+function mergePatch(target, patch) {
+    if (patch === null || typeof patch !== 'object' || Array.isArray(patch)) return patch;
+    const result = (target && typeof target === 'object' && !Array.isArray(target)) ? { ...target } : {};
+    for (const [key, value] of Object.entries(patch)) {
+        if (value === null) delete result[key];
+        else result[key] = mergePatch(result[key], value);
+    }
+    return result;
+}
+
+const MAX_SCAN = 500; // number of recent records to scan for a valid fix (fallback path)
+const MAX_TRACK_PAGE = 1000; // items per /api/track page, older ones via X-Next-Cursor
+
+// Latest state as published by the gateway forwarder (sensors/<device>/gps/latest):
+// one item under partition "<device>#latest", overwritten in place. Its position
+// already has coords backfilled from the last valid fix. null if there is none.
+async function readLatestPosition(config, device) {
+    const data = await queryDynamoDB(config, `${device}#latest`, 1);
+    const item = data.Items?.[0];
+    if (!item) return null;
+    const position = fromDynamo(item.payload ?? item).position;
+    return position && Object.keys(position).length ? position : null;
+}
+
+// Fallback: newest entry, coords from the newest valid fix among the last MAX_SCAN items
+async function scanPosition(config, device) {
+    const data = await queryDynamoDB(config, device, MAX_SCAN);
+
+    if (!data.Items || data.Items.length === 0) {
+        return {};
+    }
+
+    // Parse newest entry (could be without fix/coords)
+    const latestEntry = parseItem(data.Items[0]);
+    // Fallback to newest valid position (with fix) for coords if available
+    const fallbackPosition = findLatestValidPosition(data.Items);
+
+    // Combine: prefer newest entry (even without fix), but backfill coords from last valid fix
+    return {
+        ...latestEntry,
+        ...(Number.isFinite(latestEntry.lat) && Number.isFinite(latestEntry.lon) ? {} : fallbackPosition),
+        last_update_ts: latestEntry?.ts || fallbackPosition?.ts
+    };
+}
+
+// Serve GET responses from the Cloudflare edge cache for a few seconds, so many
+// dashboards polling the same device cost one DynamoDB read per interval.
+// (The Cache API is a no-op on *.workers.dev; it takes effect on a custom domain.)
+async function edgeCached(request, ctx, ttlSeconds, produce) {
+    const cache = caches.default;
+    const key = new Request(request.url, { method: 'GET' });
+    const hit = await cache.match(key);
+    if (hit) return hit;
+
+    const response = await produce();
+    if (response.ok) {
+        response.headers.set('Cache-Control', `public, max-age=${ttlSeconds}`);
+        ctx.waitUntil(cache.put(key, response.clone()));
+    }
+    return response;
+}
+
+async function queryDynamoDB(config, device, limit, startKey) {
     const region = config.AWS_REGION || 'eu-central-1';
     const tableName = config.DYNAMODB_TABLE;
     
@@ -410,7 +640,8 @@ async function queryDynamoDB(config, device, limit) {
             ':dev': { S: device }
         },
         ScanIndexForward: false,
-        Limit: limit
+        Limit: limit,
+        ...(startKey ? { ExclusiveStartKey: startKey } : {})
     });
 
     // AWS Signature Version 4
@@ -531,6 +762,55 @@ function parseItem(item) {
     }
 }
 
+// Convert a DynamoDB attribute value ({N: '1'}, {L: [...]}, {M: {...}}) to plain JS
+function fromDynamo(value) {
+    if (value === null || typeof value !== 'object') return value;
+    if ('N' in value) return parseFloat(value.N);
+    if ('S' in value) return value.S;
+    if ('BOOL' in value) return value.BOOL;
+    if ('L' in value) return value.L.map(fromDynamo);
+    if ('M' in value) return Object.fromEntries(Object.entries(value.M).map(([k, v]) => [k, fromDynamo(v)]));
+    if (Array.isArray(value)) return value.map(fromDynamo);
+    return Object.fromEntries(Object.entries(value).map(([k, v]) => [k, fromDynamo(v)]));
+}
+
+// Decode a delta-encoded track (gateway/track_compress.py): fixed-point 1e-6 deg
+// coordinate deltas, delta-of-delta timestamps. Returns points oldest first.
+function decodeTrack(enc) {
+    const points = [];
+    let ts = 0, dt = 0, lat = 0, lon = 0;
+    for (let i = 0; i < enc.n; i++) {
+        if (i === 0) {
+            ts = enc.t[0];
+        } else {
+            dt += enc.t[i];
+            ts += dt;
+        }
+        lat += enc.lat[i];
+        lon += enc.lon[i];
+        points.push({
+            lat: lat / 1e6,
+            lon: lon / 1e6,
+            speed: (enc.spd?.[i] ?? 0) / 10,
+            course: 0,
+            fix: true,
+            ts: ts
+        });
+    }
+    return points;
+}
+
+// Parse one item into one or more points (newest first like the query result)
+function expandItem(item) {
+    const payload = fromDynamo(item.payload ?? {});
+    const enc = payload?.enc ?? fromDynamo(item.enc);
+    if (!enc) {
+        return [parseItem(item)];
+    }
+    const device = item.device?.S || item.device;
+    return decodeTrack(enc).map(p => ({ ...p, device })).reverse();
+}
+
 function isValidPosition(pos) {
     const hasFix = pos?.fix !== false; // reject explicit false; allow true/undefined
     const latOk = Number.isFinite(pos?.lat);
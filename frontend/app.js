@@ -101,10 +101,34 @@ function addHistoryMarker(lat, lon, timestamp) {
     historyMarkers.push(marker);
 }
 
+// Position and track reads: the gateway's local API (LOCAL_API_URL) when it is
+// set and answers, the Worker otherwise. An HTTPS page cannot fetch plain http
+// (mixed content), so the local API is only tried from an http page.
+function localApiUsable() {
+    return Boolean(CONFIG.LOCAL_API_URL) &&
+        !(location.protocol === 'https:' && CONFIG.LOCAL_API_URL.startsWith('http:'));
+}
+
+// Returns { res, base }; pass base to stay on the same API (cursor paging)
+async function fetchRead(path, base = null) {
+    if (base) return { res: await fetch(`${base}${path}`), base };
+    if (localApiUsable()) {
+        try {
+            const res = await fetch(`${CONFIG.LOCAL_API_URL}${path}`, {
+                signal: AbortSignal.timeout(CONFIG.LOCAL_API_TIMEOUT_MS)
+            });
+            if (res.ok) return { res, base: CONFIG.LOCAL_API_URL };
+        } catch (e) {
+            // Not on the gateway's LAN (or gateway down): use the Worker
+        }
+    }
+    return { res: await fetch(`${CONFIG.API_URL}${path}`), base: CONFIG.API_URL };
+}
+
 // Update position data
 async function updatePosition() {
     try {
-        const res = await fetch(`${CONFIG.API_URL}/api/position?device=${CONFIG.DEVICE_ID}`);
+        const { res } = await fetchRead(`/api/position?device=${CONFIG.DEVICE_ID}`);
         if (!res.ok) {
             throw new Error(`HTTP ${res.status}`);
         }
@@ -691,6 +715,94 @@ async function stopSystem() {
     }
 }
 
+// Profile a daemon or poller on one of the Pis (job type "profile", see daemon_profile.py)
+async function runProfile() {
+    const btn = document.getElementById('btnProfile');
+    const out = document.getElementById('profileOutput');
+    const [targetKey, process] = document.getElementById('profileTarget').value.split(':');
+    const target = CONFIG[targetKey];
+    const mode = document.getElementById('profileMode').value;
+    const seconds = CONFIG.PROFILE_SECONDS;
+
+    btn.disabled = true;
+    btn.textContent = `Profiling ${process}...`;
+    out.classList.remove('hidden');
+    out.textContent = '';
+    try {
+        const res = await fetch(`${CONFIG.API_URL}/api/job`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ type: 'profile', target, params: { target: process, mode, seconds } })
+        });
+        if (!res.ok) {
+            throw new Error(`HTTP ${res.status}`);
+        }
+        const { job_id } = await res.json();
+        // Poll interval of the Pi + profile duration + result upload
+        const result = await waitForJob(job_id, seconds + 30);
+        out.textContent = result.success ? formatProfile(result.output) : `Failed: ${result.message}`;
+    } catch (err) {
+        out.textContent = `Error: ${err.message}`;
+    } finally {
+        btn.disabled = false;
+        btn.textContent = 'Profile';
+    }
+}
+
+function formatProfile(output) {
+    if (typeof output === 'string') return output;
+    return Object.entries(output || {}).map(([pid, p]) => {
+        if (p.error) return `pid ${pid}: ${p.error}`;
+        const lines = [`pid ${pid}: ${p.mode} ${p.seconds}s, ${p.threads} threads`];
+        if (p.mode === 'cpu') {
+            lines.push(`${p.samples} samples, overhead ${p.overhead_pct}%`, 'self%  total%  function');
+            for (const f of p.top) {
+                lines.push(`${String(f.self_pct).padStart(5)}  ${String(f.total_pct).padStart(6)}  ${f.function}`);
+            }
+            lines.push('', 'folded stacks:', ...p.folded);
+        } else {
+            lines.push(`traced ${p.traced_kb} kB, peak ${p.peak_kb} kB`, 'growth kB  size kB  line');
+            for (const a of p.top) {
+                lines.push(`${String(a.growth_kb).padStart(9)}  ${String(a.size_kb).padStart(7)}  ${a.line}`);
+            }
+        }
+        return lines.join('\n');
+    }).join('\n\n');
+}
+
+// Fleet health: heartbeats of all Pis, aggregated by the gateway (see fleet_health.py)
+async function loadFleetHealth() {
+    const out = document.getElementById('fleetOutput');
+    try {
+        const res = await fetch(`${CONFIG.API_URL}/api/fleet?gateway=${encodeURIComponent(CONFIG.GATEWAY_TARGET)}`);
+        if (!res.ok) {
+            throw new Error(`HTTP ${res.status}`);
+        }
+        out.textContent = formatFleet(await res.json());
+    } catch (err) {
+        out.textContent = `Error: ${err.message}`;
+    }
+}
+
+function formatFleet({ updated, fleet }) {
+    if (!updated) return 'No report from the gateway yet';
+    const lines = [`Reported ${new Date(updated).toLocaleTimeString()}`];
+    for (const [pi, sources] of Object.entries(fleet || {})) {
+        lines.push('', pi);
+        for (const [source, h] of Object.entries(sources)) {
+            const status = h.online ? 'online' : `offline since ${new Date(h.seen).toLocaleTimeString()}`;
+            const fields = Object.entries(h)
+                .filter(([key]) => !['online', 'seen', 'services'].includes(key))
+                .map(([key, value]) => `${key}=${value}`);
+            lines.push(`  ${source}: ${status}  ${fields.join(' ')}`);
+            for (const [unit, u] of Object.entries(h.services || {})) {
+                lines.push(`    ${unit}: ${u.state}${u.rss_mb != null ? `, ${u.rss_mb} MB` : ''}`);
+            }
+        }
+    }
+    return lines.join('\n');
+}
+
 // Helper function: Wait for job completion
 async function waitForJob(jobId, timeoutSeconds = 30) {
     return new Promise((resolve) => {
@@ -778,18 +890,13 @@ function haversineDistance(lat1, lon1, lat2, lon2) {
 // Calculate trip statistics for the last 24 hours
 async function calculateTripStats() {
     try {
-        const limit = CONFIG.HISTORY_LIMIT || 500;
-        const res = await fetch(`${CONFIG.API_URL}/api/track?device=${CONFIG.DEVICE_ID}&limit=${limit}`);
-
-        if (!res.ok) {
+        if (await refreshTrackHistory() === null) {
             updateStatsUI(null);
             return;
         }
+        const data = trackHistory;
 
-        const dataRaw = await res.json();
-        const data = Array.isArray(dataRaw) ? dataRaw.map(normalizePoint) : [];
-
-        if (!Array.isArray(data) || data.length === 0) {
+        if (data.length === 0) {
             updateStatsUI(null);
             return;
         }
@@ -886,18 +993,50 @@ function ensureMarker(lat, lon, stolenFlag) {
     }
 }
 
+// ---- Track history (newest first), shared by the map and the trip stats ----
+// The first refresh loads HISTORY_LIMIT points; later ones only ask for points
+// newer than the newest one we have, in small pages (X-Next-Cursor for more).
+let trackHistory = [];
+let trackRefresh = null; // in-flight refresh, shared by concurrent callers
+
+function refreshTrackHistory() {
+    if (!trackRefresh) {
+        trackRefresh = fetchNewTrackPoints().finally(() => { trackRefresh = null; });
+    }
+    return trackRefresh;
+}
+
+// Returns the new points (possibly none), or null if the request failed
+async function fetchNewTrackPoints() {
+    const limit = CONFIG.HISTORY_LIMIT || 500;
+    const newestTs = trackHistory.length ? toMs(trackHistory[0].ts) : null;
+    const params = newestTs ? { since: newestTs, limit: CONFIG.TRACK_PAGE_SIZE } : { limit };
+
+    const fresh = [];
+    let cursor = null;
+    let base = null; // all pages from the API that served the first one
+    do {
+        const query = new URLSearchParams({ device: CONFIG.DEVICE_ID, ...params, ...(cursor ? { cursor } : {}) });
+        const read = await fetchRead(`/api/track?${query}`, base);
+        const res = read.res;
+        base = read.base;
+        if (!res.ok) return null; // keep what we have, retry everything next time
+        const page = await res.json();
+        if (Array.isArray(page)) fresh.push(...page.map(normalizePoint));
+        cursor = res.headers.get('X-Next-Cursor');
+    } while (cursor && fresh.length < limit);
+
+    trackHistory = (newestTs ? fresh.concat(trackHistory) : fresh).slice(0, limit);
+    return fresh;
+}
+
 // Load history
 async function loadHistory() {
     try {
-        const limit = CONFIG.HISTORY_LIMIT || 500;
-        const res = await fetch(`${CONFIG.API_URL}/api/track?device=${CONFIG.DEVICE_ID}&limit=${limit}`);
-
-        if (!res.ok) return;
+        await refreshTrackHistory();
+        const data = trackHistory;
 
-        const dataRaw = await res.json();
-        const data = Array.isArray(dataRaw) ? dataRaw.map(normalizePoint) : [];
-
-        if (!Array.isArray(data) || data.length === 0) return;
+        if (data.length === 0) return;
 
         // Remember newest point for UI (may be invalid)
         const latest = data[0];
@@ -999,7 +1138,7 @@ function startUpdateCountdown() {
 // Check if system is running based on fresh GPS data
 async function checkSystemStatus() {
     try {
-        const res = await fetch(`${CONFIG.API_URL}/api/position?device=${CONFIG.DEVICE_ID}`);
+        const { res } = await fetchRead(`/api/position?device=${CONFIG.DEVICE_ID}`);
         if (!res.ok) return;
 
         const data = await res.json();
@@ -1049,6 +1188,11 @@ document.addEventListener('DOMContentLoaded', async () => {
         calculateTripStats(); // Update trip stats on each interval
         startUpdateCountdown(); // Restart countdown on each update
     }, CONFIG.UPDATE_INTERVAL);
+
+    // Fleet health only while its panel is open
+    setInterval(() => {
+        if (document.getElementById('fleetPanel').open) loadFleetHealth();
+    }, CONFIG.FLEET_REFRESH_MS);
 });
 
 // Normalize coordinates/numbers from API
@@ -8,6 +8,13 @@ const CONFIG = {
     // API_URL: 'https://bike-api.your-account.workers.dev'
     API_URL: 'https://bike-api.dyntech.workers.dev',
 
+    // Optional gateway local API for /api/position and /api/track on the LAN
+    // (see setup/gateway.md, "Local API"), e.g. 'http://<gateway-ip>:8080'.
+    // Everything else uses API_URL; so do position/track when the gateway does
+    // not answer, and always when the page itself is served over HTTPS.
+    LOCAL_API_URL: '',
+    LOCAL_API_TIMEOUT_MS: 2000,
+
     // Device ID (as stored in DynamoDB)
     DEVICE_ID: 'pi9',
 
@@ -30,6 +37,9 @@ const CONFIG = {
     // How many history points to load (for last fix)
     HISTORY_LIMIT: 500,
 
+    // Page size for incremental track refreshes (only points newer than the last one)
+    TRACK_PAGE_SIZE: 50,
+
     // Staleness checks for online/GPS status
     STALE_UPDATE_MS: 60_000, // How old can the last signal be to be considered online
     STALE_FIX_MS: 120_000,   // How old can the last GPS fix be
@@ -38,5 +48,11 @@ const CONFIG = {
     JOB_STATUS_POLL_MS: 2000,
     GATEWAY_TARGET: 'gateway',
     GPS_PI_TARGET: 'pi9',
-    LIGHT_TARGET: 'lightpi' // rear light controller Pi
+    LIGHT_TARGET: 'lightpi', // rear light controller Pi
+
+    // Duration of a "profile" job (Diagnostics panel), max 120 s on the Pi
+    PROFILE_SECONDS: 10,
+
+    // Fleet health panel refresh (the gateway reports once a minute)
+    FLEET_REFRESH_MS: 60_000
 };
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+AWS IoT Connection Manager for Gateway
+Keeps one paho client connected to AWS IoT Core for the life of the process.
+
+- Connects asynchronously; paho's network thread reconnects with exponential
+  backoff (RECONNECT_MIN_SEC .. RECONNECT_MAX_SEC) after a drop
+- MQTT v5 persistent session (clean_start=False, SESSION_EXPIRY_SEC):
+  unacknowledged QoS 1 publishes are kept by the client and re-sent after
+  a reconnect
+- device/ts are sent as v5 user properties, so IoT rules can route on them
+  without parsing the JSON body
+- Bounded in-flight window and offline queue for QoS 1
+- Certificates are loaded once into one SSLContext; the TLS session of the
+  last connection is offered on reconnect (session resumption), so a
+  reconnect skips the full certificate handshake when the broker allows it
+- health() reports connection state for the rest of the forwarder
+"""
+
+import logging
+import ssl
+import threading
+import time
+
+from paho.mqtt import client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+log = logging.getLogger(__name__)
+
+RECONNECT_MIN_SEC = 1
+RECONNECT_MAX_SEC = 120
+MAX_INFLIGHT = 20  # QoS 1 messages awaiting PUBACK
+MAX_QUEUED = 2000  # QoS 1 messages kept while offline (publish fails beyond)
+KEEPALIVE_SEC = 60
+SESSION_EXPIRY_SEC = 3600  # broker keeps the session this long after a disconnect
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """SSLContext that offers the previous TLS session on every new socket"""
+
+    session = None
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        if self.session is not None and kwargs.get("session") is None:
+            kwargs["session"] = self.session
+        return super().wrap_socket(sock, *args, **kwargs)
+
+
+class AwsConnection:
+    """paho client for AWS IoT with reconnect backoff, persistent session and health state"""
+
+    def __init__(self, endpoint, port, client_id, ca_path, cert_path, key_path):
+        self.endpoint = endpoint
+        self.port = port
+        self._connected = threading.Event()
+        self._lock = threading.Lock()
+        self._state = {
+            "connected": False,
+            "since": None,  # time of the last connect/disconnect
+            "connects": 0,
+            "disconnects": 0,
+            "session_resumed": False,  # TLS session reused on the last connect
+            "last_error": None,
+        }
+
+        self.ssl_context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        self.ssl_context.load_verify_locations(cafile=ca_path)
+        self.ssl_context.load_cert_chain(certfile=cert_path, keyfile=key_path)
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, protocol=mqtt.MQTTv5)
+        self.client.tls_set_context(self.ssl_context)
+        self.client.reconnect_delay_set(min_delay=RECONNECT_MIN_SEC, max_delay=RECONNECT_MAX_SEC)
+        self.client.max_inflight_messages_set(MAX_INFLIGHT)
+        self.client.max_queued_messages_set(MAX_QUEUED)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_connect_fail = self._on_connect_fail
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            self._update(last_error=f"connect refused: {reason_code}")
+            log.warning("AWS connect refused: %s", reason_code)
+            return
+        sock = client.socket()
+        resumed = bool(getattr(sock, "session_reused", False))
+        session = getattr(sock, "session", None)
+        if session is not None:
+            self.ssl_context.session = session
+        with self._lock:
+            self._state.update(connected=True, since=time.time(), session_resumed=resumed)
+            self._state["connects"] += 1
+        self._connected.set()
+        log.info("Connected to AWS (TLS session resumed: %s, MQTT session present: %s)",
+                 resumed, flags.session_present)
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self._connected.clear()
+        with self._lock:
+            self._state.update(connected=False, since=time.time())
+            self._state["disconnects"] += 1
+            if reason_code.is_failure:
+                self._state["last_error"] = f"connection lost: {reason_code}"
+        if reason_code.is_failure:
+            log.warning("AWS connection lost (%s), reconnecting", reason_code)
+
+    def _on_connect_fail(self, client, userdata):
+        self._update(last_error="connect failed (network/TLS)")
+
+    def _update(self, **fields):
+        with self._lock:
+            self._state.update(fields)
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def wait_connected(self, timeout=None):
+        return self._connected.wait(timeout)
+
+    def health(self):
+        with self._lock:
+            return dict(self._state)
+
+    def publish(self, topic, payload, qos=1, device=None, ts=None):
+        """Publish; QoS 1 messages are queued by paho while disconnected"""
+        properties = None
+        if device is not None:
+            properties = Properties(PacketTypes.PUBLISH)
+            properties.UserProperty = [("device", str(device))] + ([("ts", str(ts))] if ts is not None else [])
+        info = self.client.publish(topic, payload, qos=qos, properties=properties)
+        if info.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+            log.warning("AWS publish to %s failed: %s", topic, mqtt.error_string(info.rc))
+        return info
+
+    def start(self):
+        """Start connecting in the background (never raises on network errors)"""
+        properties = Properties(PacketTypes.CONNECT)
+        properties.SessionExpiryInterval = SESSION_EXPIRY_SEC
+        self.client.connect_async(self.endpoint, self.port, keepalive=KEEPALIVE_SEC,
+                                  clean_start=False, properties=properties)
+        self.client.loop_start()
+
+    def stop(self):
+        self.client.disconnect()
+        self.client.loop_stop()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Device Shadows for Gateway
+Desired/reported state per device with AWS IoT Device Shadow semantics,
+kept on the gateway and synced over the local broker.
+
+Local topics (per device):
+  bike/<device>/shadow/update  Pi -> gateway  {"state": {"reported": {...}}}
+  bike/<device>/shadow/delta   gateway -> Pi  retained {"state": {...}, "version": n}
+                               desired keys whose value differs from reported
+                               ({} when the device is in sync)
+
+- Desired state is set by the gateway (e.g. stolen from the status relay),
+  reported state by the Pi (lockmode from the button, acknowledged stolen)
+- Nothing is polled: a delta is published when desired or reported changes
+- Only changed keys are sent to AWS ($aws/things/<device>/shadow/update);
+  without an uplink callable the class is a purely local stand-in (tests, dev box)
+- Documents persist in shadows.json so deltas survive a forwarder restart
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+SHADOW_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shadows.json")
+UPDATE_TOPIC = "bike/+/shadow/update"
+
+
+def delta_topic(device):
+    return f"bike/{device}/shadow/delta"
+
+
+def aws_update_topic(device):
+    return f"$aws/things/{device}/shadow/update"
+
+
+class DeviceShadows:
+    """Desired/reported documents for all devices of this gateway"""
+
+    def __init__(self, local_client, uplink=None, path=SHADOW_PATH, owns=None):
+        self.client = local_client
+        self.uplink = uplink  # Optional callable(topic, payload, device)
+        self.owns = owns  # Optional callable(device) -> bool (multi-worker forwarder)
+        self.path = path
+        self._docs = {}  # device -> {"desired": {}, "reported": {}, "version": n, "updated": ts}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer of the file at a time (relay and MQTT threads)
+        self._load()
+
+    # ---- Documents ----
+    def _doc(self, device):
+        return self._docs.setdefault(device, {"desired": {}, "reported": {}, "version": 0, "updated": 0})
+
+    def get(self, device):
+        with self._lock:
+            return json.loads(json.dumps(self._doc(device)))
+
+    def reported(self, device, key, default=None):
+        with self._lock:
+            return self._docs.get(device, {}).get("reported", {}).get(key, default)
+
+    @staticmethod
+    def delta(doc):
+        return {k: v for k, v in doc["desired"].items() if doc["reported"].get(k) != v}
+
+    def _merge(self, device, section, state):
+        """Apply state to desired/reported; returns the keys that changed"""
+        with self._lock:
+            doc = self._doc(device)
+            changed = {k: v for k, v in state.items() if doc[section].get(k) != v}
+            if not changed:
+                return {}, None
+            doc[section].update(changed)
+            doc["version"] += 1
+            doc["updated"] = int(time.time() * 1000)
+            snapshot = json.loads(json.dumps(doc))
+        self._save()
+        return changed, snapshot
+
+    def set_desired(self, device, **state):
+        """Gateway-side change request, e.g. set_desired("pi9", stolen=True)"""
+        changed, doc = self._merge(device, "desired", state)
+        if changed:
+            log.info("Shadow %s: desired %s", device, changed)
+            self._publish_delta(device, doc)
+            self._uplink(device, "desired", changed)
+
+    def set_reported(self, device, **state):
+        changed, doc = self._merge(device, "reported", state)
+        if changed:
+            log.info("Shadow %s: reported %s", device, changed)
+            self._publish_delta(device, doc)
+            self._uplink(device, "reported", changed)
+        return changed
+
+    # ---- Sync ----
+    def _publish_delta(self, device, doc):
+        payload = {"state": self.delta(doc), "version": doc["version"]}
+        self.client.publish(delta_topic(device), json.dumps(payload), qos=1, retain=True)
+
+    def _uplink(self, device, section, changed):
+        if self.uplink:
+            payload = {"state": {section: changed}}
+            self.uplink(aws_update_topic(device), json.dumps(payload), device)
+
+    def attach(self, client):
+        """Route shadow updates of the local client here (subscribe() from on_connect)"""
+        client.message_callback_add(UPDATE_TOPIC, self.on_update)
+
+    def subscribe(self, client):
+        client.subscribe(UPDATE_TOPIC, qos=1)
+
+    def on_update(self, client, userdata, msg):
+        device = msg.topic.split("/")[1]
+        if self.owns and not self.owns(device):
+            return
+        try:
+            reported = json.loads(msg.payload.decode())["state"]["reported"]
+            if not isinstance(reported, dict):
+                raise ValueError("reported must be an object")
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning("Invalid shadow update from %s: %s", device, e)
+            return
+        self.set_reported(device, **reported)
+
+    def publish_all(self):
+        """Re-publish retained deltas (after a broker restart lost them)"""
+        with self._lock:
+            docs = {d: json.loads(json.dumps(doc)) for d, doc in self._docs.items()}
+        for device, doc in docs.items():
+            self._publish_delta(device, doc)
+
+    # ---- Persistence ----
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                self._docs = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring unreadable shadow file: %s", e)
+
+    def _save(self):
+        # Serialize inside the save lock: a later snapshot is always written after an older one
+        with self._save_lock:
+            with self._lock:
+                data = json.dumps(self._docs)
+            tmp = self.path + ".tmp"
+            try:
+                with open(tmp, "w") as f:
+                    f.write(data)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                log.warning("Shadow file write failed: %s", e)
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Minimal MQTT broker for dev boxes and the soak rig
+Just enough of MQTT 3.1.1 and 5 for the gateway stack: CONNECT, PUBLISH
+(QoS 0/1/2), SUBSCRIBE/UNSUBSCRIBE with + and # wildcards, retained
+messages, PING, DISCONNECT, v5 properties and topic aliases from clients.
+
+- No persistence, no sessions (session present is always 0), no wills,
+  no authentication: a broker restart loses everything, like a mosquitto
+  without persistence
+- Optional TLS with client certificates (stand-in for AWS IoT Core)
+- Hooks for tests: on_connect(client_id), on_subscribe(client_id, filters),
+  on_publish(client_id, topic, payload)
+- Faults: drop_clients() cuts every connection, stop()/start() restarts the
+  listener on the same port
+
+Usage:
+  python3 mini_broker.py --port 1883
+"""
+
+import argparse
+import socket
+import ssl
+import struct
+import sys
+import threading
+import time
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+TOPIC_ALIAS = 0x23
+SUBSCRIPTION_ID = 0x0B
+# v5 property id -> value type (b=byte, h=2-byte int, i=4-byte int, v=varint, s=string, p=string pair)
+PROPERTY_TYPES = {
+    0x01: "b", 0x02: "i", 0x03: "s", 0x08: "s", 0x09: "s", 0x0B: "v", 0x11: "i", 0x12: "s",
+    0x13: "h", 0x15: "s", 0x16: "s", 0x17: "b", 0x18: "i", 0x19: "b", 0x1A: "s", 0x1C: "s",
+    0x1F: "s", 0x21: "h", 0x22: "h", 0x23: "h", 0x24: "b", 0x25: "b", 0x26: "p", 0x27: "i",
+    0x28: "b", 0x29: "b", 0x2A: "b",
+}
+
+
+# ---- Encoding helpers ----
+def encode_varint(value):
+    out = bytearray()
+    while True:
+        byte, value = value % 128, value // 128
+        out.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(out)
+
+
+def encode_str(text):
+    data = text.encode() if isinstance(text, str) else text
+    return struct.pack("!H", len(data)) + data
+
+
+def packet(ptype, body, flags=0):
+    return bytes([ptype << 4 | flags]) + encode_varint(len(body)) + body
+
+
+class Reader:
+    """Cursor over a packet body"""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def byte(self):
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def u16(self):
+        self.pos += 2
+        return struct.unpack_from("!H", self.data, self.pos - 2)[0]
+
+    def u32(self):
+        self.pos += 4
+        return struct.unpack_from("!I", self.data, self.pos - 4)[0]
+
+    def varint(self):
+        value, shift = 0, 0
+        while True:
+            byte = self.byte()
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value
+
+    def binary(self):
+        length = self.u16()
+        self.pos += length
+        return self.data[self.pos - length:self.pos]
+
+    def string(self):
+        return self.binary().decode()
+
+    def rest(self):
+        return self.data[self.pos:]
+
+    def properties(self):
+        """Returns ({id: value}, [(id, raw bytes)]) of a v5 property block"""
+        end = self.varint()
+        end += self.pos
+        values, raw = {}, []
+        while self.pos < end:
+            start = self.pos
+            pid = self.varint()
+            kind = PROPERTY_TYPES.get(pid)
+            if kind == "b":
+                value = self.byte()
+            elif kind == "h":
+                value = self.u16()
+            elif kind == "i":
+                value = self.u32()
+            elif kind == "v":
+                value = self.varint()
+            elif kind == "s":
+                value = self.binary()
+            elif kind == "p":
+                value = (self.string(), self.string())
+            else:
+                raise ValueError(f"unknown property 0x{pid:02x}")
+            values[pid] = value
+            raw.append((pid, self.data[start:self.pos]))
+        return values, raw
+
+
+def topic_matches(pattern, topic):
+    if topic.startswith("$") and pattern[:1] in ("+", "#"):
+        return False
+    parts, levels = pattern.split("/"), topic.split("/")
+    for i, part in enumerate(parts):
+        if part == "#":
+            return True
+        if i >= len(levels) or (part != "+" and part != levels[i]):
+            return False
+    return len(parts) == len(levels)
+
+
+class Session:
+    """One client connection (reader thread + locked writes)"""
+
+    def __init__(self, broker, sock, address):
+        self.broker = broker
+        self.sock = sock
+        self.address = address
+        self.client_id = None
+        self.version = 4
+        self.subscriptions = {}  # filter -> max QoS
+        self.aliases = {}  # topic alias -> topic (client to broker)
+        self._next_id = 0
+        self._write_lock = threading.Lock()
+        self.closed = False
+
+    def send(self, data):
+        try:
+            with self._write_lock:
+                self.sock.sendall(data)
+        except OSError:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def packet_id(self):
+        self._next_id = self._next_id % 65535 + 1
+        return self._next_id
+
+    def _recv_exact(self, count):
+        data = bytearray()
+        while len(data) < count:
+            chunk = self.sock.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError("closed")
+            data += chunk
+        return bytes(data)
+
+    def read_packet(self):
+        header = self._recv_exact(1)[0]
+        length, shift = 0, 0
+        while True:
+            byte = self._recv_exact(1)[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header >> 4, header & 0x0F, self._recv_exact(length) if length else b""
+
+    def run(self):
+        try:
+            if isinstance(self.sock, ssl.SSLSocket):
+                self.sock.do_handshake()
+            while not self.closed:
+                ptype, flags, body = self.read_packet()
+                if not self.handle(ptype, flags, Reader(body)):
+                    break
+        except (OSError, ConnectionError, ValueError, IndexError, struct.error):
+            pass
+        finally:
+            self.close()
+            self.broker._remove(self)
+
+    # ---- Packet handling ----
+    def handle(self, ptype, flags, r):
+        v5 = self.version == 5
+        if ptype == CONNECT:
+            r.string()  # protocol name
+            self.version = r.byte()
+            v5 = self.version == 5
+            connect_flags = r.byte()
+            r.u16()  # keepalive (not enforced)
+            if v5:
+                r.properties()
+            self.client_id = r.string() or f"auto-{id(self):x}"
+            if connect_flags & 0x04:  # will
+                if v5:
+                    r.properties()
+                r.binary()
+                r.binary()
+            self.send(packet(CONNACK, b"\x00\x00" + (b"\x00" if v5 else b"")))
+            self.broker._connected(self)
+        elif ptype == PUBLISH:
+            qos, retain = (flags >> 1) & 3, flags & 1
+            topic = r.string()
+            pid = r.u16() if qos else None
+            raw_props = []
+            if v5:
+                props, raw_props = r.properties()
+                alias = props.get(TOPIC_ALIAS)
+                if alias:
+                    if topic:
+                        self.aliases[alias] = topic
+                    else:
+                        topic = self.aliases.get(alias, "")
+                raw_props = [raw for pid_, raw in raw_props if pid_ not in (TOPIC_ALIAS, SUBSCRIPTION_ID)]
+            payload = r.rest()
+            if qos == 1:
+                self.send(packet(PUBACK, struct.pack("!H", pid)))
+            elif qos == 2:
+                self.send(packet(PUBREC, struct.pack("!H", pid)))
+            if topic:
+                self.broker.publish(self, topic, payload, qos, retain, b"".join(raw_props))
+        elif ptype == PUBREL:
+            self.send(packet(PUBCOMP, struct.pack("!H", r.u16())))
+        elif ptype == SUBSCRIBE:
+            pid = r.u16()
+            if v5:
+                r.properties()
+            patterns = []
+            while r.pos < len(r.data):
+                pattern, options = r.string(), r.byte()
+                self.subscriptions[pattern] = min(options & 3, 1)
+                patterns.append(pattern)
+            granted = bytes(self.subscriptions[p] for p in patterns)
+            self.send(packet(SUBACK, struct.pack("!H", pid) + (b"\x00" if v5 else b"") + granted))
+            self.broker._subscribed(self, patterns)
+            self.broker.send_retained(self, patterns)
+        elif ptype == UNSUBSCRIBE:
+            pid = r.u16()
+            if v5:
+                r.properties()
+            count = 0
+            while r.pos < len(r.data):
+                self.subscriptions.pop(r.string(), None)
+                count += 1
+            self.send(packet(UNSUBACK, struct.pack("!H", pid) + (b"\x00" + b"\x00" * count if v5 else b"")))
+        elif ptype == PINGREQ:
+            self.send(packet(PINGRESP, b""))
+        elif ptype == DISCONNECT:
+            return False
+        # PUBACK/PUBREC/PUBCOMP from clients: deliveries are fire-and-forget here
+        return True
+
+    def deliver(self, topic, payload, qos, retain, props):
+        qos = min(qos, max((q for p, q in self.subscriptions.items() if topic_matches(p, topic)), default=-1))
+        if qos < 0:
+            return False
+        body = encode_str(topic)
+        if qos:
+            body += struct.pack("!H", self.packet_id())
+        if self.version == 5:
+            body += encode_varint(len(props)) + props
+        self.send(packet(PUBLISH, body + payload, qos << 1 | retain))
+        return True
+
+
+class MiniBroker:
+    """Threaded MQTT broker on host:port (TLS when an SSLContext is given)"""
+
+    def __init__(self, host="127.0.0.1", port=1883, ssl_context=None):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.on_connect = None  # Optional callback(client_id)
+        self.on_subscribe = None  # Optional callback(client_id, filters)
+        self.on_publish = None  # Optional callback(client_id, topic, payload)
+        self.retained = {}  # topic -> (payload, qos, props)
+        self.stats = {"connects": 0, "received": 0, "delivered": 0}
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    # ---- Lifecycle ----
+    def start(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self.host, self.port))
+        server.listen(64)
+        self.port = server.getsockname()[1]
+        self._server = server
+        self._thread = threading.Thread(target=self._accept, args=(server,), name=f"broker-{self.port}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Close the listener and every connection; retained messages are lost"""
+        if self._server:
+            try:
+                self._server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._server.close()
+            self._server = None
+        self.drop_clients()
+        with self._lock:
+            self.retained.clear()
+
+    def drop_clients(self):
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            session.close()
+
+    @property
+    def clients(self):
+        with self._lock:
+            return sorted(s.client_id for s in self._sessions if s.client_id)
+
+    def _accept(self, server):
+        while True:
+            try:
+                sock, address = server.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.ssl_context:
+                sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+            session = Session(self, sock, address)
+            with self._lock:
+                self._sessions.add(session)
+            threading.Thread(target=session.run, name="broker-session", daemon=True).start()
+
+    # ---- Routing ----
+    def _connected(self, session):
+        with self._lock:
+            # Same client ID connects again: the old connection is closed (MQTT rule)
+            old = [s for s in self._sessions if s is not session and s.client_id == session.client_id]
+            self.stats["connects"] += 1
+        for s in old:
+            s.close()
+        if self.on_connect:
+            self.on_connect(session.client_id)
+
+    def _subscribed(self, session, filters):
+        if self.on_subscribe:
+            self.on_subscribe(session.client_id, filters)
+
+    def _remove(self, session):
+        with self._lock:
+            self._sessions.discard(session)
+
+    def publish(self, sender, topic, payload, qos=0, retain=False, props=b""):
+        with self._lock:
+            self.stats["received"] += 1
+            if retain:
+                if payload:
+                    self.retained[topic] = (payload, qos, props)
+                else:
+                    self.retained.pop(topic, None)
+            sessions = list(self._sessions)
+        if self.on_publish:
+            self.on_publish(sender.client_id if sender else None, topic, payload)
+        delivered = sum(1 for session in sessions if session.deliver(topic, payload, qos, 0, props))
+        with self._lock:
+            self.stats["delivered"] += delivered
+
+    def send_retained(self, session, filters):
+        with self._lock:
+            retained = list(self.retained.items())
+        for topic, (payload, qos, props) in retained:
+            if any(topic_matches(f, topic) for f in filters):
+                session.deliver(topic, payload, qos, 1, props)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimal MQTT 3.1.1/5 broker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+    broker = MiniBroker(args.host, args.port)
+    broker.start()
+    print(f"Broker listening on {args.host}:{broker.port}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        broker.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,731 @@
+#!/usr/bin/env python3
+"""
+Soak and fault-injection rig for the gateway stack (dev box, no hardware)
+Runs mqtt_forwarder.py and the job pollers for hours or days against local
+stand-ins, injects faults on a schedule and reports how the daemons cope.
+
+Stand-ins (all in this process):
+- local broker (mini_broker.py) on a free port, fed by a load generator:
+  1 Hz fixes per simulated bike on gateway/<device>/gps and numbered lock
+  events on gateway/<device>/lock (unthrottled, used to count message loss)
+- fake AWS IoT endpoint: mini_broker with TLS and client certificates
+  (throwaway CA made with the openssl CLI), records what arrives
+- fake backend: /api/job/poll, /api/job/result and /api/status; hands out a
+  harmless unknown job now and then so the result path runs too. Desired
+  service state is always empty and fleet reports are only counted
+
+The daemons run unmodified from copies in the work directory; only their
+endpoint constants (broker port, AWS endpoint/certs, API URL, stop file,
+local API port) are pointed at the stand-ins.
+
+Faults (cycled every --fault-every, each lasting --fault-duration):
+  broker_restart  local broker down (retained messages lost), then back
+  aws_drop        every TLS connection to the IoT endpoint cut at once
+  aws_outage      IoT endpoint not listening
+  backend_500     backend answers 500
+  backend_hang    backend answers after the clients' timeout
+
+Recorded: reconnect time per fault, time to the first delivery after it,
+lock events lost or delivered late, and per process RSS, CPU, threads and
+open fds every --sample-sec (RSS growth as a linear trend after warm-up).
+Bike IDs rotate every --churn-sec, so per-device state that is never
+released shows up as memory growth.
+
+Usage:
+  python3 soak.py --duration 10m --fault-every 2m       # quick check
+  python3 soak.py --duration 48h --devices 20           # overnight / weekend run
+  python3 soak.py --faults aws_outage,backend_500 --workers 2
+
+Output: summary on stdout, full report (incl. samples) as soak_report.json
+and daemon logs in the work directory.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import shutil
+import signal
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from paho.mqtt import client as mqtt
+
+from mini_broker import MiniBroker
+
+REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FAULTS = ["broker_restart", "aws_drop", "aws_outage", "backend_500", "backend_hang"]
+BACKEND_TIMEOUT_SEC = 12  # longer than the 10 s request timeout of pollers and status relay
+JOB_EVERY_N_POLLS = 20  # one no-op job per this many polls
+DRAIN_SEC = 15  # wait for in-flight messages after the load stops
+STARTUP_TIMEOUT_SEC = 30
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+def parse_duration(text):
+    """'90', '90s', '15m', '48h' -> seconds"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smh]?)", text.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid duration: {text}")
+    return float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ---- Certificates (throwaway CA for the fake IoT endpoint) ----
+def make_certs(directory):
+    def openssl(*args):
+        subprocess.run(["openssl", *args], cwd=directory, check=True, capture_output=True)
+
+    key = ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1", "-nodes"]
+    openssl("req", "-x509", *key, "-keyout", "ca.key", "-out", "ca.crt", "-days", "30", "-subj", "/CN=soak-ca")
+    with open(os.path.join(directory, "san.ext"), "w") as f:
+        f.write("subjectAltName=DNS:localhost,IP:127.0.0.1\n")
+    for name, extra in (("server", ["-extfile", "san.ext"]), ("client", [])):
+        openssl("req", *key, "-keyout", f"{name}.key", "-out", f"{name}.csr", "-subj", f"/CN=soak-{name}")
+        openssl("x509", "-req", "-in", f"{name}.csr", "-CA", "ca.crt", "-CAkey", "ca.key", "-CAcreateserial",
+                "-out", f"{name}.crt", "-days", "30", *extra)
+    return {name: os.path.join(directory, name) for name in
+            ("ca.crt", "server.crt", "server.key", "client.crt", "client.key")}
+
+
+def server_context(certs):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certs["server.crt"], certs["server.key"])
+    context.load_verify_locations(certs["ca.crt"])
+    context.verify_mode = ssl.CERT_REQUIRED
+    return context
+
+
+# ---- Deployment of the daemons into the work directory ----
+def rewrite_constants(path, values):
+    """Replace top-level NAME = ... assignments; fails loudly if one is missing"""
+    with open(path) as f:
+        text = f.read()
+    for name, value in values.items():
+        text, count = re.subn(rf"^{name} = .*$", lambda m: f"{name} = {value!r}", text, count=1, flags=re.M)
+        if not count:
+            raise SystemExit(f"{path}: constant {name} not found, update soak.py")
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def deploy(workdir, pollers, ports, certs, backend_url, args):
+    gateway = os.path.join(workdir, "gateway")
+    shutil.copytree(os.path.join(REPO, "gateway"), gateway,
+                    ignore=shutil.ignore_patterns("devtools", "__pycache__", "*.db*", "*.json"))
+    rewrite_constants(os.path.join(gateway, "mqtt_forwarder.py"), {
+        "LOCAL_PORT": ports["local"],
+        "AWS_ENDPOINT": "localhost",
+        "AWS_PORT": ports["iot"],
+        "CA_PATH": certs["ca.crt"],
+        "CERT_PATH": certs["client.crt"],
+        "KEY_PATH": certs["client.key"],
+    })
+    rewrite_constants(os.path.join(gateway, "status_relay.py"), {"API_URL": backend_url})
+    rewrite_constants(os.path.join(gateway, "local_api.py"), {"API_HOST": "127.0.0.1", "API_PORT": ports["api"]})
+    with open(os.path.join(gateway, "forwarder_config.json"), "w") as f:
+        json.dump({
+            "status_devices": [f"soak-0-{i}" for i in range(min(args.devices, 3))],
+            "discord_webhook_url": "https://127.0.0.1:9/soak",  # never reaches Discord
+        }, f, indent=2)
+
+    for name in pollers:
+        directory = gateway if name == "gateway" else os.path.join(workdir, name)
+        if name != "gateway":
+            os.makedirs(directory)
+            for file in ("job_poller.py", "daemon_log.py", "daemon_profile.py", "service_state.py", "heartbeat.py"):
+                shutil.copy(os.path.join(REPO, name, file), directory)
+        rewrite_constants(os.path.join(directory, "job_poller.py"), {
+            "API_URL": backend_url,
+            "STOP_FILE": os.path.join(workdir, f"stop_{name}"),
+            "BROKER_HOST": "127.0.0.1",
+            "BROKER_PORT": ports["local"],
+        })
+    return gateway
+
+
+# ---- Fake backend ----
+class FakeBackend:
+    """Job and status API with switchable faults; records every request"""
+
+    def __init__(self):
+        self.fault = None  # None, "500" or "hang"
+        self.requests = []  # (time, client, http status)
+        self.polls = 0
+        self.results = 0
+        self.fleet_reports = 0
+        self._lock = threading.Lock()
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                backend.handle(self)
+
+            def do_POST(self):
+                backend.handle(self)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def handle(self, request):
+        path, _, query = request.path.partition("?")
+        params = dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+        client = params.get("pi_id") or {"/api/status": "status_relay", "/api/job/result": "job_result",
+                                          "/api/fleet/report": "fleet_health"}.get(path, "?")
+        length = int(request.headers.get("Content-Length") or 0)
+        if length:
+            request.rfile.read(length)
+
+        fault = self.fault
+        if fault == "hang":
+            time.sleep(BACKEND_TIMEOUT_SEC)
+        if fault == "500":
+            status, body = 500, {"error": "injected"}
+        elif path == "/api/job/poll":
+            with self._lock:
+                self.polls += 1
+                job = None
+                if self.polls % JOB_EVERY_N_POLLS == 0:
+                    job = {"job_id": f"soak-{self.polls}", "type": "soak_noop", "params": {}}
+            status, body = 200, {"job": job}
+        elif path == "/api/job/result":
+            with self._lock:
+                self.results += 1
+            status, body = 200, {"ok": True}
+        elif path == "/api/desired":
+            status, body = 200, {"services": {}, "version": 0}
+        elif path == "/api/desired/report":
+            status, body = 200, {"ok": True}
+        elif path == "/api/fleet/report":
+            with self._lock:
+                self.fleet_reports += 1
+                status, body = 200, {"seq": self.fleet_reports}
+        elif path == "/api/status":
+            if request.headers.get("If-None-Match") == '"soak"':
+                status, body = 304, None
+            else:
+                status, body = 200, {"device": params.get("device"), "stolen": False}
+        else:
+            status, body = 404, {"error": "not found"}
+
+        with self._lock:
+            self.requests.append((time.time(), client, status))
+        data = json.dumps(body).encode() if body is not None else b""
+        try:
+            request.send_response(status)
+            request.send_header("Content-Type", "application/json")
+            request.send_header("ETag", '"soak"')
+            request.send_header("Content-Length", str(len(data)))
+            request.end_headers()
+            request.wfile.write(data)
+        except OSError:
+            pass  # client gave up (hang fault)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-backend", daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+# ---- Load generator ----
+class LoadGenerator:
+    """Simulated bikes: 1 Hz fixes per device plus numbered lock events"""
+
+    def __init__(self, port, devices, events_per_sec, churn_sec):
+        self.devices = devices
+        self.events_per_sec = events_per_sec
+        self.churn_sec = churn_sec
+        self.sent = {}  # seq -> send time of lock events
+        self.fixes = 0
+        self._seq = 0
+        self._positions = {}
+        self._stop = threading.Event()
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="soak-load", protocol=mqtt.MQTTv5)
+        self.client.reconnect_delay_set(1, 5)
+        self.client.connect_async("127.0.0.1", port)
+
+    def device_ids(self, started):
+        generation = int((time.time() - started) // self.churn_sec) if self.churn_sec else 0
+        return [f"soak-{generation}-{i}" for i in range(self.devices)]
+
+    def fix(self, device):
+        lat, lon, course = self._positions.get(device) or (47.05 + random.random() / 100, 8.30 + random.random() / 100,
+                                                            random.uniform(0, 360))
+        course = (course + random.uniform(-15, 15)) % 360
+        step = 4 / 111000  # ~4 m per second
+        lat += step * math.cos(math.radians(course))
+        lon += step * math.sin(math.radians(course)) / math.cos(math.radians(lat))
+        self._positions[device] = (lat, lon, course)
+        return {"device": device, "ts": int(time.time() * 1000), "fix": True, "lat": lat, "lon": lon,
+                "alt": 436.0, "speed_kn": 7.8, "course_deg": round(course, 1), "sats": 9, "hdop": 0.9,
+                "lockmode": False, "brightness": "bright"}
+
+    def _run(self):
+        started = time.time()
+        next_tick = time.monotonic()
+        event_credit = 0.0
+        while not self._stop.is_set():
+            devices = self.device_ids(started)
+            for device in list(self._positions):
+                if device not in devices:
+                    del self._positions[device]
+            for device in devices:
+                self.client.publish(f"gateway/{device}/gps", json.dumps(self.fix(device)), qos=0)
+                self.fixes += 1
+            event_credit += self.events_per_sec
+            while event_credit >= 1:
+                event_credit -= 1
+                self._seq += 1
+                now = time.time()
+                device = random.choice(devices)
+                payload = {"device": device, "lockmode": False, "seq": self._seq, "sent": now}
+                self.sent[self._seq] = now
+                self.client.publish(f"gateway/{device}/lock", json.dumps(payload), qos=1)
+            next_tick += 1
+            self._stop.wait(max(0, next_tick - time.monotonic()))
+
+    def start(self):
+        self.client.loop_start()
+        threading.Thread(target=self._run, name="load", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+# ---- Process metrics from /proc ----
+def process_tree(pid):
+    pids = [pid]
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                    pids.append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+    return pids
+
+
+def process_stats(pids):
+    """Summed RSS (KB), CPU seconds, threads and open fds of the given processes"""
+    stats = {"rss_kb": 0, "cpu_s": 0.0, "threads": 0, "fds": 0}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        stats["rss_kb"] += int(line.split()[1])
+                    elif line.startswith("Threads:"):
+                        stats["threads"] += int(line.split()[1])
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            stats["cpu_s"] += (int(fields[11]) + int(fields[12])) / CLK_TCK
+            stats["fds"] += len(os.listdir(f"/proc/{pid}/fd"))
+        except (OSError, ValueError, IndexError):
+            continue
+    return stats
+
+
+def probe_health(port):
+    """Latency of the forwarder's local /api/health in ms (None if it failed)"""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health", timeout=2) as response:
+            response.read()
+    except OSError:
+        return None
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def trend_per_hour(points):
+    """Least-squares slope of (t, value) points, per hour"""
+    if len(points) < 3:
+        return 0.0
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    var = sum((t - mean_t) ** 2 for t, _ in points)
+    if not var:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in points) / var * 3600
+
+
+# ---- The rig ----
+class SoakRig:
+    def __init__(self, args):
+        self.args = args
+        self.workdir = args.workdir or tempfile.mkdtemp(prefix="soak-")
+        os.makedirs(self.workdir, exist_ok=True)
+        self.pollers = [p for p in args.pollers.split(",") if p]
+        self.faults = [f for f in args.faults.split(",") if f]
+        self.events = []  # (time, kind, client id) from the brokers
+        self.arrivals = {}  # seq -> first arrival time at the IoT endpoint
+        self.duplicates = 0
+        self.forwarded = {}  # uplink messages by kind (gps, lock, shadow, ...)
+        self.fault_log = []  # {"fault", "start", "end"}
+        self.samples = []
+        self.processes = {}  # name -> Popen
+        self.load = None
+        self.started = None
+        self._lock = threading.Lock()
+
+    # ---- Stand-in callbacks ----
+    def _record(self, kind, client_id):
+        with self._lock:
+            self.events.append((time.time(), kind, client_id))
+
+    def _uplink(self, client_id, topic, payload):
+        now = time.time()
+        kind = topic.rsplit("/", 1)[-1] if topic.startswith("sensors/") else topic.split("/")[0]
+        with self._lock:
+            self.forwarded[kind] = self.forwarded.get(kind, 0) + 1
+        if kind == "lock":
+            try:
+                seq = json.loads(payload)["seq"]
+            except (ValueError, KeyError, TypeError):
+                return
+            with self._lock:
+                if seq in self.arrivals:
+                    self.duplicates += 1
+                else:
+                    self.arrivals[seq] = now
+
+    # ---- Setup ----
+    def start(self):
+        args = self.args
+        certs = make_certs(self.workdir)
+        self.local = MiniBroker(port=0)
+        self.local.on_subscribe = lambda client_id, filters: self._record("subscribe", client_id)
+        self.local.start()
+        self.iot = MiniBroker(port=0, ssl_context=server_context(certs))
+        self.iot.on_connect = lambda client_id: self._record("iot_connect", client_id)
+        self.iot.on_publish = self._uplink
+        self.iot.start()
+        self.backend = FakeBackend()
+        self.backend.start()
+        self.api_port = free_port()
+
+        ports = {"local": self.local.port, "iot": self.iot.port, "api": self.api_port}
+        gateway = deploy(self.workdir, self.pollers, ports, certs, self.backend.url, args)
+        env = dict(os.environ, PYTHONUNBUFFERED="1", LOG_LEVEL=args.log_level)
+        self._spawn("forwarder", [sys.executable, "mqtt_forwarder.py", "--workers", str(args.workers)], gateway, env)
+        for name in self.pollers:
+            directory = gateway if name == "gateway" else os.path.join(self.workdir, name)
+            self._spawn(f"poller_{name}", [sys.executable, "job_poller.py"], directory, env)
+
+        deadline = time.time() + STARTUP_TIMEOUT_SEC
+        while time.time() < deadline:
+            clients = {c for _, kind, c in self.events if kind == "iot_connect"}
+            if len(clients) >= args.workers and self._forwarders_subscribed() >= args.workers:
+                break
+            time.sleep(0.2)
+        else:
+            raise SystemExit(f"Forwarder did not come up, see {self.workdir}/forwarder.log")
+
+        self.load = LoadGenerator(self.local.port, args.devices, args.events, args.churn_sec)
+        self.load.start()
+
+    def _forwarders_subscribed(self):
+        return len({c for _, kind, c in self.events if kind == "subscribe" and c.startswith("local-forwarder")})
+
+    def _spawn(self, name, command, cwd, env):
+        log = open(os.path.join(self.workdir, f"{name}.log"), "w")
+        self.processes[name] = subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    def stop(self):
+        if self.load:
+            self.load.stop()
+            self.load.close()
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.local.stop()
+        self.iot.stop()
+        self.backend.stop()
+
+    # ---- Faults ----
+    def begin_fault(self, name):
+        if name == "broker_restart":
+            self.local.stop()
+        elif name == "aws_drop":
+            self.iot.drop_clients()
+        elif name == "aws_outage":
+            self.iot.stop()
+            self.iot.drop_clients()
+        elif name == "backend_500":
+            self.backend.fault = "500"
+        elif name == "backend_hang":
+            self.backend.fault = "hang"
+
+    def end_fault(self, name):
+        if name == "broker_restart":
+            self.local.start()
+        elif name == "aws_outage":
+            self.iot.start()
+        elif name.startswith("backend_"):
+            self.backend.fault = None
+
+    # ---- Sampling ----
+    def sample(self, started):
+        row = {"t": round(time.time() - started, 1)}
+        for name, process in self.processes.items():
+            pids = process_tree(process.pid) if name == "forwarder" and self.args.workers > 1 else [process.pid]
+            row[name] = process_stats(pids) if process.poll() is None else None
+        row["api_ms"] = probe_health(self.api_port)
+        with self._lock:
+            row["lock_sent"] = len(self.load.sent)
+            row["lock_arrived"] = len(self.arrivals)
+        self.samples.append(row)
+        return row
+
+    # ---- Main loop ----
+    def run(self):
+        args = self.args
+        started = self.started = time.time()
+        schedule = []
+        t = args.fault_every
+        i = 0
+        while self.faults and t + args.fault_duration < args.duration - args.fault_every / 2:
+            schedule.append((started + t, self.faults[i % len(self.faults)]))
+            t += args.fault_every
+            i += 1
+
+        print(f"Soak run: {args.duration:.0f}s, {len(schedule)} faults, work dir {self.workdir}")
+        next_sample = started
+        next_progress = started + 60
+        active = None  # (name, end time, log entry)
+        while time.time() < started + args.duration:
+            now = time.time()
+            if active and now >= active[1]:
+                self.end_fault(active[0])
+                active[2]["end"] = time.time()
+                active = None
+            if not active and schedule and now >= schedule[0][0]:
+                _, name = schedule.pop(0)
+                duration = 0 if name == "aws_drop" else args.fault_duration
+                entry = {"fault": name, "start": time.time(), "end": None}
+                self.fault_log.append(entry)
+                self.begin_fault(name)
+                active = (name, now + duration, entry)
+                print(f"[{now - started:8.0f}s] fault {name} for {duration:.0f}s")
+            if now >= next_sample:
+                row = self.sample(started)
+                next_sample += args.sample_sec
+                if now >= next_progress:
+                    forwarder = row.get("forwarder") or {}
+                    print(f"[{now - started:8.0f}s] lock events {row['lock_arrived']}/{row['lock_sent']}, "
+                          f"forwarder RSS {forwarder.get('rss_kb', 0) / 1024:.1f} MB, "
+                          f"fds {forwarder.get('fds', 0)}, threads {forwarder.get('threads', 0)}")
+                    next_progress += 60
+            dead = [name for name, process in self.processes.items() if process.poll() is not None]
+            if dead:
+                print(f"Process exited: {', '.join(dead)} (see logs in {self.workdir})")
+                break
+            time.sleep(0.2)
+
+        if active:
+            self.end_fault(active[0])
+            active[2]["end"] = time.time()
+        self.load.stop()
+        time.sleep(DRAIN_SEC)
+        self.sample(started)
+
+    # ---- Report ----
+    def first_after(self, since, kind, prefix):
+        """Seconds from `since` until every client that matched before has an event of kind again"""
+        with self._lock:
+            events = list(self.events)
+        clients = {c for t, k, c in events if k == kind and c.startswith(prefix) and t < since}
+        delays = []
+        for client in clients:
+            after = [t for t, k, c in events if k == kind and c == client and t >= since]
+            delays.append(after[0] - since if after else None)
+        if not delays or None in delays:
+            return None
+        return round(max(delays), 2)
+
+    def backend_recovery(self, since):
+        with self._lock:
+            requests = list(self.backend.requests)
+        clients = {c for t, c, s in requests if t < since and c != "job_result"}  # results only follow jobs
+        recovery = {}
+        for client in sorted(clients):
+            ok = [t for t, c, s in requests if c == client and t >= since and s in (200, 304)]
+            recovery[client] = round(ok[0] - since, 2) if ok else None
+        return recovery
+
+    def report(self, started):
+        sent = self.load.sent
+        arrivals = self.arrivals
+        faults = []
+        lost_total = [seq for seq in sent if seq not in arrivals]
+        for i, entry in enumerate(self.fault_log):
+            end = entry["end"] or entry["start"]
+            window_end = self.fault_log[i + 1]["start"] if i + 1 < len(self.fault_log) else float("inf")
+            result = {
+                "fault": entry["fault"],
+                "at_s": round(entry["start"] - started, 1),
+                "duration_s": round(end - entry["start"], 1),
+            }
+            if entry["fault"].startswith("backend_"):
+                recovery = self.backend_recovery(end)
+                result["recovery_s"] = recovery
+                result["reconnect_s"] = None if None in recovery.values() else max(recovery.values(), default=0)
+            else:
+                if entry["fault"] == "broker_restart":
+                    result["reconnect_s"] = self.first_after(end, "subscribe", "local-forwarder")
+                else:
+                    result["reconnect_s"] = self.first_after(end, "iot_connect", "")
+                after = [arrivals[seq] for seq in sent if sent[seq] >= end and seq in arrivals]
+                result["first_delivery_s"] = round(min(after) - end, 2) if after else None
+            result["lost"] = sum(1 for seq in lost_total if entry["start"] <= sent[seq] < window_end)
+            result["late"] = sum(1 for seq in sent if entry["start"] <= sent[seq] < end
+                                 and arrivals.get(seq, 0) > end)
+            faults.append(result)
+
+        first_fault = self.fault_log[0]["start"] if self.fault_log else float("inf")
+        processes = {}
+        warmup = max(self.args.sample_sec * 3, min(600, self.args.duration * 0.1))
+        for name in self.processes:
+            rows = [(r["t"], r[name]) for r in self.samples if r.get(name)]
+            if not rows:
+                continue
+            steady = [(t, s) for t, s in rows if t >= warmup] or rows
+            (t0, first), (t1, last) = steady[0], steady[-1]
+            processes[name] = {
+                "rss_kb": {"start": first["rss_kb"], "end": last["rss_kb"],
+                           "max": max(s["rss_kb"] for _, s in rows),
+                           "trend_kb_per_hour": round(trend_per_hour([(t, s["rss_kb"]) for t, s in steady]), 1)},
+                "cpu_percent": round((last["cpu_s"] - first["cpu_s"]) / max(t1 - t0, 1) * 100, 2),
+                "threads": {"start": first["threads"], "end": last["threads"],
+                            "max": max(s["threads"] for _, s in rows)},
+                "fds": {"start": first["fds"], "end": last["fds"], "max": max(s["fds"] for _, s in rows)},
+            }
+        api = [r["api_ms"] for r in self.samples if r.get("api_ms") is not None]
+
+        return {
+            "duration_s": round(time.time() - started, 1),
+            "settings": {k: v for k, v in vars(self.args).items()},
+            "lock_events": {
+                "sent": len(sent),
+                "delivered": len(arrivals),
+                "lost": len(lost_total),
+                "lost_outside_faults": sum(1 for seq in lost_total if sent[seq] < first_fault),
+                "duplicates": self.duplicates,
+            },
+            "fixes_published": self.load.fixes,
+            "uplink_messages": dict(self.forwarded),
+            "backend": {"polls": self.backend.polls, "job_results": self.backend.results,
+                        "fleet_reports": self.backend.fleet_reports},
+            "local_api_ms": {"samples": len(api), "max": max(api, default=None),
+                             "failed": sum(1 for r in self.samples if r.get("api_ms") is None)},
+            "faults": faults,
+            "processes": processes,
+            "samples": self.samples,
+        }
+
+
+def print_report(report):
+    lock = report["lock_events"]
+    print()
+    print(f"==== Soak report ({report['duration_s'] / 3600:.2f} h) ====")
+    print(f"Lock events: {lock['sent']} sent, {lock['delivered']} delivered, {lock['lost']} lost "
+          f"({lock['lost_outside_faults']} outside faults), {lock['duplicates']} duplicates")
+    print(f"Fixes published: {report['fixes_published']}, uplink messages: {report['uplink_messages']}")
+    print(f"Backend: {report['backend']['polls']} polls, {report['backend']['job_results']} job results, "
+          f"{report['backend']['fleet_reports']} fleet reports")
+    api = report["local_api_ms"]
+    print(f"Local API /api/health: max {api['max']} ms, {api['failed']} failed probes")
+    print()
+    print(f"{'fault':<16}{'at':>9}{'dur':>6}{'reconnect':>11}{'delivery':>10}{'lost':>6}{'late':>6}")
+    for f in report["faults"]:
+        def fmt(value):
+            return "never" if value is None else f"{value:.1f}s"
+        print(f"{f['fault']:<16}{f['at_s']:>8.0f}s{f['duration_s']:>5.0f}s{fmt(f['reconnect_s']):>11}"
+              f"{fmt(f.get('first_delivery_s')) if 'first_delivery_s' in f else '-':>10}{f['lost']:>6}{f['late']:>6}")
+        if "recovery_s" in f:
+            print(f"{'':<16}  per client: {f['recovery_s']}")
+    print()
+    print(f"{'process':<20}{'RSS start':>11}{'end':>9}{'max':>9}{'trend/h':>10}{'CPU':>7}{'threads':>10}{'fds':>10}")
+    for name, p in report["processes"].items():
+        rss, threads, fds = p["rss_kb"], p["threads"], p["fds"]
+        print(f"{name:<20}{rss['start'] / 1024:>9.1f}MB{rss['end'] / 1024:>7.1f}MB{rss['max'] / 1024:>7.1f}MB"
+              f"{rss['trend_kb_per_hour']:>7.0f}KB{p['cpu_percent']:>6.1f}%"
+              f"{threads['start']:>5}->{threads['end']:<4}{fds['start']:>5}->{fds['end']:<4}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak and fault-injection rig for the gateway stack")
+    parser.add_argument("--duration", type=parse_duration, default=parse_duration("1h"), help="e.g. 600, 30m, 48h")
+    parser.add_argument("--fault-every", type=parse_duration, default=parse_duration("5m"))
+    parser.add_argument("--fault-duration", type=parse_duration, default=parse_duration("20s"))
+    parser.add_argument("--faults", default=",".join(FAULTS), help=f"comma-separated, cycled ({', '.join(FAULTS)})")
+    parser.add_argument("--devices", type=int, default=10, help="simulated bikes (1 fix/s each)")
+    parser.add_argument("--events", type=float, default=2, help="numbered lock events per second")
+    parser.add_argument("--churn-sec", type=parse_duration, default=parse_duration("10m"),
+                        help="rotate bike IDs this often (0 = fixed IDs)")
+    parser.add_argument("--workers", type=int, default=1, help="forwarder --workers")
+    parser.add_argument("--pollers", default="gateway,gps_pi,light_pi", help="job pollers to run")
+    parser.add_argument("--sample-sec", type=parse_duration, default=parse_duration("10s"))
+    parser.add_argument("--log-level", default="INFO", help="LOG_LEVEL of the daemons")
+    parser.add_argument("--workdir", help="keep copies, logs and the report here (default: new temp dir)")
+    args = parser.parse_args()
+
+    unknown = set(args.faults.split(",")) - set(FAULTS) - {""}
+    if unknown:
+        parser.error(f"unknown faults: {', '.join(sorted(unknown))}")
+
+    rig = SoakRig(args)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    try:
+        rig.start()
+        rig.run()
+    except KeyboardInterrupt:
+        print("Interrupted")
+    finally:
+        rig.stop()
+    if rig.started is None:
+        return 1
+
+    report = rig.report(rig.started)
+    path = os.path.join(rig.workdir, "soak_report.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
+    print_report(report)
+    print(f"\nFull report: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Fleet Health Aggregator for Gateway
+Collects the heartbeats of all Pis from the local broker (health/<pi>/<source>,
+see heartbeat.py) and sends one report per REPORT_SEC to the backend
+(POST /api/fleet/report) instead of one request per device.
+
+- Report document: {pi: {source: {...heartbeat fields, "online": bool}}};
+  a source that missed STALE_SEC of heartbeats is online=false and keeps its
+  last values plus "seen" (ms), one that is silent for FORGET_SEC is dropped
+- Delta encoded as a JSON merge patch (RFC 7386) against the last document
+  the backend acknowledged: only changed fields, null removes a field
+- "base" is the sequence number the patch applies to; the backend answers
+  409 if it has a different one and the next report is a full document
+  (also the first report after a gateway restart)
+- Nothing changed: no request, except a keepalive every KEEPALIVE_SEC
+"""
+
+import json
+import logging
+import threading
+import time
+
+import requests
+
+from heartbeat import HEARTBEAT_SEC
+
+log = logging.getLogger(__name__)
+
+TOPIC = "health/+/+"
+REPORT_SEC = 60
+STALE_SEC = 3 * HEARTBEAT_SEC
+FORGET_SEC = 86400
+KEEPALIVE_SEC = 300
+NOISE_FIELDS = ("pi", "source", "ts")  # per-heartbeat values, not part of the document
+
+
+def merge_patch(old, new):
+    """RFC 7386 patch that turns `old` into `new` (both dicts without None values)"""
+    patch = {}
+    for key in old.keys() - new.keys():
+        patch[key] = None
+    for key, value in new.items():
+        before = old.get(key)
+        if isinstance(value, dict) and isinstance(before, dict):
+            sub = merge_patch(before, value)
+            if sub:
+                patch[key] = sub
+        elif value != before:
+            patch[key] = value
+    return patch
+
+
+def _compact(value):
+    """Drop None values (a null in a merge patch means "remove")"""
+    if isinstance(value, dict):
+        return {k: _compact(v) for k, v in value.items() if v is not None}
+    return value
+
+
+class FleetHealth:
+    """Latest heartbeat per (pi, source), reported upstream as merge-patch deltas"""
+
+    def __init__(self, api_url, gateway_id, interval=REPORT_SEC):
+        self.api_url = api_url
+        self.gateway_id = gateway_id
+        self.interval = interval
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+        self._sources = {}  # (pi, source) -> (monotonic receive time, heartbeat ts ms, fields)
+        self._acked = None  # last document the backend has, None = send a full one
+        self._seq = None
+        self._sent = 0  # monotonic time of the last successful report
+        self._stop = threading.Event()
+        self._thread = None
+
+    def attach(self, client):
+        client.message_callback_add(TOPIC, self.on_message)
+
+    def subscribe(self, client):
+        client.subscribe(TOPIC, qos=0)
+
+    def on_message(self, client, userdata, msg):
+        try:
+            data = json.loads(msg.payload)
+            _, pi, source = msg.topic.split("/", 2)
+        except ValueError:
+            log.warning("Invalid heartbeat on %s", msg.topic)
+            return
+        fields = _compact({k: v for k, v in data.items() if k not in NOISE_FIELDS})
+        with self._lock:
+            self._sources[(pi, source)] = (time.monotonic(), data.get("ts"), fields)
+
+    def snapshot(self):
+        """Current fleet document"""
+        now = time.monotonic()
+        fleet = {}
+        with self._lock:
+            for key, (received, ts, fields) in list(self._sources.items()):
+                age = now - received
+                if age > FORGET_SEC:
+                    del self._sources[key]
+                    continue
+                entry = dict(fields, online=age <= STALE_SEC)
+                if not entry["online"] and ts:
+                    entry["seen"] = ts
+                pi, source = key
+                fleet.setdefault(pi, {})[source] = entry
+        return fleet
+
+    def report(self):
+        """Send the delta since the last acknowledged document (or a full one)"""
+        document = self.snapshot()
+        body = {"gateway": self.gateway_id, "ts": int(time.time() * 1000)}
+        if self._acked is None:
+            body.update(base=None, patch=document)
+        else:
+            patch = merge_patch(self._acked, document)
+            if not patch and time.monotonic() - self._sent < KEEPALIVE_SEC:
+                return
+            body.update(base=self._seq, patch=patch)
+        response = self._session.post(f"{self.api_url}/api/fleet/report", json=body, timeout=10)
+        if response.status_code == 409:
+            log.info("Fleet report out of sync (base %s), sending full document next", self._seq)
+            self._acked = None
+            return
+        response.raise_for_status()
+        self._acked = document
+        self._seq = response.json().get("seq")
+        self._sent = time.monotonic()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.report()
+            except Exception as e:
+                log.warning("Fleet report failed: %s", e)  # next delta covers both intervals
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="fleet-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._session.close()
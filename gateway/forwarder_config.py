@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Reloadable Forwarder Configuration
+Tuning values of mqtt_forwarder.py that can change at runtime, read from a
+JSON file (forwarder_config.json next to the forwarder, optional).
+
+- Keys missing from the file keep the forwarder's built-in defaults
+- load_config() validates everything and raises ValueError listing all
+  problems, so a broken file never replaces a working configuration
+- ForwarderConfig objects are never modified; a reload builds a new one and
+  the forwarder swaps its reference in one assignment
+
+Connection settings (broker host, AWS endpoint, certificates, client IDs)
+are not part of it: changing those needs a restart.
+"""
+
+import json
+import os
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "forwarder_config.json")
+
+
+def _number(value, minimum=0):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= minimum
+
+
+def _str_list(value):
+    return isinstance(value, list) and all(isinstance(v, str) and v for v in value)
+
+
+def _coord(lat, lon):
+    return _number(lat, -90) and lat <= 90 and _number(lon, -180) and lon <= 180
+
+
+def _zone(z):
+    """Geofence zone: a circle (lat, lon, radius_m) or a polygon of >= 3 [lat, lon] points"""
+    if not isinstance(z, dict) or not (isinstance(z.get("name"), str) and z["name"]):
+        return False
+    if set(z) - {"name", "kind", "devices", "dwell_sec", "lat", "lon", "radius_m", "polygon"}:
+        return False
+    if "kind" in z and not (isinstance(z["kind"], str) and z["kind"]):
+        return False
+    if "devices" in z and not _str_list(z["devices"]):
+        return False
+    if "dwell_sec" in z and not _number(z["dwell_sec"]):
+        return False
+    if "polygon" in z:
+        points = z["polygon"]
+        return (isinstance(points, list) and len(points) >= 3
+                and all(isinstance(p, list) and len(p) == 2 and _coord(*p) for p in points))
+    return _coord(z.get("lat"), z.get("lon")) and _number(z.get("radius_m"), 1)
+
+
+def _zones(value):
+    return (isinstance(value, list) and all(_zone(z) for z in value)
+            and len({z["name"] for z in value}) == len(value))
+
+
+# key -> (check, description)
+SCHEMA = {
+    "routes": (lambda v: isinstance(v, dict) and all(isinstance(k, str) and k and isinstance(t, str) and t
+                                                     for k, t in v.items()),
+               "object of local topic -> AWS topic"),
+    "prefix_in": (lambda v: isinstance(v, str) and v.endswith("/"), "topic prefix ending in '/'"),
+    "prefix_out": (lambda v: isinstance(v, str) and v.endswith("/"), "topic prefix ending in '/'"),
+    "min_interval_sec": (lambda v: _number(v), "number >= 0"),
+    "unthrottled_suffixes": (_str_list, "list of topic suffixes"),
+    "track_error_bound_m": (lambda v: _number(v, 0.1), "number >= 0.1"),
+    "track_heartbeat_sec": (lambda v: _number(v, 1), "number >= 1"),
+    "latest_interval_sec": (lambda v: _number(v), "number >= 0"),
+    "theft_distance_threshold_m": (lambda v: _number(v, 1), "number >= 1"),
+    "discord_webhook_url": (lambda v: isinstance(v, str) and v.startswith("https://"), "https:// URL"),
+    "status_devices": (_str_list, "list of device ids"),
+    "zones": (_zones, "list of zones with unique names ({name, lat, lon, radius_m} or {name, polygon})"),
+    "zone_hysteresis_m": (lambda v: _number(v), "number >= 0"),
+}
+
+
+class ForwarderConfig:
+    """Immutable set of tuning values (attributes named like the JSON keys)"""
+
+    def __init__(self, values):
+        for key, value in values.items():
+            if isinstance(value, list):
+                value = tuple(value)
+            elif isinstance(value, dict):
+                value = dict(value)
+            object.__setattr__(self, key, value)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("ForwarderConfig is read-only, build a new one")
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in SCHEMA}
+
+
+def load_config(defaults, path=CONFIG_PATH):
+    """Build a ForwarderConfig from defaults overlaid with the file (if it exists)"""
+    values = dict(defaults)
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"{path}: {e}")
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: top level must be an object")
+        values.update(data)
+
+    errors = [f"unknown key '{key}'" for key in values if key not in SCHEMA]
+    for key, (check, description) in SCHEMA.items():
+        if key not in values:
+            errors.append(f"missing '{key}'")
+        elif not check(values[key]):
+            errors.append(f"'{key}' must be a {description}, got {values[key]!r}")
+    if errors:
+        raise ValueError(f"{path}: " + "; ".join(errors))
+    return ForwarderConfig(values)
+
+
+def diff(old, new):
+    """Keys whose value changed between two configs"""
+    return [key for key in SCHEMA if getattr(old, key) != getattr(new, key)]
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Geofence Zone Engine for Gateway
+Evaluates each live fix against the named zones of its device (home,
+campus, parking areas, forbidden areas) and emits enter/exit/dwell events.
+
+- Zones are circles {"lat", "lon", "radius_m"} or polygons {"polygon":
+  [[lat, lon], ...]} with a name, an optional kind and an optional device
+  list (no list = every device); they come from the forwarder config ("zones")
+- Spatial index: a fixed grid of CELL_DEG cells (~1.1 km N-S). Each zone is
+  registered in every cell its bounding box (plus the hysteresis margin)
+  touches, so a fix is only tested against the zones of its own cell and
+  the zones the device is currently in. The cost per fix stays constant
+  however many zones there are; zones larger than MAX_CELLS cells are
+  tested for every fix
+- Hysteresis: enter when inside the zone, exit only when more than the
+  margin (zone_hysteresis_m) outside it, and both only after CONFIRM_FIXES
+  consecutive fixes agree. GPS jitter at the boundary does not flap
+- Dwell: one event per visit once the device was inside for the zone's
+  dwell_sec (default DWELL_SEC), evaluated on the device's fixes
+
+Zone event (one flat dict):
+  {"device": "pi9", "ts": <fix ts>, "event": "enter" | "exit" | "dwell",
+   "zone": "home", "kind": "home", "lat", "lon",
+   "since": <enter ts> (exit/dwell), "duration_s": (exit/dwell)}
+Several events of the same fix (leaving one zone, entering another) are 1 ms apart.
+
+Visits are kept in memory only; after a forwarder restart a device inside a
+zone is entered again with its next fixes.
+"""
+
+import logging
+import math
+import threading
+
+log = logging.getLogger(__name__)
+
+CELL_DEG = 0.01  # grid cell size in degrees (~1.1 km N-S, ~0.75 km E-W at 47°N)
+MAX_CELLS = 4096  # zones covering more cells are not indexed but always tested
+HYSTERESIS_M = 15.0  # default exit margin outside the zone boundary
+CONFIRM_FIXES = 2  # consecutive fixes needed for an enter or exit
+DWELL_SEC = 300
+EARTH_RADIUS = 6371000
+M_PER_DEG = math.radians(1) * EARTH_RADIUS
+
+
+def _cell(lat, lon):
+    return math.floor(lat / CELL_DEG), math.floor(lon / CELL_DEG)
+
+
+class Zone:
+    """One named zone; distance() is negative inside, positive outside (meters)"""
+
+    def __init__(self, spec):
+        self.name = spec["name"]
+        self.kind = spec.get("kind", "zone")
+        self.devices = frozenset(spec["devices"]) if spec.get("devices") else None
+        self.dwell_sec = spec.get("dwell_sec", DWELL_SEC)
+        if "polygon" in spec:
+            points = [(float(lat), float(lon)) for lat, lon in spec["polygon"]]
+            self.radius = None
+            self.lat = sum(p[0] for p in points) / len(points)
+            self.lon = sum(p[1] for p in points) / len(points)
+            self.vertices = [self._project(lat, lon) for lat, lon in points]
+            lats, lons = [p[0] for p in points], [p[1] for p in points]
+            self.bbox = (min(lats), min(lons), max(lats), max(lons))
+        else:
+            self.lat, self.lon, self.radius = float(spec["lat"]), float(spec["lon"]), float(spec["radius_m"])
+            self.vertices = None
+            dlat = self.radius / M_PER_DEG
+            dlon = dlat / math.cos(math.radians(self.lat))
+            self.bbox = (self.lat - dlat, self.lon - dlon, self.lat + dlat, self.lon + dlon)
+
+    def _project(self, lat, lon):
+        """Local equirectangular projection around the zone center (meters)"""
+        return (math.radians(lon - self.lon) * math.cos(math.radians(self.lat)) * EARTH_RADIUS,
+                math.radians(lat - self.lat) * EARTH_RADIUS)
+
+    def applies_to(self, device):
+        return self.devices is None or device in self.devices
+
+    def distance(self, lat, lon):
+        x, y = self._project(lat, lon)
+        if self.vertices is None:
+            return math.hypot(x, y) - self.radius
+        inside = False
+        nearest = math.inf
+        n = len(self.vertices)
+        for i in range(n):
+            (x1, y1), (x2, y2) = self.vertices[i], self.vertices[(i + 1) % n]
+            if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+                inside = not inside
+            dx, dy = x2 - x1, y2 - y1
+            t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / (dx * dx + dy * dy or 1)))
+            nearest = min(nearest, math.hypot(x - x1 - t * dx, y - y1 - t * dy))
+        return -nearest if inside else nearest
+
+    def cells(self, margin_m):
+        """Grid cells of the bounding box grown by the margin, None if there are too many"""
+        dlat = margin_m / M_PER_DEG
+        dlon = dlat / math.cos(math.radians(self.lat))
+        (row0, col0), (row1, col1) = (_cell(self.bbox[0] - dlat, self.bbox[1] - dlon),
+                                      _cell(self.bbox[2] + dlat, self.bbox[3] + dlon))
+        if (row1 - row0 + 1) * (col1 - col0 + 1) > MAX_CELLS:
+            return None
+        return [(row, col) for row in range(row0, row1 + 1) for col in range(col0, col1 + 1)]
+
+
+class ZoneEngine:
+    """Zone membership of all devices; calls on_event(event) for enter/exit/dwell"""
+
+    def __init__(self, zones=(), margin=HYSTERESIS_M):
+        self.on_event = None  # Optional callback(event)
+        self._lock = threading.Lock()
+        self._visits = {}  # device -> {zone name: [enter ts, dwell sent]}
+        self._pending = {}  # device -> {zone name: consecutive fixes disagreeing with the state}
+        self.set_zones(zones, margin)
+
+    def set_zones(self, zones, margin=HYSTERESIS_M):
+        """Replace the zone set and rebuild the index (config reload); visits of kept zones survive"""
+        built = {spec["name"]: Zone(spec) for spec in zones}
+        index, unindexed = {}, []
+        for zone in built.values():
+            cells = zone.cells(margin)
+            if cells is None:
+                unindexed.append(zone)
+                continue
+            for cell in cells:
+                index.setdefault(cell, []).append(zone)
+        with self._lock:
+            self.zones, self.margin = built, margin
+            self._index, self._unindexed = index, unindexed
+            for visits in self._visits.values():
+                for name in [n for n in visits if n not in built]:
+                    del visits[name]
+            for pending in self._pending.values():
+                for name in [n for n in pending if n not in built]:
+                    del pending[name]
+        log.info("Geofence: %s zones in %s cells (%s unindexed)", len(built), len(index), len(unindexed))
+
+    def push(self, device, fix):
+        """Feed a live fix (called by the forwarder for every GPS message)"""
+        if not (fix.get("fix") and fix.get("lat") and fix.get("lon") and fix.get("ts")):
+            return
+        lat, lon, ts = fix["lat"], fix["lon"], fix["ts"]
+        events = []
+        with self._lock:
+            visits = self._visits.setdefault(device, {})
+            pending = self._pending.setdefault(device, {})
+            candidates = {z.name: z for z in [*self._index.get(_cell(lat, lon), ()), *self._unindexed]}
+            for name in visits:
+                candidates.setdefault(name, self.zones[name])
+            for name in [n for n in pending if n not in candidates]:
+                del pending[name]  # not consecutive any more
+            for zone in candidates.values():
+                if not zone.applies_to(device):
+                    continue
+                distance = zone.distance(lat, lon)
+                visit = visits.get(zone.name)
+                changed = distance > self.margin if visit else distance <= 0
+                if not changed:
+                    pending.pop(zone.name, None)
+                    if visit and not visit[1] and ts - visit[0] >= zone.dwell_sec * 1000:
+                        visit[1] = True
+                        events.append(self._event(device, "dwell", zone, fix, visit[0]))
+                    continue
+                pending[zone.name] = pending.get(zone.name, 0) + 1
+                if pending[zone.name] < CONFIRM_FIXES:
+                    continue
+                del pending[zone.name]
+                if visit:
+                    del visits[zone.name]
+                    events.append(self._event(device, "exit", zone, fix, visit[0]))
+                else:
+                    visits[zone.name] = [ts, False]
+                    events.append(self._event(device, "enter", zone, fix))
+            if not visits and not pending:
+                del self._visits[device], self._pending[device]
+        for i, event in enumerate(events):
+            event["ts"] += i  # ts is the storage key (local store, DynamoDB): events of one fix 1 ms apart
+            self._emit(event)
+
+    def inside(self, device):
+        """Zones the device is in: [{"zone", "kind", "since"}]"""
+        with self._lock:
+            return [{"zone": name, "kind": self.zones[name].kind, "since": visit[0]}
+                    for name, visit in self._visits.get(device, {}).items()]
+
+    @staticmethod
+    def _event(device, name, zone, fix, since=None):
+        event = {"device": device, "ts": fix["ts"], "event": name, "zone": zone.name, "kind": zone.kind,
+                 "lat": fix["lat"], "lon": fix["lon"]}
+        if since is not None:
+            event.update(since=since, duration_s=(fix["ts"] - since) // 1000)
+        return event
+
+    def _emit(self, event):
+        log.info("Zone %s: %s %s (%s)", event["device"], event["event"], event["zone"], event["kind"])
+        if self.on_event:
+            try:
+                self.on_event(event)
+            except Exception as e:
+                log.warning("Zone callback failed for %s: %s", event["device"], e)
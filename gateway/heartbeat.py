@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Health heartbeats to the gateway broker (same file in gateway/, gps_pi/ and light_pi/)
+Every poller and daemon publishes a small JSON snapshot of itself on
+health/<pi_id>/<source> every HEARTBEAT_SEC; the gateway collects them
+(fleet_health.py) and sends one aggregated report upstream.
+
+- QoS 0 with MQTT v5 message expiry: a heartbeat is only useful while fresh,
+  nothing is queued or retained while the broker is unreachable
+- Values are rounded (temperature to 1 °C, load to 0.1, memory to MB), so
+  an idle device produces the same snapshot twice and the delta upstream is empty
+- Collecting is cheap: /proc and /sys reads, `systemctl show` only for the
+  units a poller watches
+"""
+
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+log = logging.getLogger(__name__)
+
+HEARTBEAT_SEC = 30
+TOPIC = "health/{pi_id}/{source}"
+EXPIRY_SEC = 3 * HEARTBEAT_SEC
+THERMAL_PATH = "/sys/class/thermal/thermal_zone0/temp"
+
+
+def cpu_temp():
+    """SoC temperature in °C, None where there is no thermal zone"""
+    try:
+        with open(THERMAL_PATH) as f:
+            return round(int(f.read()) / 1000)
+    except (OSError, ValueError):
+        return None
+
+
+def rss_mb(pid="self"):
+    """Resident memory of a process in MB (VmRSS), None if it is gone"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def system_metrics():
+    """Pi-wide numbers: CPU temperature, 1-min load, available memory"""
+    metrics = {"cpu_temp": cpu_temp(), "load": round(os.getloadavg()[0], 1)}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    metrics["mem_avail_mb"] = int(line.split()[1]) // 1024
+                    break
+    except OSError:
+        pass
+    return metrics
+
+
+def unit_metrics(units, state=None):
+    """{unit: {"state", "rss_mb"}} for systemd units; `state` is an optional
+    callable(unit) (e.g. the reconciler's cached state) instead of systemctl"""
+    result = {}
+    for unit in units:
+        try:
+            show = subprocess.run(["systemctl", "show", "-p", "ActiveState", "-p", "MainPID", unit],
+                                  capture_output=True, text=True, timeout=10)
+            props = dict(line.split("=", 1) for line in show.stdout.splitlines() if "=" in line)
+            if state:
+                props["ActiveState"] = state(unit)
+        except (OSError, subprocess.TimeoutExpired):
+            props = {}  # no systemd (dev box)
+        pid = props.get("MainPID", "0")
+        result[unit] = {
+            "state": props.get("ActiveState", "unknown"),
+            "rss_mb": rss_mb(pid) if pid not in ("", "0") else None,
+        }
+    return result
+
+
+def connect(client_id, host, port=1883, on_connect=None):
+    """Own MQTT v5 client for processes without one (the pollers); connects in the background"""
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, protocol=mqtt.MQTTv5)
+    client.on_connect = on_connect
+    client.connect_async(host, port, keepalive=60)
+    client.loop_start()
+    return client
+
+
+class HeartbeatPublisher:
+    """Publishes collect() on health/<pi_id>/<source> every `interval` seconds"""
+
+    def __init__(self, client, pi_id, source, collect, interval=HEARTBEAT_SEC):
+        self.client = client
+        self.topic = TOPIC.format(pi_id=pi_id, source=source)
+        self.pi_id = pi_id
+        self.source = source
+        self.collect = collect
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish(self):
+        payload = {"pi": self.pi_id, "source": self.source, "ts": int(time.time() * 1000),
+                   "rss_mb": rss_mb(), **self.collect()}
+        properties = Properties(PacketTypes.PUBLISH)
+        properties.MessageExpiryInterval = EXPIRY_SEC
+        self.client.publish(self.topic, json.dumps(payload), qos=0, properties=properties)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.publish()
+            except Exception as e:
+                log.warning("Heartbeat %s failed: %s", self.topic, e)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
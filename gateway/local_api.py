@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Local HTTP API for Gateway
+LAN mirror of the Worker's /api/position and /api/track, served from an
+in-memory latest-fix cache and the local time-series store (ts_store).
+
+  GET /api/position?device=pi9
+      newest reading, coords backfilled from the newest valid fix
+  GET /api/track?device=pi9&limit=100[&since=<ts ms>][&cursor=...]
+      newest first; with since= only readings newer than that timestamp.
+      A full page has an X-Next-Cursor header; pass it as cursor= for the
+      next (older) page
+  GET /api/trips?device=pi9&limit=20
+      ride summaries from trip_engine, newest first; a ride in progress
+      comes first with "active": true
+  GET /api/zones?device=pi9&limit=20
+      geofence zones the device is in and its zone events (geofence),
+      newest first: {"inside": [...], "events": [...]}
+  GET /api/health
+      gateway state (AWS connection)
+
+Responses use the same JSON shape as the Worker (lat, lon, speed, course,
+fix, ts, device). The frontend reads /api/position and /api/track from here
+when CONFIG.LOCAL_API_URL is set to http://<gateway>:8080 (and the page is
+served over plain http); all other routes stay on the Worker.
+"""
+
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+log = logging.getLogger(__name__)
+
+API_HOST = "0.0.0.0"
+API_PORT = 8080
+MAX_LIMIT = 5000
+MAX_TRIPS = 500
+MAX_ZONE_EVENTS = 500
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+    "Access-Control-Expose-Headers": "X-Next-Cursor",
+}
+
+
+def to_point(record):
+    """Reading as stored by the forwarder -> Worker response shape"""
+    return {
+        "lat": record.get("lat"),
+        "lon": record.get("lon", record.get("long")),
+        "speed": record.get("speed_kn") or 0,
+        "course": record.get("course_deg") or 0,
+        "fix": record.get("fix"),
+        "ts": record.get("ts"),
+        "device": record.get("device"),
+    }
+
+
+def has_position(record):
+    return bool(record and record.get("fix") and record.get("lat") and record.get("lon", record.get("long")))
+
+
+class LocalApi:
+    """Serves position/track queries on the LAN"""
+
+    def __init__(self, store, host=API_HOST, port=API_PORT, health=None, owns=None, active_trip=None,
+                 zones=None):
+        self.store = store
+        self.health = health  # Optional callable() -> dict for /api/health
+        self.active_trip = active_trip  # Optional callable(device) -> summary of the ride in progress
+        self.zones_inside = zones  # Optional callable(device) -> zones the device is in
+        self.owns = owns  # Optional callable(device) -> bool; other devices are read from the store
+        self.host = host
+        self.port = port
+        self._latest = {}  # device -> newest reading
+        self._latest_fix = {}  # device -> newest reading with a position
+        self._lock = threading.Lock()
+        self._server = None
+
+    def update(self, device, record):
+        """Feed a GPS reading (called by the forwarder for every message, before rate limiting)"""
+        with self._lock:
+            self._latest[device] = record
+            if has_position(record):
+                self._latest_fix[device] = record
+
+    def position(self, device):
+        if self.owns and not self.owns(device):
+            # Fed by another forwarder worker: no cache here, the store is current
+            return self._position(self.store.latest(device), self.store.latest(device, valid_fix=True))
+        with self._lock:
+            latest = self._latest.get(device)
+            latest_fix = self._latest_fix.get(device)
+        # Cold cache (e.g. after a restart): load once from the store
+        if latest is None:
+            latest = self.store.latest(device)
+            latest_fix = self.store.latest(device, valid_fix=True)
+            if latest is None:
+                return {}
+            with self._lock:
+                self._latest.setdefault(device, latest)
+                if latest_fix:
+                    self._latest_fix.setdefault(device, latest_fix)
+        return self._position(latest, latest_fix)
+
+    def _position(self, latest, latest_fix):
+        if latest is None:
+            return {}
+        result = to_point(latest)
+        if not has_position(latest) and latest_fix:
+            result.update(to_point(latest_fix))
+        result["last_update_ts"] = latest.get("ts")
+        return result
+
+    def track(self, device, limit, since=None, until=None):
+        return [to_point(r) for r in self.store.range(device, since=since, until=until, limit=limit)]
+
+    def trips(self, device, limit):
+        trips = self.store.range(device, kind="trip", limit=limit)
+        active = self.active_trip(device) if self.active_trip else None
+        if active:
+            trips.insert(0, {**active, "active": True})
+        return trips
+
+    def zones(self, device, limit):
+        # Membership is only known to the worker that owns the device (worker 0 serves the API)
+        inside = self.zones_inside(device) if self.zones_inside and (not self.owns or self.owns(device)) else None
+        return {"inside": inside, "events": self.store.range(device, kind="zone", limit=limit)}
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in {**CORS_HEADERS, **(headers or {})}.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_OPTIONS(self):
+                self.send_response(204)  # no body, no Content-Length
+                for key, value in CORS_HEADERS.items():
+                    self.send_header(key, value)
+                self.end_headers()
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                device = params.get("device", "pi9")
+                try:
+                    if url.path == "/api/position":
+                        self._send(200, api.position(device))
+                    elif url.path == "/api/track":
+                        limit = min(int(params.get("limit") or 100), MAX_LIMIT)
+                        since = int(params["since"]) if params.get("since") else None
+                        # Cursor: ts of the oldest point of the previous page
+                        until = int(params["cursor"]) - 1 if params.get("cursor") else None
+                        points = api.track(device, limit, since, until)
+                        more = len(points) == limit and points[-1]["ts"] is not None
+                        self._send(200, points, {"X-Next-Cursor": str(points[-1]["ts"])} if more else None)
+                    elif url.path == "/api/trips":
+                        limit = min(int(params.get("limit") or 20), MAX_TRIPS)
+                        self._send(200, api.trips(device, limit))
+                    elif url.path == "/api/zones":
+                        limit = min(int(params.get("limit") or 20), MAX_ZONE_EVENTS)
+                        self._send(200, api.zones(device, limit))
+                    elif url.path == "/api/health" and api.health:
+                        self._send(200, api.health())
+                    else:
+                        self._send(404, {"error": "Not found"})
+                except ValueError:
+                    self._send(400, {"error": "Invalid parameter"})
+                except Exception as e:
+                    log.warning("Local API error: %s", e)
+                    self._send(500, {"error": str(e)})
+
+            def log_message(self, format, *args):
+                pass  # No access log per request (frontend polls every few seconds)
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="local-api", daemon=True).start()
+        log.info("Local API listening on http://%s:%s", self.host, self.port)
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
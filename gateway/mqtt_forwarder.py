@@ -7,21 +7,65 @@ This script runs continuously and forwards MQTT messages from the local
 broker (127.0.0.1:1883) to AWS IoT Core with proper TLS authentication.
 
 Topic mapping: gateway/* -> sensors/*
-Rate limiting: Max 1 message per 10 seconds per topic
+Rate limiting: Max 1 message per 10 seconds per topic (lock events exempt)
+GPS fixes: streaming track simplification instead of time-based rate limiting
+Local history: every reading is kept in readings.db (ts_store) before any of that
+Local API: /api/position, /api/track and /api/trips on http://<gateway>:8080 (local_api)
+Latest state: one record per device (newest reading + last valid fix) on
+<prefix_out><device>/gps/latest, overwritten in place, for /api/position
+Trips: live fixes are split into rides on the gateway (trip_engine); each
+finished ride is stored locally and published once to <prefix_out><device>/gps/trip
+Zones: live fixes are checked against the configured geofence zones (geofence);
+enter/exit/dwell events are stored locally and published to <prefix_out><device>/gps/zone.
+The lock-position theft check (check_theft) stays as it is
+AWS connection: aws_connection (reconnect backoff, persistent session, TLS resumption)
+Config: the constants below are defaults; forwarder_config.json overrides
+the tuning values and is re-read on SIGHUP without dropping connections
+Logging: daemon_log (queued, logfmt or JSON, "Forwarding" lines rate limited)
+Profiling: daemon_profile, triggered by `profile` jobs of the gateway poller
+Health: heartbeat on health/gateway/forwarder (AWS link, queue depths), collected
+by the gateway poller's fleet_health with the heartbeats of the other Pis
+
+Multi-worker mode (--workers N): N processes, each forwarding the devices
+of one shard (crc32(device) % N) with its own AWS connection. Not MQTT v5
+shared subscriptions: those spread messages of one device over all
+workers, and track simplification / theft detection need every message of
+a device in the same process.
 """
 
-import ssl
+import argparse
 import json
+import logging
+import signal
+import subprocess
+import sys
+import threading
 import time
 import math
-import requests
-from datetime import datetime
+import zlib
 from paho.mqtt import client as mqtt
 
+from status_relay import StatusRelay
+from track_backfill import SPOOL_DIR, BackfillUploader
+from track_compress import TrackSimplifier, compact_fix
+from trip_engine import TripEngine
+from geofence import HYSTERESIS_M, ZoneEngine
+from ts_store import TimeSeriesStore, split_topic
+from local_api import LocalApi
+from theft_alerts import AlertDispatcher, JOURNAL_PATH
+from aws_connection import AwsConnection
+from device_shadow import SHADOW_PATH, DeviceShadows
+from forwarder_config import CONFIG_PATH, diff, load_config
+from daemon_log import setup_logging
+from daemon_profile import install as install_profiling
+from heartbeat import HeartbeatPublisher
+
+log = logging.getLogger("forwarder")
+forward_log = logging.getLogger("forwarder.forward")  # one line per forwarded message
+
 # Local Broker (Gateway)
 LOCAL_HOST = "127.0.0.1"
 LOCAL_PORT = 1883
-LOCAL_TOPIC = "gateway/#"
 # Additional topics from GPS and Light Pi (legacy)
 GPS_TOPIC = "gps"
 LIGHT_TOPIC = "bike/light"
@@ -41,17 +85,70 @@ REMOTE_PREFIX_OUT = "sensors/"
 
 # Seconds between forwarding per topic (rate limiting)
 MIN_INTERVAL_SEC = 10
+# Event topics that are forwarded immediately (e.g. lock button state changes)
+UNTHROTTLED_SUFFIXES = ("/lock",)
+
+# ---- Track Compression Config ----
+TRACK_ERROR_BOUND_M = 5.0  # max deviation of the forwarded track from the raw fixes
+TRACK_HEARTBEAT_SEC = 30  # forward at least one fix per device this often (online status)
+LATEST_INTERVAL_SEC = 5  # latest-state record per device at most this often (sooner when the fix is lost/regained)
+
+# Bikes whose stolen status is pushed to bike/<device>/status (retained)
+STATUS_DEVICES = ["pi9"]
+
+# ---- Geofence ----
+ZONES = []  # named zones, see forwarder_config.example.json
+ZONE_HYSTERESIS_M = HYSTERESIS_M  # exit only this far outside a zone (GPS jitter)
 
 # ---- Theft Detection Config ----
 THEFT_DISTANCE_THRESHOLD = 10  # meters
 DISCORD_WEBHOOK_URL = "https://discord.com/api/webhooks/1446116774998179861/elv96aMUltKQtfLIkTDdmVGzzQXpM3nJAkN193eMmZ5LHFy4FqTHHXzkJxDT3TZTH5Yo"
 
-aws_client = None
+# ---- Health ----
+HEALTH_ID = "gateway"  # health/<id>/forwarder, same id as the gateway poller (PI_ID)
+
+# ---- Logging ----
+FORWARD_LOG_RATE = (0.2, 10)  # "Forwarding ..." lines: 1 per 5s per topic pattern, bursts of 10
+
+# Defaults for the reloadable tuning values (see forwarder_config.py)
+DEFAULT_CONFIG = {
+    "routes": {GPS_TOPIC: "sensors/pi9/gps", LIGHT_TOPIC: "sensors/light/brightness"},
+    "prefix_in": REMOTE_PREFIX_IN,
+    "prefix_out": REMOTE_PREFIX_OUT,
+    "min_interval_sec": MIN_INTERVAL_SEC,
+    "unthrottled_suffixes": list(UNTHROTTLED_SUFFIXES),
+    "track_error_bound_m": TRACK_ERROR_BOUND_M,
+    "track_heartbeat_sec": TRACK_HEARTBEAT_SEC,
+    "latest_interval_sec": LATEST_INTERVAL_SEC,
+    "theft_distance_threshold_m": THEFT_DISTANCE_THRESHOLD,
+    "discord_webhook_url": DISCORD_WEBHOOK_URL,
+    "status_devices": STATUS_DEVICES,
+    "zones": ZONES,
+    "zone_hysteresis_m": ZONE_HYSTERESIS_M,
+}
+
+# ---- Multi-worker (sharding by device) ----
+shard = 0  # index of this worker
+shard_count = 1  # number of workers
+
+config = None  # ForwarderConfig; replaced as a whole on reload, never modified
+config_path = CONFIG_PATH
+reload_requested = threading.Event()  # set by SIGHUP; the reload itself runs on the config-reload thread
+local_client = None
+status_relay = None
+shadows = None  # DeviceShadows: desired/reported lockmode and stolen per device
+aws = None  # AwsConnection (reconnects by itself, QoS 1 queued while offline)
+backfill = None  # BackfillUploader for offline fixes uploaded in bulk by the bikes
+store = None  # TimeSeriesStore with every reading seen locally
+local_api = None  # LocalApi (latest-fix cache is fed from on_local_message)
+trips = None  # TripEngine: ride segmentation of the live fixes of this shard's devices
+zones = None  # ZoneEngine: geofence zone membership of this shard's devices
 last_forward = {}  # remote_topic -> timestamp of last forwarded message
+simplifiers = {}  # remote_topic -> TrackSimplifier
+last_latest = {}  # device -> (timestamp, had fix) of the last latest-state publish
 
 # ---- Theft Detection State ----
-last_locked_position = None  # (lat, lon) when lockmode activated
-theft_alert_sent = False  # Prevents multiple alerts per lock cycle
+alerts = None  # AlertDispatcher: delivers webhook alerts off the MQTT thread, keeps the lock positions
 
 
 def haversine_distance(pos1, pos2):
@@ -69,171 +166,358 @@ def haversine_distance(pos1, pos2):
     return R * c
 
 
-def send_theft_alert(device_id, current_pos, distance_moved):
-    """Send theft alert to Discord webhook"""
-    global theft_alert_sent
-
-    if theft_alert_sent:
-        return
+def message_device(msg):
+    """Device of a local message: MQTT v5 user property if the publisher set one
+    (no topic or body parsing), otherwise derived from the topic"""
+    for key, value in getattr(msg.properties, "UserProperty", None) or ():
+        if key == "device":
+            return value
+    return split_topic(msg.topic)[0]
 
-    lat, lon = current_pos
-    google_maps_url = f"https://www.google.com/maps?q={lat},{lon}"
-
-    payload = {
-        "content": "🚨 **BIKE THEFT ALERT!**",
-        "embeds": [{
-            "title": f"🚴 Bike {device_id} moved while locked!",
-            "description": f"The bike was moved **{distance_moved:.1f} meters** while in lock mode.",
-            "color": 0xFF0000,
-            "fields": [
-                {
-                    "name": "📍 Current Location",
-                    "value": f"[{lat:.6f}, {lon:.6f}]({google_maps_url})",
-                    "inline": False
-                },
-                {
-                    "name": "📏 Distance Moved",
-                    "value": f"{distance_moved:.1f} m",
-                    "inline": True
-                },
-                {
-                    "name": "⏰ Timestamp",
-                    "value": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "inline": True
-                }
-            ],
-            "thumbnail": {
-                "url": "https://em-content.zobj.net/thumbs/120/apple/354/police-car-light_1f6a8.png"
-            }
-        }]
-    }
 
-    try:
-        response = requests.post(DISCORD_WEBHOOK_URL, json=payload, timeout=5)
-        if response.status_code == 204:
-            print(f"[{datetime.now()}] 🚨 Theft alert sent!")
-            theft_alert_sent = True
-    except Exception as e:
-        print(f"[{datetime.now()}] Webhook error: {e}")
+def owns(device_id):
+    """True if this worker handles the device (stable across processes, unlike hash())"""
+    return shard_count == 1 or zlib.crc32(device_id.encode()) % shard_count == shard
 
 
 def check_theft(device_id, lat, lon, lockmode, fix):
     """Check if bike has been moved while locked"""
-    global last_locked_position, theft_alert_sent
-
     # Only process valid GPS fixes
     if not fix or lat == 0 or lon == 0:
         return
 
     current_pos = (lat, lon)
+    locked_position = alerts.lock_position(device_id)  # journaled, survives a restart
 
-    # Lockmode activated - save position
-    if lockmode and last_locked_position is None:
-        last_locked_position = current_pos
-        theft_alert_sent = False
-        print(f"[{datetime.now()}] 🔒 Lock position set")
+    # Lockmode activated - save position (a pending alert of the device is kept)
+    if lockmode and locked_position is None:
+        alerts.set_lock(device_id, lat, lon)
+        log.info("🔒 Lock position set for %s", device_id)
         return
 
     # Lockmode deactivated - reset
-    if not lockmode and last_locked_position is not None:
-        last_locked_position = None
-        theft_alert_sent = False
-        print(f"[{datetime.now()}] 🔓 Lock released")
+    if not lockmode and locked_position is not None:
+        alerts.release_lock(device_id)
+        log.info("🔓 Lock released for %s", device_id)
         return
 
-    # Check for movement while locked
-    if lockmode and last_locked_position:
-        distance = haversine_distance(last_locked_position, current_pos)
-        if distance > THEFT_DISTANCE_THRESHOLD:
-            print(f"[{datetime.now()}] 🚨 THEFT! Moved {distance:.1f}m while locked!")
-            send_theft_alert(device_id, current_pos, distance)
+    # Check for movement while locked (dispatcher coalesces repeated reports)
+    if lockmode and locked_position:
+        distance = haversine_distance(locked_position, current_pos)
+        if distance > config.theft_distance_threshold_m:
+            alerts.report(device_id, lat, lon, distance)
 
 
-def on_local_connect(client, userdata, flags, rc):
-    print("Local connected:", rc)
-    client.subscribe(LOCAL_TOPIC)
-    client.subscribe(GPS_TOPIC)
-    client.subscribe(LIGHT_TOPIC)
+def subscriptions(cfg):
+    return {cfg.prefix_in + "#"} | set(cfg.routes)
+
+
+def on_local_connect(client, userdata, flags, reason_code, properties):
+    log.info("Local connected: %s", reason_code)
+    for topic in subscriptions(config):
+        client.subscribe(topic)
+    shadows.subscribe(client)
+    shadows.publish_all()  # retained deltas are gone if the broker restarted
+
+
+def reload_config():
+    """Re-read the config file and swap it in; keeps the old config if the file is invalid"""
+    global config
+    try:
+        new = load_config(DEFAULT_CONFIG, config_path)
+    except ValueError as e:
+        log.warning("Config not reloaded: %s", e)
+        return False
+    old = config
+    changed = diff(old, new)
+    if not changed:
+        log.info("Config reloaded, no changes")
+        return True
+
+    # Adjust running components in place (no reconnects)
+    for topic in subscriptions(new) - subscriptions(old):
+        local_client.subscribe(topic)
+    for topic in subscriptions(old) - subscriptions(new):
+        local_client.unsubscribe(topic)
+    for simplifier in simplifiers.values():
+        simplifier.error_bound = new.track_error_bound_m
+    alerts.webhook_url = new.discord_webhook_url
+    status_relay.devices = [d for d in new.status_devices if owns(d)]
+    if new.zones != old.zones or new.zone_hysteresis_m != old.zone_hysteresis_m:
+        zones.set_zones(new.zones, new.zone_hysteresis_m)
+
+    config = new
+    log.info("Config reloaded, changed: %s", ', '.join(changed))
+    return True
+
+
+def reload_loop():
+    """Reload on SIGHUP outside the signal handler: the handler interrupts the MQTT loop
+    thread, possibly while it holds paho's or the zone engine's (non-reentrant) locks"""
+    while True:
+        reload_requested.wait()
+        reload_requested.clear()
+        try:
+            reload_config()
+        except Exception as e:
+            log.warning("Config reload failed: %s", e)
 
 
 def on_local_message(client, userdata, msg):
-    global aws_client, last_forward
+    global last_forward
 
+    cfg = config  # one consistent config for the whole message, even if a reload swaps it
     topic = msg.topic
     payload = msg.payload
 
+    # Every worker receives everything; only the device's shard processes it
+    device_id = message_device(msg)
+    if not owns(device_id):
+        return
+
+    # Full-resolution local history (enqueue only, written by the store thread)
+    store.add(topic, payload)
+
+    # ---- Bulk upload of fixes recorded while the bike was offline ----
+    if topic.startswith(cfg.prefix_in) and topic.endswith("/gps/bulk"):
+        backfill.submit(device_id, f"{cfg.prefix_out}{device_id}/gps/batch", payload)
+        return
+
     # ---- Theft Detection for GPS messages ----
-    if topic == "gps":
+    gps_data = None
+    if topic == GPS_TOPIC or (topic.startswith(cfg.prefix_in) and topic.endswith("/gps")):
         try:
             gps_data = json.loads(payload.decode())
-            device_id = gps_data.get("device", "pi9")
+            device_id = gps_data.get("device", device_id)
             lat = gps_data.get("lat", 0)
-            lon = gps_data.get("long", 0)  # Note: GPS Pi uses "long" not "lon"
-            lockmode = gps_data.get("lockmode", False)
+            lon = gps_data.get("lon", 0)
+            # Lock state from the shadow (event-driven); payload field for Pis without shadow sync
+            lockmode = shadows.reported(device_id, "lockmode", gps_data.get("lockmode", False))
             fix = gps_data.get("fix", False)
 
+            local_api.update(device_id, gps_data)
+            trips.push(device_id, gps_data)
+            zones.push(device_id, gps_data)
             check_theft(device_id, lat, lon, lockmode, fix)
-
-            # Rename "long" to "lon" for AWS IoT Rule compatibility
-            if "long" in gps_data:
-                gps_data["lon"] = gps_data.pop("long")
-                payload = json.dumps(gps_data).encode()
+            publish_latest(cfg, device_id, gps_data)
         except:
-            pass  # Ignore parsing errors, continue with forwarding
+            gps_data = None  # Ignore parsing errors, continue with forwarding
 
     # Topic remapping:
     # - gateway/... -> sensors/...
-    # - gps -> sensors/pi9/gps
-    # - bike/light -> sensors/light/brightness
-    if topic.startswith(REMOTE_PREFIX_IN):
-        remote_topic = REMOTE_PREFIX_OUT + topic[len(REMOTE_PREFIX_IN):]
-    elif topic == "gps":
-        remote_topic = "sensors/pi9/gps"
-    elif topic == "bike/light":
-        remote_topic = "sensors/light/brightness"
+    # - explicit routes, e.g. gps -> sensors/pi9/gps, bike/light -> sensors/light/brightness
+    if topic.startswith(cfg.prefix_in):
+        remote_topic = cfg.prefix_out + topic[len(cfg.prefix_in):]
     else:
-        remote_topic = topic  # Fallback safety
+        remote_topic = cfg.routes.get(topic, topic)  # Fallback safety
+
+    # ---- GPS fixes: forward only the points of the simplified track ----
+    if isinstance(gps_data, dict) and gps_data.get("fix") and gps_data.get("lat") and gps_data.get("lon"):
+        forward_track_point(cfg, remote_topic, gps_data)
+        return
+    if isinstance(gps_data, dict):
+        payload = json.dumps(compact_fix(gps_data)).encode()
 
     now = time.time()
     last_ts = last_forward.get(remote_topic, 0)
 
     # Only forward every 10 seconds per topic (rate limiting)
-    if now - last_ts < MIN_INTERVAL_SEC:
-        # Optional debug output
-        # print(f"Skipping {remote_topic}, last {now - last_ts:.1f}s ago")
+    if now - last_ts < cfg.min_interval_sec and not remote_topic.endswith(cfg.unthrottled_suffixes):
+        forward_log.debug("Skipping %s, last %.1fs ago", remote_topic, now - last_ts)
         return
 
     last_forward[remote_topic] = now
 
-    print(f"Forwarding {topic} -> {remote_topic}")
-    aws_client.publish(remote_topic, payload, qos=0)
+    forward_log.info("Forwarding %s -> %s", topic, remote_topic)
+    aws.publish(remote_topic, payload, device=device_id)
 
 
-def connect_aws():
-    global aws_client
-    aws_client = mqtt.Client(client_id=CLIENT_ID)
-    aws_client.tls_set(
-        ca_certs=CA_PATH,
-        certfile=CERT_PATH,
-        keyfile=KEY_PATH,
-        cert_reqs=ssl.CERT_REQUIRED,
-        tls_version=ssl.PROTOCOL_TLS_CLIENT
-    )
-    aws_client.connect(AWS_ENDPOINT, AWS_PORT, keepalive=60)
-    aws_client.loop_start()
-    print("Connected to AWS")
+def publish_latest(cfg, device_id, gps_data):
+    """Send the device's latest-state record (newest reading, coords from the newest valid fix)"""
+    now = time.time()
+    has_fix = bool(gps_data.get("fix") and gps_data.get("lat") and gps_data.get("lon"))
+    previous = last_latest.get(device_id)
+    if previous and now - previous[0] < cfg.latest_interval_sec and previous[1] == has_fix:
+        return
+    last_latest[device_id] = (now, has_fix)
+    # Constant sort key: the IoT rule overwrites one item per device instead of appending
+    record = {"device": f"{device_id}#latest", "ts": 0, "bike": device_id, "updated": int(now * 1000),
+              "position": local_api.position(device_id)}
+    # QoS 0: a newer record follows anyway, nothing to queue while AWS is offline
+    aws.publish(f"{cfg.prefix_out}{device_id}/gps/latest", json.dumps(record), qos=0, device=device_id)
+
+
+def forward_track_point(cfg, remote_topic, gps_data):
+    """Feed a fix into the topic's simplifier and forward the points it keeps"""
+    now = time.time()
+    simplifier = simplifiers.get(remote_topic)
+    if simplifier is None:
+        simplifier = simplifiers[remote_topic] = TrackSimplifier(cfg.track_error_bound_m)
+
+    # Heartbeat: keep the current fix if nothing was forwarded for a while
+    heartbeat = now - last_forward.get(remote_topic, 0) >= cfg.track_heartbeat_sec
+    kept = simplifier.push(gps_data, force=heartbeat)
+    for point in kept:
+        aws.publish(remote_topic, json.dumps(compact_fix(point)), device=point.get("device"), ts=point.get("ts"))
+    if kept:
+        last_forward[remote_topic] = now
+        forward_log.info("Forwarding %s track point(s) -> %s", len(kept), remote_topic)
+
+
+def publish_trip(device_id, summary):
+    """Keep a finished ride in the local store and send its summary to AWS"""
+    cfg = config
+    store.add(f"gateway/{device_id}/trip", json.dumps(summary).encode())
+    # Own partition key, so the IoT rule files summaries apart from the device's fixes
+    uplink = {**summary, "device": f"{device_id}#trips", "bike": device_id}
+    aws.publish(f"{cfg.prefix_out}{device_id}/gps/trip", json.dumps(uplink), device=device_id)
+
+
+def forwarder_health():
+    """Heartbeat fields of this worker: AWS link and queue depths"""
+    state = aws.health()
+    return {
+        "aws": state["connected"],
+        "aws_disconnects": state["disconnects"],
+        "store_queue": store.pending,
+        "store_dropped": store.dropped,
+        "backfill_queue": backfill.pending,
+        "devices": len(last_latest),
+    }
+
+
+def publish_zone_event(event):
+    """Keep a zone event in the local store and send it to AWS"""
+    cfg = config
+    device_id = event["device"]
+    if event["kind"] == "forbidden" and event["event"] == "enter":
+        log.warning("⛔ %s entered forbidden zone %s", device_id, event["zone"])
+    store.add(f"gateway/{device_id}/zone", json.dumps(event).encode())
+    # Own partition key like the trip summaries ("<device>#zones")
+    uplink = {**event, "device": f"{device_id}#zones", "bike": device_id}
+    aws.publish(f"{cfg.prefix_out}{device_id}/gps/zone", json.dumps(uplink), device=device_id)
+
+
+def run_workers(count):
+    """Start one forwarder process per shard and wait for them"""
+    workers = [
+        subprocess.Popen([sys.executable, __file__, "--workers", str(count), "--shard", str(i),
+                          "--config", config_path])
+        for i in range(count)
+    ]
+    log.info("Started %s forwarder workers", count)
+
+    def terminate(signum, frame):
+        for worker in workers:
+            worker.terminate()
+
+    def reload(signum, frame):
+        for worker in workers:
+            worker.send_signal(signal.SIGHUP)
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGHUP, reload)
+    try:
+        for worker in workers:
+            worker.wait()
+    except KeyboardInterrupt:
+        terminate(None, None)
+        for worker in workers:
+            worker.wait()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Forward local MQTT messages to AWS IoT Core")
+    parser.add_argument("--workers", type=int, default=1, help="forwarder processes, devices are sharded over them")
+    parser.add_argument("--config", default=CONFIG_PATH, help="JSON file with tuning values (re-read on SIGHUP)")
+    parser.add_argument("--shard", type=int, help=argparse.SUPPRESS)  # set by the parent for each worker
+    return parser.parse_args()
 
 
 def main():
-    connect_aws()
+    global aws, backfill, store, local_api, trips, zones, alerts, shard, shard_count
+    global config, config_path, local_client, status_relay, shadows
 
-    local_client = mqtt.Client(client_id="local-forwarder")
+    args = parse_args()
+    setup_logging("forwarder", limits={"forward": FORWARD_LOG_RATE})
+    config_path = args.config
+    try:
+        config = load_config(DEFAULT_CONFIG, config_path)
+    except ValueError as e:
+        log.error("Invalid config: %s", e)
+        return 1
+    if args.workers > 1 and args.shard is None:
+        run_workers(args.workers)
+        return
+    shard_count = max(args.workers, 1)
+    shard = args.shard or 0
+    install_profiling("forwarder")  # per worker, `profile` jobs of the poller
+    # Distinct client IDs per worker (AWS IoT drops the older connection on a duplicate)
+    suffix = f"-{shard}" if shard_count > 1 else ""
+
+    alerts = AlertDispatcher(config.discord_webhook_url, journal_path=JOURNAL_PATH.replace(".json", f"{suffix}.json"))
+    alerts.start()
+    aws = AwsConnection(AWS_ENDPOINT, AWS_PORT, CLIENT_ID + suffix, CA_PATH, CERT_PATH, KEY_PATH)
+    aws.start()
+    store = TimeSeriesStore(maintenance=shard == 0)
+    store.start()
+    trips = TripEngine()
+    trips.on_trip = publish_trip
+    trips.start()
+    zones = ZoneEngine(config.zones, config.zone_hysteresis_m)
+    zones.on_event = publish_zone_event
+    # One LAN API per gateway (worker 0); other shards' devices are read from the shared store
+    if shard == 0:
+        local_api = LocalApi(store, health=lambda: {"aws": aws.health()}, owns=owns, active_trip=trips.active,
+                             zones=zones.inside)
+        try:
+            local_api.start()
+        except OSError as e:
+            log.warning("Local API not started: %s", e)
+    else:
+        local_api = LocalApi(store, owns=owns)
+
+    def publish_backfill(remote_topic, data):
+        aws.wait_connected()  # hold batches instead of filling the offline queue
+        aws.publish(remote_topic, data)
+
+    backfill = BackfillUploader(publish_backfill, spool_dir=SPOOL_DIR + suffix)
+    backfill.start()
+
+    local_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="local-forwarder" + suffix,
+                               protocol=mqtt.MQTTv5)
     local_client.on_connect = on_local_connect
     local_client.on_message = on_local_message
+    shadows = DeviceShadows(
+        local_client,
+        uplink=lambda topic, payload, device: aws.publish(topic, payload, device=device),
+        path=SHADOW_PATH.replace(".json", f"{suffix}.json"),
+        owns=owns,
+    )
+    shadows.attach(local_client)
 
     local_client.connect(LOCAL_HOST, LOCAL_PORT, keepalive=60)
-    local_client.loop_forever()
+
+    status_relay = StatusRelay(local_client, [d for d in config.status_devices if owns(d)])
+    status_relay.on_change = lambda device, stolen: shadows.set_desired(device, stolen=stolen)
+    status_relay.start()
+    threading.Thread(target=reload_loop, name="config-reload", daemon=True).start()
+    signal.signal(signal.SIGHUP, lambda signum, frame: reload_requested.set())
+    heartbeat = HeartbeatPublisher(local_client, HEALTH_ID, "forwarder" + suffix, forwarder_health)
+    heartbeat.start()
+
+    try:
+        local_client.loop_forever()
+    finally:
+        heartbeat.stop()
+        status_relay.stop()
+        backfill.stop()
+        local_api.stop()
+        trips.stop()  # rides in progress are stored/queued before the store stops
+        store.stop()
+        alerts.stop()
+        aws.stop()
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
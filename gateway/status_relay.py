@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Stolen Status Relay for Gateway
+Polls /api/status once for all bikes and pushes the result to the local
+broker as a retained message on bike/<device>/status.
+
+- One persistent HTTPS session with ETag/If-None-Match (304 = no body)
+- Publishes immediately on change, otherwise re-publishes every
+  REPUBLISH_SEC so bikes can tell that the push channel is alive
+- Exponential backoff while the backend is unreachable
+"""
+
+import json
+import logging
+import threading
+import time
+
+import requests
+
+log = logging.getLogger(__name__)
+
+API_URL = "https://bike-api.dyntech.workers.dev"
+POLL_INTERVAL = 5  # seconds between conditional checks
+REPUBLISH_SEC = 60  # heartbeat re-publish of unchanged status
+MAX_BACKOFF = 300  # seconds
+
+
+class StatusRelay:
+    """Relays backend stolen status to the local broker for a set of devices"""
+
+    def __init__(self, local_client, devices, api_url=API_URL, poll_interval=POLL_INTERVAL):
+        self.client = local_client
+        self.devices = list(devices)
+        self.api_url = api_url
+        self.poll_interval = poll_interval
+        self._session = requests.Session()
+        self._etags = {}  # device -> ETag of last 200 response
+        self._status = {}  # device -> stolen flag
+        self._published = {}  # device -> time of last publish
+        self.on_change = None  # Optional callback(device, stolen)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _publish(self, device):
+        payload = {"device": device, "stolen": self._status[device], "ts": int(time.time() * 1000)}
+        self.client.publish(f"bike/{device}/status", json.dumps(payload), qos=1, retain=True)
+        self._published[device] = time.time()
+
+    def check(self, device):
+        """Conditional GET for one device; publishes on change or heartbeat"""
+        etag = self._etags.get(device)
+        response = self._session.get(
+            f"{self.api_url}/api/status",
+            params={"device": device},
+            headers={"If-None-Match": etag} if etag else {},
+            timeout=10
+        )
+        if response.status_code == 200:
+            self._etags[device] = response.headers.get("ETag")
+            stolen = bool(response.json().get("stolen", False))
+            if self._status.get(device) != stolen:
+                log.info("Status relay: %s stolen=%s", device, stolen)
+                self._status[device] = stolen
+                self._publish(device)
+                if self.on_change:
+                    self.on_change(device, stolen)
+                return
+        elif response.status_code != 304:
+            raise Exception(f"HTTP {response.status_code}")
+
+        if device in self._status and time.time() - self._published.get(device, 0) >= REPUBLISH_SEC:
+            self._publish(device)
+
+    def _run(self):
+        delay = self.poll_interval
+        while not self._stop.is_set():
+            try:
+                for device in self.devices:
+                    self.check(device)
+                delay = self.poll_interval
+            except Exception as e:
+                delay = min(delay * 2, MAX_BACKOFF)
+                log.warning("Status relay check failed: %s (retry in %ss)", e, delay)
+            self._stop.wait(delay)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="status-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._session.close()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Theft Alert Dispatcher for Gateway
+Sends Discord webhook alerts from its own thread, so the MQTT callback
+never waits on the webhook.
+
+- One entry per device: repeated reports while a theft is ongoing only
+  update the entry (coalescing), they never queue extra messages
+- First report -> alert; while the theft goes on, a location follow-up at
+  most every FOLLOWUP_INTERVAL_SEC if the bike moved since the last message
+- Failed posts back off exponentially per device (up to MAX_BACKOFF_SEC);
+  Discord 429 responses pause all posts for retry_after
+- Pending state and the lock position of every locked bike are kept in a
+  JSON journal (theft_alerts.json), so an alert that could not be delivered
+  survives a forwarder restart and the lock is not re-anchored at the bike's
+  position after it (which may already be the thief's)
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+log = logging.getLogger(__name__)
+
+JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "theft_alerts.json")
+FOLLOWUP_INTERVAL_SEC = 120
+MIN_BACKOFF_SEC = 5
+MAX_BACKOFF_SEC = 300
+FOLLOWUP_MIN_MOVE_M = 10  # skip follow-ups if the bike hasn't moved this far since the last message
+POLICE_LIGHT_URL = "https://em-content.zobj.net/thumbs/120/apple/354/police-car-light_1f6a8.png"
+
+
+def alert_payload(entry, followup):
+    lat, lon = entry["lat"], entry["lon"]
+    google_maps_url = f"https://www.google.com/maps?q={lat},{lon}"
+    if followup:
+        content = "📍 **Theft location update**"
+        title = f"🚴 Bike {entry['device']} is still moving"
+        description = (f"Now **{entry['distance']:.1f} meters** from the lock position "
+                       f"(alert since {datetime.fromtimestamp(entry['first_seen']):%H:%M:%S}).")
+    else:
+        content = "🚨 **BIKE THEFT ALERT!**"
+        title = f"🚴 Bike {entry['device']} moved while locked!"
+        description = f"The bike was moved **{entry['distance']:.1f} meters** while in lock mode."
+    return {
+        "content": content,
+        "embeds": [{
+            "title": title,
+            "description": description,
+            "color": 0xFF0000,
+            "fields": [
+                {
+                    "name": "📍 Current Location",
+                    "value": f"[{lat:.6f}, {lon:.6f}]({google_maps_url})",
+                    "inline": False
+                },
+                {
+                    "name": "📏 Distance Moved",
+                    "value": f"{entry['distance']:.1f} m",
+                    "inline": True
+                },
+                {
+                    "name": "⏰ Timestamp",
+                    "value": datetime.fromtimestamp(entry["seen"]).strftime("%Y-%m-%d %H:%M:%S"),
+                    "inline": True
+                }
+            ],
+            "thumbnail": {"url": POLICE_LIGHT_URL}
+        }]
+    }
+
+
+class AlertDispatcher:
+    """Queues, coalesces and delivers theft alerts per device"""
+
+    def __init__(self, webhook_url, journal_path=JOURNAL_PATH):
+        self.webhook_url = webhook_url
+        self.journal_path = journal_path
+        self._entries = {}  # device -> alert state (see report())
+        self._locks = {}  # device -> [lat, lon] where lockmode was activated
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._journal_dirty = False
+        self._paused_until = 0  # Discord rate limit
+        self._session = requests.Session()
+        self._thread = None
+        self._load()
+
+    # ---- Called from the MQTT callback (never blocks on I/O) ----
+    def report(self, device, lat, lon, distance):
+        """Bike moved while locked. First call raises an alert, later calls update it."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(device)
+            if entry is None:
+                entry = self._entries[device] = {
+                    "device": device, "first_seen": now, "alert_sent": False,
+                    "last_sent": 0, "sent_lat": None, "sent_lon": None,
+                    "attempts": 0, "next_attempt": 0,
+                }
+                self._journal_dirty = True
+                log.info("🚨 Theft alert queued for %s", device)
+            entry.update(lat=lat, lon=lon, distance=distance, seen=now)
+        self._wake.set()
+
+    def clear(self, device):
+        """Stop alerts/follow-ups for the device"""
+        with self._lock:
+            if self._entries.pop(device, None) is not None:
+                self._journal_dirty = True
+                log.info("Theft alerts cleared for %s", device)
+        self._wake.set()
+
+    def lock_position(self, device):
+        with self._lock:
+            position = self._locks.get(device)
+            return tuple(position) if position else None
+
+    def set_lock(self, device, lat, lon):
+        """Lockmode activated at (lat, lon); pending alerts of the device are kept"""
+        with self._lock:
+            self._locks[device] = [lat, lon]
+            self._journal_dirty = True
+        self._wake.set()  # journal is written by the dispatcher thread
+
+    def release_lock(self, device):
+        """Lockmode deactivated: forget the lock position and stop alerts/follow-ups"""
+        with self._lock:
+            if self._locks.pop(device, None) is not None:
+                self._journal_dirty = True
+        self.clear(device)
+
+    # ---- Journal ----
+    def _load(self):
+        try:
+            with open(self.journal_path) as f:
+                data = json.load(f)
+            if isinstance(data, list):  # older journals: alert entries only
+                data = {"alerts": data, "locks": {}}
+            self._entries = {e["device"]: e for e in data["alerts"]}
+            self._locks = {device: list(position) for device, position in data["locks"].items()}
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning("Ignoring unreadable alert journal: %s", e)
+            return
+        for entry in self._entries.values():
+            entry["next_attempt"] = 0
+        if self._entries:
+            log.info("Resuming theft alerts for %s", ', '.join(self._entries))
+
+    def _save(self):
+        with self._lock:
+            if not self._journal_dirty:
+                return
+            data = json.dumps({"alerts": list(self._entries.values()), "locks": self._locks})
+            self._journal_dirty = False
+        tmp = self.journal_path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.journal_path)
+        except OSError as e:
+            log.warning("Alert journal write failed: %s", e)
+
+    # ---- Delivery ----
+    def _due(self, now):
+        """Next (entry snapshot, followup) to send, and seconds until the next one is due"""
+        wait = None
+        with self._lock:
+            for entry in self._entries.values():
+                if entry["alert_sent"]:
+                    moved = _moved_since_sent(entry)
+                    if moved < FOLLOWUP_MIN_MOVE_M:
+                        continue
+                    due = max(entry["last_sent"] + FOLLOWUP_INTERVAL_SEC, entry["next_attempt"])
+                else:
+                    due = entry["next_attempt"]
+                due = max(due, self._paused_until)
+                if due <= now:
+                    return dict(entry), entry["alert_sent"], 0
+                wait = due - now if wait is None else min(wait, due - now)
+        return None, False, wait
+
+    def _post(self, payload):
+        """Returns (ok, retry_after seconds or None)"""
+        response = self._session.post(self.webhook_url, json=payload, timeout=5)
+        if response.status_code in (200, 204):
+            return True, None
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.json().get("retry_after", 1))
+            except ValueError:
+                retry_after = float(response.headers.get("Retry-After", 1))
+            return False, retry_after
+        log.warning("Webhook returned %s", response.status_code)
+        return False, None
+
+    def _deliver(self, snapshot, followup):
+        device = snapshot["device"]
+        try:
+            ok, retry_after = self._post(alert_payload(snapshot, followup))
+        except requests.RequestException as e:
+            log.warning("Webhook error: %s", e)
+            ok, retry_after = False, None
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(device)
+            if entry is None:  # cleared while sending
+                return
+            if ok:
+                entry.update(alert_sent=True, last_sent=now, attempts=0, next_attempt=0,
+                             sent_lat=snapshot["lat"], sent_lon=snapshot["lon"])
+                self._journal_dirty = True
+            elif retry_after is not None:
+                self._paused_until = now + retry_after
+            else:
+                entry["attempts"] += 1
+                entry["next_attempt"] = now + min(MIN_BACKOFF_SEC * 2 ** (entry["attempts"] - 1), MAX_BACKOFF_SEC)
+        if ok:
+            log.info("🚨 Theft %s sent for %s", 'update' if followup else 'alert', device)
+        elif retry_after is not None:
+            log.warning("Webhook rate limited, retrying in %.1fs", retry_after)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._save()
+            snapshot, followup, wait = self._due(time.time())
+            if snapshot:
+                self._deliver(snapshot, followup)
+                continue
+            self._wake.wait(wait)
+            self._wake.clear()
+        self._save()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="theft-alerts", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=6)
+        self._session.close()
+
+
+def _moved_since_sent(entry):
+    """Meters between the last sent and the current position (equirectangular, fine for short hops)"""
+    if entry["sent_lat"] is None:
+        return float("inf")
+    lat1, lon1 = math.radians(entry["sent_lat"]), math.radians(entry["sent_lon"])
+    lat2, lon2 = math.radians(entry["lat"]), math.radians(entry["lon"])
+    x = (lon2 - lon1) * math.cos((lat1 + lat2) / 2)
+    return math.hypot(x, lat2 - lat1) * 6371000
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Track Backfill for Gateway
+Bikes that were out of range upload the fixes they missed as compressed
+bulk messages on gateway/<device>/gps/bulk (see gps_pi/track_log.py).
+This module decodes them in the background, simplifies the track and
+sends it to AWS IoT as a few delta-encoded batch messages on
+sensors/<device>/gps/batch (see track_compress.py), so a reconnect neither
+blocks live forwarding nor floods IoT Core / DynamoDB.
+
+- The bike advances its upload cursor as soon as the broker acknowledges a
+  bulk, so the gateway is the only copy from then on: submit() writes each
+  bulk to the spool directory (one fsynced file, before the PUBACK) and the
+  file is deleted once all its batches are published. Spooled bulks are
+  uploaded after a forwarder restart, oldest first
+- The spool is bounded by MAX_SPOOL_MB (SD card), far above a full 2-day
+  track log of every bike; beyond that new bulks are dropped with a warning
+
+Bulk message layout:
+  BULK_HEADER (magic, version, record size, count) + zlib(records)
+  record: ts_ms, lat*1e7, lon*1e7, alt m, speed kn*100, course deg*100, sats, flags
+"""
+
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from track_compress import ERROR_BOUND_M, encode_track, simplify
+
+log = logging.getLogger(__name__)
+
+BULK_MAGIC = b"TRKB"
+BULK_HEADER = struct.Struct("<4sHHI")
+RECORD = struct.Struct("<QiihHHBB")
+FLAG_FIX = 0x01
+FLAG_LOCKMODE = 0x02
+
+BATCH_POINTS = 500  # max points per batch message to AWS
+BATCH_INTERVAL_SEC = 1  # pause between batch messages
+SPOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backfill_spool")
+MAX_SPOOL_MB = 200  # bulk messages waiting for replay (~10 KB each)
+RETRY_SEC = 30  # pause before a bulk whose upload failed is tried again
+
+
+def decode_bulk(payload):
+    """Decode one bulk message into a list of fix dicts (oldest first)"""
+    magic, version, record_size, count = BULK_HEADER.unpack_from(payload, 0)
+    if magic != BULK_MAGIC or version != 1 or record_size != RECORD.size:
+        raise ValueError(f"Unsupported bulk format: {magic!r} v{version} ({record_size} bytes)")
+    data = zlib.decompress(payload[BULK_HEADER.size:])
+    if len(data) != count * RECORD.size:
+        raise ValueError(f"Bulk size mismatch: {len(data)} bytes for {count} records")
+
+    points = []
+    for ts, lat, lon, alt, speed, course, sats, flags in RECORD.iter_unpack(data):
+        points.append({
+            "ts": ts,
+            "fix": bool(flags & FLAG_FIX),
+            "lat": lat / 1e7,
+            "lon": lon / 1e7,
+            "alt": alt,
+            "speed_kn": speed / 100,
+            "course_deg": course / 100,
+            "sats": sats,
+            "lockmode": bool(flags & FLAG_LOCKMODE),
+        })
+    return points
+
+
+class BackfillUploader:
+    """Simplifies decoded bulk points and uploads them as batches from a worker thread"""
+
+    def __init__(self, publish, spool_dir=SPOOL_DIR, error_bound=ERROR_BOUND_M):
+        self.publish = publish  # callable(remote_topic, payload_bytes)
+        self.spool_dir = spool_dir
+        self.error_bound = error_bound
+        self._queue = queue.Queue()  # spool file paths, oldest first
+        self._spooled = 0  # bytes in the spool directory
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(spool_dir, exist_ok=True)
+        for name in sorted(os.listdir(spool_dir)):
+            path = os.path.join(spool_dir, name)
+            if name.endswith(".tmp"):
+                os.remove(path)  # interrupted write, the bike did not get a PUBACK for it
+                continue
+            self._spooled += os.path.getsize(path)
+            self._queue.put(path)
+        if self._queue.qsize():
+            log.info("Backfill: %s spooled bulk messages from before the restart", self._queue.qsize())
+
+    def submit(self, device, remote_topic, payload):
+        """Spool one bulk message (called from the MQTT callback before the PUBACK, no network I/O)"""
+        try:
+            count = len(decode_bulk(payload))
+        except Exception as e:
+            log.warning("Invalid bulk message from %s: %s", device, e)
+            return
+        header = json.dumps({"device": device, "topic": remote_topic}).encode() + b"\n"
+        with self._lock:
+            if self._spooled + len(header) + len(payload) > MAX_SPOOL_MB * 1024 * 1024:
+                log.warning("Backfill spool full (%s MB), dropping %s points from %s", MAX_SPOOL_MB, count, device)
+                return
+            self._spooled += len(header) + len(payload)
+        path = os.path.join(self.spool_dir, f"{time.time_ns():020d}.bulk")
+        try:
+            with open(path + ".tmp", "wb") as f:
+                f.write(header + payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            log.warning("Backfill spool write failed, dropping %s points from %s: %s", count, device, e)
+            with self._lock:
+                self._spooled -= len(header) + len(payload)
+            return
+        self._queue.put(path)
+        log.info("Backfill queued: %s points from %s", count, device)
+
+    @property
+    def pending(self):
+        """Bulk messages waiting to be uploaded"""
+        return self._queue.qsize()
+
+    def _upload(self, path):
+        """Publish the batches of one spooled bulk; False if it has to be tried again"""
+        with open(path, "rb") as f:
+            header, payload = f.read().split(b"\n", 1)
+        meta = json.loads(header)
+        device, remote_topic = meta["device"], meta["topic"]
+        points = decode_bulk(payload)
+        kept = simplify([p for p in points if p["fix"]], self.error_bound)
+        for i in range(0, len(kept), BATCH_POINTS):
+            chunk = kept[i:i + BATCH_POINTS]
+            record = {"device": device, "ts": chunk[0]["ts"], "batch": True, "enc": encode_track(chunk)}
+            try:
+                self.publish(remote_topic, json.dumps(record, separators=(",", ":")).encode())
+            except Exception as e:
+                log.warning("Backfill publish failed, retrying %s in %ss: %s", device, RETRY_SEC, e)
+                return False  # batches are keyed by ts, sending some of them twice is harmless
+            if self._stop.wait(BATCH_INTERVAL_SEC):
+                return False  # kept in the spool, resumed after the restart
+        log.info("Backfill done: %s points from %s, %s kept", len(points), device, len(kept))
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                path = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                done = self._upload(path)
+            except (OSError, ValueError, KeyError, struct.error, zlib.error) as e:
+                log.warning("Dropping unreadable backfill spool file %s: %s", path, e)
+                done = True
+            if not done:
+                self._queue.put(path)
+                self._stop.wait(RETRY_SEC)
+                continue
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                size = 0
+            with self._lock:
+                self._spooled -= size
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="backfill", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Track Compression for Gateway
+Reduces GPS tracks before they are sent to AWS IoT / DynamoDB.
+
+1. Streaming simplification (online Douglas-Peucker, opening window):
+   a point is only kept when dropping it would move the track by more than
+   ERROR_BOUND_M. Straight rides shrink to a handful of points, turns and
+   lock changes are preserved.
+2. Compact encoding for batches (backfill uploads):
+   fixed-point coordinates (1e-6 deg, ~0.1 m) stored as deltas and
+   timestamps stored as delta-of-delta, so a steady 1 Hz track encodes to
+   mostly small integers.
+
+Batch message (sensors/<device>/gps/batch):
+  {"device": "pi9", "ts": <first ts>, "batch": true,
+   "enc": {"v": 1, "n": 3, "t": [t0, dt1, ddt2], "lat": [lat0, d1, d2],
+           "lon": [lon0, d1, d2], "spd": [kn*10, ...]}}
+"""
+
+import math
+
+ERROR_BOUND_M = 5.0  # max deviation of the simplified track (meters)
+MAX_WINDOW = 120  # max buffered points before a point is forced out
+COORD_SCALE = 1_000_000  # fixed-point scale for coordinates (1e-6 deg)
+EARTH_RADIUS = 6371000
+
+
+def _project(origin, point):
+    """Local equirectangular projection around origin, in meters"""
+    lat0 = math.radians(origin["lat"])
+    x = math.radians(point["lon"] - origin["lon"]) * math.cos(lat0) * EARTH_RADIUS
+    y = math.radians(point["lat"] - origin["lat"]) * EARTH_RADIUS
+    return x, y
+
+
+def _segment_distance(p, a, b):
+    """Distance from p to segment a-b (all 2D tuples, meters)"""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return math.hypot(p[0] - a[0], p[1] - a[1])
+    t = max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length2))
+    return math.hypot(p[0] - a[0] - t * dx, p[1] - a[1] - t * dy)
+
+
+class TrackSimplifier:
+    """Online track simplification for one device.
+
+    push() returns the points that became final (possibly none). The last
+    kept point is the anchor; points after it are buffered until a new
+    point shows that the straight line anchor->new no longer covers them.
+    """
+
+    def __init__(self, error_bound=ERROR_BOUND_M, max_window=MAX_WINDOW):
+        self.error_bound = error_bound
+        self.max_window = max_window
+        self.anchor = None
+        self.buffer = []
+
+    def _covers(self, point):
+        a = (0.0, 0.0)
+        b = _project(self.anchor, point)
+        return all(
+            _segment_distance(_project(self.anchor, p), a, b) <= self.error_bound
+            for p in self.buffer
+        )
+
+    def _keep(self, point, out):
+        out.append(point)
+        self.anchor = point
+        self.buffer = []
+
+    def push(self, point, force=False):
+        """Add a fix (dict with lat/lon/ts). force=True keeps this point (e.g. heartbeat)."""
+        out = []
+        if self.anchor is None:
+            self._keep(point, out)
+            return out
+
+        semantic_change = point.get("lockmode") != self.anchor.get("lockmode")
+        if self.buffer and (not self._covers(point) or len(self.buffer) >= self.max_window):
+            # The previous point is the last one the straight segment could represent
+            self._keep(self.buffer[-1], out)
+
+        if force or semantic_change:
+            self._keep(point, out)
+        else:
+            self.buffer.append(point)
+        return out
+
+    def flush(self):
+        """Emit the last buffered point (end of ride / shutdown)"""
+        out = []
+        if self.buffer:
+            self._keep(self.buffer[-1], out)
+        return out
+
+
+def simplify(points, error_bound=ERROR_BOUND_M):
+    """Simplify a complete list of fixes (oldest first)"""
+    simplifier = TrackSimplifier(error_bound)
+    out = []
+    for point in points:
+        out.extend(simplifier.push(point))
+    out.extend(simplifier.flush())
+    return out
+
+
+def compact_fix(record):
+    """Fixed-point rounding for single uplink messages; drops the raw NMEA text"""
+    out = {k: v for k, v in record.items() if k != "nmea"}
+    for key in ("lat", "lon"):
+        if isinstance(out.get(key), float):
+            out[key] = round(out[key], 6)
+    for key in ("speed_kn", "course_deg", "alt", "hdop"):
+        if isinstance(out.get(key), float):
+            out[key] = round(out[key], 1)
+    return out
+
+
+def _deltas(values):
+    return [values[0]] + [b - a for a, b in zip(values, values[1:])] if values else []
+
+
+def _undelta(values):
+    out, acc = [], 0
+    for v in values:
+        acc += v
+        out.append(acc)
+    return out
+
+
+def encode_track(points):
+    """Encode fixes (oldest first) as delta / delta-of-delta integer arrays"""
+    dts = _deltas([int(p["ts"]) for p in points])  # [t0, t1-t0, t2-t1, ...]
+    return {
+        "v": 1,
+        "n": len(points),
+        "t": dts[:1] + _deltas(dts[1:]),  # [t0, dt1, dt2-dt1, ...]
+        "lat": _deltas([round(p["lat"] * COORD_SCALE) for p in points]),
+        "lon": _deltas([round(p["lon"] * COORD_SCALE) for p in points]),
+        "spd": [round((p.get("speed_kn") or 0) * 10) for p in points],
+    }
+
+
+def decode_track(enc):
+    """Inverse of encode_track, returns fixes oldest first"""
+    t = enc["t"]
+    ts = _undelta(t[:1] + _undelta(t[1:]))
+    lats = _undelta(enc["lat"])
+    lons = _undelta(enc["lon"])
+    return [
+        {"ts": ts[i], "fix": True, "lat": lats[i] / COORD_SCALE, "lon": lons[i] / COORD_SCALE,
+         "speed_kn": enc["spd"][i] / 10}
+        for i in range(enc["n"])
+    ]
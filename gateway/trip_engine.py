@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Streaming Trip Segmentation for Gateway
+Splits each device's live fixes into rides and stops as they arrive and
+keeps running ride statistics, so consumers fetch one summary per ride
+instead of downloading and reprocessing the raw track.
+
+- A ride starts with the first fix at MOVING_KMH or faster (at the fix
+  before it, where the bike was standing)
+- It ends after STOP_DWELL_SEC below MOVING_KMH, or when no fix arrived
+  for GAP_SEC (bike switched off). The ride ends at its last moving fix,
+  so the dwell time and the GPS jitter while standing are not counted
+- Rides below MIN_RIDE_M or MIN_RIDE_SEC are dropped (parking jitter,
+  pushing the bike around)
+- Fixes implying more than MAX_SPEED_KMH are GPS glitches and skipped
+- O(1) work and memory per fix: running counters and the last fix only;
+  state of devices that went quiet is released
+
+Trip summary (one flat dict per ride):
+  {"device": "pi9", "ts": <end ts>, "start_ts", "end_ts", "duration_s",
+   "moving_s", "distance_m", "avg_speed_kmh", "max_speed_kmh",
+   "start_lat", "start_lon", "end_lat", "end_lon",
+   "bbox": [min_lat, min_lon, max_lat, max_lon], "fixes": n}
+
+Only live fixes are segmented; fixes older than the device's last one
+(backfill uploads) are ignored. A ride in progress is lost on a forwarder
+restart, the next moving fix starts a new one.
+"""
+
+import logging
+import math
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+MOVING_KMH = 5.0  # at or above: riding
+STOP_DWELL_SEC = 180  # this long below MOVING_KMH ends the ride
+GAP_SEC = 300  # no fix for this long ends the ride (bike off / out of range)
+MIN_RIDE_M = 200
+MIN_RIDE_SEC = 60
+MAX_SPEED_KMH = 100  # implied speed between two fixes above this: glitch
+IDLE_CHECK_SEC = 30
+EARTH_RADIUS = 6371000
+KN_TO_KMH = 1.852
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Equirectangular distance (accurate to well below a meter between consecutive fixes)"""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * EARTH_RADIUS
+
+
+class TripSegmenter:
+    """Ride/stop state machine for one device"""
+
+    def __init__(self, device):
+        self.device = device
+        self.last = None  # (ts ms, lat, lon) of the last accepted fix
+        self.ride = None  # running statistics while riding
+        self._pending_m = 0.0  # distance since the last moving fix (dropped if the ride ends)
+        self._pending_fixes = 0  # slow fixes since the last moving fix
+        self._slow_since = None  # ts of the first slow fix in a row
+
+    def push(self, fix):
+        """Feed one fix with a position; returns a trip summary when a ride ended"""
+        ts, lat, lon = int(fix["ts"]), fix["lat"], fix["lon"]
+        if self.last and ts <= self.last[0]:
+            return None  # duplicate or out of order (backfill)
+
+        summary = None
+        if self.last and ts - self.last[0] > GAP_SEC * 1000:
+            summary = self.finish()
+            self.last = None
+
+        step = dt = 0
+        if self.last:
+            dt = (ts - self.last[0]) / 1000
+            step = distance_m(self.last[1], self.last[2], lat, lon)
+            if step / dt * 3.6 > MAX_SPEED_KMH:
+                return summary
+        speed = fix.get("speed_kn")
+        speed_kmh = speed * KN_TO_KMH if speed is not None else (step / dt * 3.6 if dt else 0.0)
+        moving = speed_kmh >= MOVING_KMH
+
+        if self.ride is None and moving:
+            start = self.last or (ts, lat, lon)
+            self.ride = {
+                "start_ts": start[0], "start_lat": start[1], "start_lon": start[2],
+                "end_ts": start[0], "end_lat": start[1], "end_lon": start[2],
+                "distance_m": 0.0, "moving_s": 0.0, "max_speed_kmh": 0.0, "fixes": 1,
+                "bbox": [start[1], start[2], start[1], start[2]],
+            }
+        ride = self.ride
+        if ride is not None:
+            if moving:
+                ride["distance_m"] += self._pending_m + step
+                ride["fixes"] += self._pending_fixes + 1
+                ride["moving_s"] += dt
+                ride["max_speed_kmh"] = max(ride["max_speed_kmh"], speed_kmh)
+                ride.update(end_ts=ts, end_lat=lat, end_lon=lon)
+                bbox = ride["bbox"]
+                bbox[:] = [min(bbox[0], lat), min(bbox[1], lon), max(bbox[2], lat), max(bbox[3], lon)]
+                self._pending_m = 0.0
+                self._pending_fixes = 0
+                self._slow_since = None
+            else:
+                self._pending_m += step
+                self._pending_fixes += 1
+                self._slow_since = self._slow_since or ts
+                if ts - self._slow_since >= STOP_DWELL_SEC * 1000:
+                    summary = self.finish()
+
+        self.last = (ts, lat, lon)
+        return summary
+
+    def summary(self, ride):
+        duration = (ride["end_ts"] - ride["start_ts"]) / 1000
+        return {
+            "device": self.device,
+            "ts": ride["end_ts"],
+            "start_ts": ride["start_ts"],
+            "end_ts": ride["end_ts"],
+            "duration_s": round(duration),
+            "moving_s": round(ride["moving_s"]),
+            "distance_m": round(ride["distance_m"]),
+            "avg_speed_kmh": round(ride["distance_m"] / duration * 3.6, 1) if duration else 0.0,
+            "max_speed_kmh": round(ride["max_speed_kmh"], 1),
+            "start_lat": round(ride["start_lat"], 6),
+            "start_lon": round(ride["start_lon"], 6),
+            "end_lat": round(ride["end_lat"], 6),
+            "end_lon": round(ride["end_lon"], 6),
+            "bbox": [round(v, 6) for v in ride["bbox"]],
+            "fixes": ride["fixes"],
+        }
+
+    def current(self):
+        """Summary of the ride in progress (None while standing)"""
+        return self.summary(self.ride) if self.ride else None
+
+    def finish(self):
+        """End the ride in progress; returns its summary unless it was too short"""
+        ride, self.ride = self.ride, None
+        self._pending_m = 0.0
+        self._pending_fixes = 0
+        self._slow_since = None
+        if ride is None:
+            return None
+        summary = self.summary(ride)
+        if summary["distance_m"] < MIN_RIDE_M or summary["duration_s"] < MIN_RIDE_SEC:
+            return None
+        return summary
+
+
+class TripEngine:
+    """Segments all devices' fixes; calls on_trip(device, summary) for every finished ride"""
+
+    def __init__(self):
+        self.on_trip = None  # Optional callback(device, summary)
+        self._devices = {}  # device -> TripSegmenter
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def push(self, device, fix):
+        """Feed a live fix (called by the forwarder for every GPS message)"""
+        if not (fix.get("fix") and fix.get("lat") and fix.get("lon") and fix.get("ts")):
+            return
+        with self._lock:
+            segmenter = self._devices.get(device)
+            if segmenter is None:
+                segmenter = self._devices[device] = TripSegmenter(device)
+            summary = segmenter.push(fix)
+        if summary:
+            self._emit(device, summary)
+
+    def active(self, device):
+        with self._lock:
+            segmenter = self._devices.get(device)
+            return segmenter.current() if segmenter else None
+
+    def check_idle(self, now_ms=None):
+        """End rides of devices without fixes for GAP_SEC and release their state"""
+        now_ms = now_ms or int(time.time() * 1000)
+        finished = []
+        with self._lock:
+            for device, segmenter in list(self._devices.items()):
+                if segmenter.last and now_ms - segmenter.last[0] > GAP_SEC * 1000:
+                    summary = segmenter.finish()
+                    if summary:
+                        finished.append((device, summary))
+                    del self._devices[device]
+        for device, summary in finished:
+            self._emit(device, summary)
+
+    def _emit(self, device, summary):
+        log.info("Trip %s: %.1f km in %d min, max %.0f km/h", device, summary["distance_m"] / 1000,
+                 summary["duration_s"] // 60, summary["max_speed_kmh"])
+        if self.on_trip:
+            try:
+                self.on_trip(device, summary)
+            except Exception as e:
+                log.warning("Trip callback failed for %s: %s", device, e)
+
+    def _run(self):
+        while not self._stop.wait(IDLE_CHECK_SEC):
+            self.check_idle()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="trip-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """End every ride in progress (e.g. on shutdown) and stop the idle check"""
+        self._stop.set()
+        with self._lock:
+            finished = [(d, s.finish()) for d, s in self._devices.items()]
+            self._devices.clear()
+        for device, summary in finished:
+            if summary:
+                self._emit(device, summary)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Time-Series Store for Gateway
+Keeps every reading the forwarder sees (before rate limiting / track
+simplification) in a local SQLite database in WAL mode.
+
+- add() only enqueues; a writer thread inserts in batched transactions
+- Rows are keyed (device, kind, ts), so each device's day is one
+  contiguous key range and range queries never scan other devices
+- Retention: raw rows are kept RAW_RETENTION_DAYS, then downsampled to one
+  row per device/kind/minute (last reading, count, max speed) that is kept
+  ROLLUP_RETENTION_DAYS
+
+Topic -> (device, kind):
+  gateway/pi9/gps       -> ("pi9", "gps")
+  gateway/pi9/gps/bulk  -> ("pi9", "gps")  one row per decoded point
+  gps                   -> ("pi9", "gps")  legacy
+  gateway/pi9/trip      -> ("pi9", "trip")  ride summaries (trip_engine)
+  gateway/pi9/zone      -> ("pi9", "zone")  geofence enter/exit/dwell events
+  bike/light            -> ("light", "brightness")
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from track_backfill import decode_bulk
+
+log = logging.getLogger(__name__)
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "readings.db")
+RAW_RETENTION_DAYS = 7
+ROLLUP_RETENTION_DAYS = 180
+ROLLUP_BUCKET_MS = 60_000
+MAINTENANCE_INTERVAL_SEC = 3600
+BATCH_SIZE = 500  # rows per transaction
+FLUSH_INTERVAL_SEC = 1.0
+MAX_QUEUE = 20000  # readings waiting for the writer (dropped beyond, never blocks MQTT)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    device TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    fix INTEGER,
+    lat REAL,
+    lon REAL,
+    speed_kn REAL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (device, kind, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup (
+    device TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    fix INTEGER,
+    lat REAL,
+    lon REAL,
+    speed_max REAL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (device, kind, bucket)
+) WITHOUT ROWID;
+"""
+
+
+def split_topic(topic):
+    """Map a local topic to (device, kind)"""
+    if topic.startswith("gateway/"):
+        parts = topic.split("/", 2)
+        if len(parts) == 3:
+            kind = parts[2]
+            return parts[1], "gps" if kind == "gps/bulk" else kind
+    if topic == "gps":
+        return "pi9", "gps"
+    if topic == "bike/light":
+        return "light", "brightness"
+    return "unknown", topic
+
+
+def _row(device, kind, received_ms, data):
+    """Build a readings row from a decoded payload (dict or plain string)"""
+    if isinstance(data, dict):
+        ts = int(data.get("ts") or received_ms)
+        fix = data.get("fix")
+        lat = data.get("lat")
+        lon = data.get("lon", data.get("long"))
+        return (device, kind, ts, None if fix is None else int(bool(fix)),
+                lat if fix else None, lon if fix else None, data.get("speed_kn"),
+                json.dumps(data, separators=(",", ":")))
+    return (device, kind, received_ms, None, None, None, None, json.dumps({"value": data}))
+
+
+class TimeSeriesStore:
+    """Embedded store of all forwarded readings (SQLite WAL, batched writer thread)"""
+
+    def __init__(self, path=DB_PATH, maintenance=True):
+        self.path = path
+        self.maintenance = maintenance  # False for all but one process sharing the file
+        self._queue = queue.Queue(maxsize=MAX_QUEUE)
+        self._stop = threading.Event()
+        self._local = threading.local()
+        self._thread = None
+        self.dropped = 0
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL: durable at checkpoints, fewer SD card syncs
+        return conn
+
+    def _reader(self):
+        """Per-thread read connection (WAL readers don't block the writer)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            conn.row_factory = sqlite3.Row
+        return conn
+
+    # ---- Writing ----
+    def add(self, topic, payload, received=None):
+        """Enqueue one raw MQTT message (called from the MQTT callback, never blocks)"""
+        try:
+            self._queue.put_nowait((topic, payload, received or time.time()))
+        except queue.Full:
+            self.dropped += 1
+
+    @property
+    def pending(self):
+        """Readings waiting for the writer thread"""
+        return self._queue.qsize()
+
+    def _rows(self, topic, payload, received):
+        device, kind = split_topic(topic)
+        received_ms = int(received * 1000)
+        if topic.endswith("/gps/bulk"):
+            return [_row(device, kind, received_ms, {"device": device, **p}) for p in decode_bulk(payload)]
+        try:
+            data = json.loads(payload)
+        except (ValueError, UnicodeDecodeError):
+            data = payload.decode(errors="replace") if isinstance(payload, bytes) else str(payload)
+        return [_row(device, kind, received_ms, data)]
+
+    def _write(self, conn, batch):
+        rows = []
+        for topic, payload, received in batch:
+            try:
+                rows.extend(self._rows(topic, payload, received))
+            except Exception as e:
+                log.warning("Store: skipping %s: %s", topic, e)
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO readings VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _run(self):
+        conn = self._connect()
+        next_maintenance = time.time() + 60
+        while not self._stop.is_set():
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=FLUSH_INTERVAL_SEC))
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                try:
+                    self._write(conn, batch)
+                except sqlite3.Error as e:
+                    log.warning("Store write failed: %s", e)
+            if self.maintenance and time.time() >= next_maintenance:
+                self.maintain(conn)
+                next_maintenance = time.time() + MAINTENANCE_INTERVAL_SEC
+        conn.close()
+
+    def maintain(self, conn):
+        """Downsample raw rows past retention into per-minute rollups, drop expired rows"""
+        now_ms = int(time.time() * 1000)
+        raw_cutoff = now_ms - RAW_RETENTION_DAYS * 86400_000
+        raw_cutoff -= raw_cutoff % ROLLUP_BUCKET_MS  # whole buckets only, a rollup row is never rewritten
+        rollup_cutoff = now_ms - ROLLUP_RETENTION_DAYS * 86400_000
+        try:
+            with conn:
+                # Count and max speed per bucket in one pass, then the last reading of
+                # each bucket by primary key (device, kind, max(ts))
+                conn.execute("""
+                    INSERT OR REPLACE INTO rollup
+                    SELECT b.device, b.kind, b.bucket, r.ts, b.n, r.fix, r.lat, r.lon, b.max_speed, r.payload
+                    FROM (SELECT device, kind, ts / ? * ? AS bucket, max(ts) AS last_ts, count(*) AS n,
+                                 max(speed_kn) AS max_speed
+                          FROM readings WHERE ts < ?
+                          GROUP BY device, kind, bucket) b
+                    JOIN readings r ON r.device = b.device AND r.kind = b.kind AND r.ts = b.last_ts
+                """, (ROLLUP_BUCKET_MS, ROLLUP_BUCKET_MS, raw_cutoff))
+                moved = conn.execute("DELETE FROM readings WHERE ts < ?", (raw_cutoff,)).rowcount
+                expired = conn.execute("DELETE FROM rollup WHERE bucket < ?", (rollup_cutoff,)).rowcount
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if moved or expired:
+                log.info("Store maintenance: %s rows downsampled, %s rollups expired", moved, expired)
+        except sqlite3.Error as e:
+            log.warning("Store maintenance failed: %s", e)
+
+    # ---- Reading ----
+    def latest(self, device, kind="gps", valid_fix=False):
+        """Newest reading (payload dict) for a device, optionally the newest with a fix"""
+        sql = "SELECT payload FROM readings WHERE device = ? AND kind = ?"
+        if valid_fix:
+            sql += " AND fix = 1 AND lat IS NOT NULL AND lon IS NOT NULL"
+        row = self._reader().execute(sql + " ORDER BY ts DESC LIMIT 1", (device, kind)).fetchone()
+        return json.loads(row["payload"]) if row else None
+
+    def range(self, device, kind="gps", since=None, until=None, limit=100, newest_first=True):
+        """Readings in (since, until], raw rows first, rollups for older periods"""
+        since = since if since is not None else 0
+        until = until if until is not None else 2 ** 62
+        order = "DESC" if newest_first else "ASC"
+        rows = self._reader().execute(f"""
+            SELECT ts, payload FROM (
+                SELECT ts, payload FROM readings WHERE device = ? AND kind = ? AND ts > ? AND ts <= ?
+                UNION ALL
+                SELECT ts, payload FROM rollup WHERE device = ? AND kind = ? AND ts > ? AND ts <= ?
+            ) ORDER BY ts {order} LIMIT ?
+        """, (device, kind, since, until, device, kind, since, until, limit)).fetchall()
+        return [json.loads(row["payload"]) for row in rows]
+
+    # ---- Lifecycle ----
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="ts-store", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Daemon logging setup (same file in gateway/, gps_pi/ and light_pi/)
+Non-blocking, structured, rate-aware logging for the long-running scripts.
+
+- Callers only put records on a bounded queue (QueueHandler); one listener
+  thread formats and writes them. A full queue drops records (counted),
+  it never blocks the caller
+- Lazy formatting: use log.info("x=%s", x). The message is only built by
+  the listener, and not at all if the record is filtered out
+- Output as logfmt (default, readable in journalctl) or JSON lines;
+  extra={"key": value} fields become structured fields
+- Per-category rate limits (token bucket per logger + message template) and
+  sampling (every n-th record); suppressed counts are reported with the next
+  record that passes
+
+Usage:
+  from daemon_log import setup_logging
+  log = setup_logging("forwarder", limits={"forward": (1, 5)}, sample={"fix": 60})
+  logging.getLogger("forwarder.forward").info("Forwarding %s", topic)
+
+Environment: LOG_LEVEL (INFO), LOG_FORMAT (logfmt|json)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+QUEUE_SIZE = 10000
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener and drops on overflow"""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Keep msg/args as they are (formatted by the listener thread).
+        # Tracebacks are rendered now, the frames are gone later.
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per (logger, message template) for configured categories.
+
+    limits: {"category": (records_per_sec, burst)}, where a category is a
+    logger name suffix, e.g. "forward" matches "forwarder.forward".
+    sample: {"category": n} keeps every n-th record of the category.
+    """
+
+    def __init__(self, limits=None, sample=None):
+        super().__init__()
+        self.limits = limits or {}
+        self.sample = sample or {}
+        self._buckets = {}  # (logger, msg) -> [tokens, last time, suppressed]
+        self._counters = {}  # (logger, msg) -> records seen (sampling)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _category(name):
+        return name.rsplit(".", 1)[-1]
+
+    def filter(self, record):
+        category = self._category(record.name)
+        key = (record.name, record.msg)
+        with self._lock:
+            every = self.sample.get(category)
+            if every:
+                seen = self._counters.get(key, 0)
+                self._counters[key] = seen + 1
+                if seen % every:
+                    return False
+                if every > 1:
+                    record.sampled = every
+
+            limit = self.limits.get(category)
+            if not limit:
+                return True
+            rate, burst = limit
+            now = time.monotonic()
+            bucket = self._buckets.setdefault(key, [burst, now, 0])
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD_ATTRS and not k.startswith("_")}
+
+
+class LogfmtFormatter(logging.Formatter):
+    def format(self, record):
+        parts = [
+            f"ts={self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            f"level={record.levelname.lower()}",
+            f"logger={record.name}",
+            f"msg={_quote(record.getMessage())}",
+        ]
+        parts += [f"{k}={_quote(v)}" for k, v in _fields(record).items()]
+        if record.exc_text:
+            parts.append(f"exc={_quote(record.exc_text)}")
+        return " ".join(parts)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        data.update(_fields(record))
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+def _quote(value):
+    text = str(value)
+    if not text or any(c in text for c in ' ="\n'):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+def setup_logging(name, level=None, fmt=None, limits=None, sample=None, stream=None):
+    """Route all logging through one queue + listener thread; returns logger `name`"""
+    level = level or os.environ.get("LOG_LEVEL", "INFO")
+    fmt = fmt or os.environ.get("LOG_FORMAT", "logfmt")
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else LogfmtFormatter())
+
+    handler = NonBlockingQueueHandler(queue.Queue(QUEUE_SIZE))
+    handler.addFilter(RateLimitFilter(limits, sample))
+    listener = logging.handlers.QueueListener(handler.queue, output)
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    listener.start()
+
+    def shutdown():
+        listener.stop()  # flushes what is queued
+        if handler.dropped:
+            output.stream.write(f"level=warning msg=\"{handler.dropped} log records dropped (queue full)\"\n")
+
+    atexit.register(shutdown)
+    return logging.getLogger(name)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Device state sync for Pi9 (shadow client)
+Counterpart of gateway/device_shadow.py over the local broker.
+
+- Receives the retained delta on bike/<device>/shadow/delta: desired values
+  that differ from what this Pi reported (e.g. {"stolen": true})
+- report(**state) publishes reported values on bike/<device>/shadow/update,
+  only for keys whose value changed since the last report
+- After a reconnect the full reported state is sent once, so the gateway
+  is in sync again without any polling
+"""
+
+import json
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class DeviceStateSync:
+    """Reports local state and applies desired-state deltas for one device"""
+
+    def __init__(self, device):
+        self.device = device
+        self.delta_topic = f"bike/{device}/shadow/delta"
+        self.update_topic = f"bike/{device}/shadow/update"
+        self.on_delta = None  # Optional callback(state dict)
+
+        self._client = None
+        self._reported = {}  # last values sent to the gateway
+        self._state = {}  # current local values
+        self._lock = threading.Lock()
+
+    def attach(self, client):
+        """Route deltas of the given paho client here. Call subscribe() from on_connect."""
+        self._client = client
+        client.message_callback_add(self.delta_topic, self.on_message)
+
+    def subscribe(self, client):
+        client.subscribe(self.delta_topic, qos=1)
+        with self._lock:
+            self._reported = {}  # resend everything on the new connection
+        self.report()
+
+    def on_message(self, client, userdata, msg):
+        try:
+            state = json.loads(msg.payload.decode()).get("state") or {}
+        except Exception as e:
+            log.warning("[Shadow] Invalid delta: %s", e)
+            return
+        if state and self.on_delta:
+            log.info("[Shadow] Delta: %s", state)
+            self.on_delta(state)
+
+    def report(self, **state):
+        """Record local state; publish the keys that differ from the last report"""
+        with self._lock:
+            self._state.update(state)
+            changed = {k: v for k, v in self._state.items() if self._reported.get(k, object()) != v}
+            if not changed or self._client is None:
+                return
+            self._reported.update(changed)
+        payload = json.dumps({"state": {"reported": changed}})
+        info = self._client.publish(self.update_topic, payload, qos=1)
+        if info.rc != 0:
+            with self._lock:
+                for key in changed:
+                    self._reported.pop(key, None)  # not sent, retry with the next report
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+GPS pipeline benchmarks (dev box, no hardware or broker needed)
+
+1. parse:   sentences/second through FixAssembler (NMEA parsing + cycle merge)
+2. e2e:     synthetic ride replayed through a pty into GpsDaemon.run() with a
+            recording MQTT stand-in; reports fix-to-publish latency (time the
+            last sentence of a cycle was written -> publish call) and CPU time
+            of the daemon thread per fix
+
+Usage:
+  python3 bench_gps.py                 # both, default sizes
+  python3 bench_gps.py parse --sentences 200000
+  python3 bench_gps.py e2e --seconds 300 --speed 50
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import gps_daemon  # noqa: E402
+from nmea_replay import NmeaReplay, synthetic_ride  # noqa: E402
+
+
+class RecordingClient:
+    """paho stand-in: records the publish time of every message"""
+
+    class Info:
+        rc = 0
+
+        def wait_for_publish(self, timeout=None):
+            pass
+
+        def is_published(self):
+            return True
+
+    def __init__(self):
+        self.published = []  # (perf_counter, topic, payload)
+
+    def publish(self, topic, payload, qos=0, retain=False, properties=None):
+        self.published.append((time.perf_counter(), topic, payload))
+        return self.Info()
+
+
+def bench_parse(sentences):
+    lines = synthetic_ride(sentences // 2 + 1)[:sentences]
+    assembler = gps_daemon.FixAssembler()
+    fixes = 0
+    start = time.perf_counter()
+    for line in lines:
+        fixes += len(assembler.feed(line))
+    elapsed = time.perf_counter() - start
+    print(f"parse: {len(lines)} sentences, {fixes} fixes in {elapsed:.3f}s "
+          f"-> {len(lines) / elapsed:,.0f} sentences/s, {elapsed / max(fixes, 1) * 1e6:.1f} us/fix")
+
+
+def bench_e2e(seconds, speed):
+    replay = NmeaReplay(synthetic_ride(seconds), speed=speed)
+    client = RecordingClient()
+    daemon = gps_daemon.GpsDaemon(port=replay.port)
+    daemon.outputs.append(gps_daemon.MqttOutput(client))
+
+    cpu = {}
+
+    def run():
+        cpu["start"] = time.thread_time()
+        daemon.run()  # logging is not set up here, so the daemon stays quiet
+        cpu["end"] = time.thread_time()
+
+    worker = threading.Thread(target=run, name="gps-daemon")
+    worker.start()
+    time.sleep(0.2)  # let the daemon open the port before data flows
+    replay.start()
+    replay.done.wait()
+    time.sleep(0.5)  # drain
+    daemon.running = False
+    worker.join()
+    replay.stop()
+
+    latencies = []
+    for published_at, topic, payload in client.published:
+        record = json.loads(payload)
+        written_at = replay.written.get(record.get("nmea"))
+        if record.get("fix") and written_at:
+            latencies.append((published_at - written_at) * 1000)
+
+    fixes = len(latencies)
+    if not fixes:
+        print("e2e: no fixes published")
+        return
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    cpu_per_fix = (cpu["end"] - cpu["start"]) / fixes * 1e6
+    print(f"e2e: {replay.sentences} sentences, {fixes} fixes published at {speed}x")
+    print(f"     fix-to-publish latency ms: median {statistics.median(latencies):.3f}, "
+          f"p95 {p95:.3f}, max {latencies[-1]:.3f}")
+    print(f"     daemon CPU per fix: {cpu_per_fix:.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GPS pipeline benchmarks")
+    parser.add_argument("which", nargs="?", choices=["parse", "e2e", "all"], default="all")
+    parser.add_argument("--sentences", type=int, default=100000, help="sentences for the parse benchmark")
+    parser.add_argument("--seconds", type=int, default=120, help="ride length for the e2e benchmark")
+    parser.add_argument("--speed", type=float, default=20, help="replay speed factor for e2e")
+    args = parser.parse_args()
+
+    if args.which in ("parse", "all"):
+        bench_parse(args.sentences)
+    if args.which in ("e2e", "all"):
+        bench_e2e(args.seconds, args.speed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
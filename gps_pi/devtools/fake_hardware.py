@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Hardware stand-ins for running the GPS Pi code on a dev box
+Registers minimal replacements for board, busio, digitalio, adafruit_ssd1306
+and RPi.GPIO in sys.modules. They record what the code does (frames pushed,
+contrast changes, edge callbacks) instead of touching hardware.
+
+Usage:
+  python3 fake_hardware.py ../GpsTransmitter.py --port /dev/pts/N --mqtt-host localhost
+
+or from Python:
+  import fake_hardware; fake_hardware.install()
+  fake_hardware.GPIO.press(4)  # simulate a button press
+"""
+
+import os
+import runpy
+import sys
+import types
+
+
+# ---- board / busio / digitalio ----
+board = types.ModuleType("board")
+for _name in ("D24", "D25", "D26", "MOSI", "SCK", "MISO"):
+    setattr(board, _name, _name)
+
+busio = types.ModuleType("busio")
+digitalio = types.ModuleType("digitalio")
+
+
+class SPI:
+    def __init__(self, clock, MOSI=None, MISO=None):
+        self.pins = (clock, MOSI, MISO)
+
+
+class DigitalInOut:
+    def __init__(self, pin):
+        self.pin = pin
+        self.value = False
+
+
+busio.SPI = SPI
+digitalio.DigitalInOut = DigitalInOut
+
+
+# ---- adafruit_ssd1306 ----
+adafruit_ssd1306 = types.ModuleType("adafruit_ssd1306")
+
+
+class SSD1306_SPI:
+    """Records frames instead of sending them over SPI"""
+
+    instances = []
+
+    def __init__(self, width, height, spi, dc=None, reset=None, cs=None):
+        self.width, self.height = width, height
+        self.frame = None
+        self.shows = 0
+        self.contrast_value = 255
+        SSD1306_SPI.instances.append(self)
+
+    def image(self, img):
+        self.frame = img
+
+    def show(self):
+        self.shows += 1
+
+    def contrast(self, value):
+        self.contrast_value = value
+
+    def fill(self, value):
+        pass
+
+
+adafruit_ssd1306.SSD1306_SPI = SSD1306_SPI
+
+
+# ---- RPi.GPIO ----
+RPi = types.ModuleType("RPi")
+GPIO = types.ModuleType("RPi.GPIO")
+GPIO.BCM, GPIO.BOARD = 11, 10
+GPIO.IN, GPIO.OUT = 1, 0
+GPIO.PUD_UP, GPIO.PUD_DOWN, GPIO.PUD_OFF = 22, 21, 20
+GPIO.FALLING, GPIO.RISING, GPIO.BOTH = 32, 31, 33
+GPIO.HIGH, GPIO.LOW = 1, 0
+GPIO._levels = {}
+GPIO._callbacks = {}
+
+
+def _setup(pin, mode, pull_up_down=None, initial=None):
+    GPIO._levels[pin] = 1 if pull_up_down == GPIO.PUD_UP else 0
+
+
+def _add_event_detect(pin, edge, callback=None, bouncetime=None):
+    GPIO._callbacks[pin] = callback
+
+
+def _press(pin):
+    """Simulate a button press: falling edge on pin"""
+    callback = GPIO._callbacks.get(pin)
+    if callback:
+        callback(pin)
+
+
+GPIO.setmode = lambda mode: None
+GPIO.setwarnings = lambda flag: None
+GPIO.setup = _setup
+GPIO.input = lambda pin: GPIO._levels.get(pin, 0)
+GPIO.output = lambda pin, value: GPIO._levels.__setitem__(pin, value)
+GPIO.add_event_detect = _add_event_detect
+GPIO.remove_event_detect = lambda pin: GPIO._callbacks.pop(pin, None)
+GPIO.cleanup = lambda *args: GPIO._callbacks.clear()
+GPIO.press = _press
+RPi.GPIO = GPIO
+
+
+def install():
+    """Register the stand-ins (only for modules not already imported)"""
+    for name, module in {
+        "board": board,
+        "busio": busio,
+        "digitalio": digitalio,
+        "adafruit_ssd1306": adafruit_ssd1306,
+        "RPi": RPi,
+        "RPi.GPIO": GPIO,
+    }.items():
+        sys.modules.setdefault(name, module)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return 1
+    install()
+    script = sys.argv[1]
+    sys.argv = sys.argv[1:]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    runpy.run_path(script, run_name="__main__")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
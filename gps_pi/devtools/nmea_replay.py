@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+NMEA Replay for the GPS Pi
+Feeds a recorded NMEA log (or a synthetic ride) through a pseudo-terminal,
+so the GPS daemon can read it like /dev/ttyS0 on any Linux box.
+
+- Cycles (sentences with the same UTC time) are written 1 s apart,
+  divided by --speed (e.g. --speed 10 replays ten times faster)
+- --speed 0 writes as fast as the reader consumes
+
+Usage:
+  python3 nmea_replay.py ride.nmea --speed 5
+  python3 nmea_replay.py --synthetic 600 --loop
+  # then in another shell:
+  python3 ../gps_daemon.py --headless --port /dev/pts/N
+"""
+
+import argparse
+import math
+import os
+import pty
+import sys
+import threading
+import time
+import tty
+from datetime import datetime, timedelta, timezone
+from functools import reduce
+
+
+def with_checksum(body):
+    checksum = reduce(lambda acc, ch: acc ^ ch, body.encode("ascii"), 0)
+    return f"${body}*{checksum:02X}"
+
+
+def _dm(value, pos, neg, deg_digits):
+    hemi = pos if value >= 0 else neg
+    value = abs(value)
+    deg = int(value)
+    minutes = (value - deg) * 60
+    return f"{deg:0{deg_digits}d}{minutes:07.4f}", hemi
+
+
+def synthetic_ride(seconds, lat=47.049, lon=8.305, start=None):
+    """RMC+GGA sentences for a ride: loops around a ~500 m circle at varying speed"""
+    start = start or datetime(2025, 12, 1, 8, 0, 0, tzinfo=timezone.utc)
+    lines = []
+    heading = 0.0
+    for i in range(seconds):
+        t = start + timedelta(seconds=i)
+        speed_kn = 8 + 4 * math.sin(i / 30)  # 8 +/- 4 kn (~15 km/h)
+        step = speed_kn * 0.514  # meters this second
+        heading = (heading + 0.7) % 360
+        lat += step * math.cos(math.radians(heading)) / 111320
+        lon += step * math.sin(math.radians(heading)) / (111320 * math.cos(math.radians(lat)))
+
+        hhmmss = t.strftime("%H%M%S") + ".00"
+        lat_dm, ns = _dm(lat, "N", "S", 2)
+        lon_dm, ew = _dm(lon, "E", "W", 3)
+        lines.append(with_checksum(
+            f"GPRMC,{hhmmss},A,{lat_dm},{ns},{lon_dm},{ew},{speed_kn:.2f},{heading:.1f},{t:%d%m%y},,,A"))
+        lines.append(with_checksum(
+            f"GPGGA,{hhmmss},{lat_dm},{ns},{lon_dm},{ew},1,08,0.9,436.2,M,47.3,M,,"))
+    return lines
+
+
+def group_cycles(lines):
+    """Group sentences by their UTC time field (one GPS cycle each)"""
+    cycles, current, current_time = [], [], None
+    for line in lines:
+        parts = line.split(",")
+        cycle_time = parts[1] if len(parts) > 1 else None
+        if current and cycle_time != current_time:
+            cycles.append(current)
+            current = []
+        current.append(line)
+        current_time = cycle_time
+    if current:
+        cycles.append(current)
+    return cycles
+
+
+class NmeaReplay:
+    """Writes NMEA cycles into a pty; readers open self.port like a serial device"""
+
+    def __init__(self, lines, speed=1.0, loop=False):
+        self.cycles = group_cycles(lines)
+        self.speed = speed
+        self.loop = loop
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.written = {}  # sentence -> time.perf_counter() when written (for latency benchmarks)
+        self.sentences = 0
+        self.done = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _write_cycle(self, cycle):
+        for line in cycle:
+            data = (line + "\r\n").encode("ascii")
+            view = memoryview(data)
+            self.written[line] = time.perf_counter()  # stamped before the reader can see it
+            while view:
+                n = os.write(self.master, view)
+                view = view[n:]
+            self.sentences += 1
+
+    def _run(self):
+        interval = 1.0 / self.speed if self.speed else 0
+        next_at = time.perf_counter()
+        while not self._stop.is_set():
+            for cycle in self.cycles:
+                if self._stop.is_set():
+                    break
+                if interval:
+                    delay = next_at - time.perf_counter()
+                    if delay > 0:
+                        self._stop.wait(delay)
+                    next_at += interval
+                self._write_cycle(cycle)
+            if not self.loop:
+                break
+        self.done.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="nmea-replay", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def load_lines(path):
+    with open(path, encoding="ascii", errors="ignore") as f:
+        return [line.strip() for line in f if line.startswith("$")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay NMEA through a pseudo-terminal")
+    parser.add_argument("log", nargs="?", help="recorded NMEA log (one sentence per line)")
+    parser.add_argument("--synthetic", type=int, metavar="SECONDS", help="generate a synthetic ride instead")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor (0 = as fast as possible)")
+    parser.add_argument("--loop", action="store_true", help="restart at the end of the log")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        lines = synthetic_ride(args.synthetic)
+    elif args.log:
+        lines = load_lines(args.log)
+    else:
+        parser.error("give a log file or --synthetic SECONDS")
+
+    replay = NmeaReplay(lines, args.speed, args.loop).start()
+    print(f"Replaying {len(replay.cycles)} cycles on {replay.port} (speed {args.speed}x). CTRL+C to stop.")
+    try:
+        while not replay.done.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        replay.stop()
+        print(f"Wrote {replay.sentences} sentences")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
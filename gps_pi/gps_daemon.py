@@ -0,0 +1,724 @@
+#!/usr/bin/env python3
+"""
+Unified GPS daemon for Pi9
+Replaces the two overlapping programs GpsTransmitter.py and mqtt_gps_reader.py
+(both are now thin entry points into this module).
+
+- One serial reader on /dev/ttyS0, each NMEA sentence is parsed exactly once
+- RMC and GGA of the same GPS cycle are merged into one fix
+- One payload schema on gateway/pi9/gps (lat/lon, alt, speed_kn, course_deg, ...)
+- Pluggable outputs: MQTT publisher, OLED, local JSON-lines log
+- Every valid fix is kept in an on-device track log (track_log.py); fixes that
+  could not be delivered are uploaded as compressed bulk messages on reconnect
+- MQTT v5: topic alias for the 1 Hz fix topic, message expiry so stale fixes
+  aren't delivered after an outage, device/ts as user properties
+- Lockmode and stolen are synced with the gateway's device shadow
+  (device_state.py): reported on change, desired values applied from deltas
+- Hardware modules (OLED, lock button) are optional, so it can run headless
+- Logging through daemon_log (queued, structured); the per-fix line is sampled
+- `profile` jobs of the poller can sample it remotely (daemon_profile)
+- Heartbeat on health/<device>/gps_daemon (fix quality, track log backlog),
+  aggregated by the gateway (heartbeat.py)
+- Fast startup: MQTT connects asynchronously, the serial loop starts at once,
+  OLED/button/log are initialised in parallel in the background and a
+  missing peripheral (or GPS port) degrades the daemon instead of killing it
+
+Usage:
+  python3 gps_daemon.py                          # MQTT + OLED + lock button
+  python3 gps_daemon.py --headless               # MQTT only
+  python3 gps_daemon.py --log /home/pi/gps.jsonl # additionally log every fix
+"""
+
+import time
+
+PROCESS_START = time.monotonic()  # before the heavier imports, for startup timing
+
+import argparse
+import json
+import logging
+import math
+import os
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+
+import paho.mqtt.client as mqtt
+import serial
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from daemon_log import setup_logging
+from daemon_profile import install as install_profiling
+from device_state import DeviceStateSync
+from heartbeat import HeartbeatPublisher
+from status_subscriber import StatusSubscriber
+from track_log import RECORD_SIZE, TrackLog, encode_bulk, undelivered
+
+log = logging.getLogger("gps_daemon")
+fix_log = logging.getLogger("gps_daemon.fix")  # 1 Hz, sampled (FIX_LOG_SAMPLE)
+output_log = logging.getLogger("gps_daemon.output")  # output errors repeat per fix, rate limited
+
+# ---- CONFIG ----
+GPS_PORT = "/dev/ttyS0"
+BAUD = 9600
+DEVICE_ID = "pi9"
+
+MQTT_HOST = "172.30.2.50"
+MQTT_PORT = 1883
+MQTT_TOPIC = "gateway/pi9/gps"  # Topic forwarded to AWS by the forwarder
+LOCK_TOPIC = "gateway/pi9/lock"  # Out-of-band lock state changes
+LIGHT_TOPIC = "bike/light"  # Ambient brightness from Light Pi
+BULK_TOPIC = "gateway/pi9/gps/bulk"  # Compressed backfill of fixes missed while offline
+
+TRACK_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "track_log.bin")
+BULK_RECORDS = 900  # records per bulk message (15 min at 1 Hz, ~10 KB compressed)
+
+FIX_EXPIRY_SEC = 30  # live fixes older than this are not delivered (the bulk upload covers gaps)
+LOCK_EXPIRY_SEC = 3600
+
+STATUS_API = "https://bike-api.dyntech.workers.dev/api/status"
+STATUS_CHECK_INTERVAL = 10  # seconds between API checks (only without gateway push)
+
+NO_FIX_PUBLISH_SEC = 2  # publish fix=false at least this often when no sentences arrive
+SERIAL_RETRY_SEC = 5  # retry interval while the GPS port is missing
+
+FIX_LOG_SAMPLE = 60  # log every n-th published fix (once a minute at 1 Hz)
+
+BUTTON_PIN = 4
+BUTTON_BOUNCE_MS = 300  # debounce handled by RPi.GPIO
+
+
+# ---- NMEA Parsing ----
+def dm_to_deg(dm, direction):
+    """Convert NMEA ddmm.mmmm / dddmm.mmmm to signed decimal degrees"""
+    if not dm or "." not in dm or len(dm) < 4:
+        return None
+    try:
+        deg_len = dm.index(".") - 2
+        val = int(dm[:deg_len]) + float(dm[deg_len:]) / 60.0
+    except ValueError:
+        return None
+    return -val if direction in ("S", "W") else val
+
+
+def _float(value):
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _int(value):
+    return int(value) if value.isdigit() else None
+
+
+def nmea_checksum_ok(line):
+    """Validate the *hh checksum (sentences without checksum are accepted)"""
+    body, sep, checksum = line[1:].partition("*")
+    if not sep:
+        return True
+    try:
+        expected = int(checksum[:2], 16)
+    except ValueError:
+        return False
+    return reduce(lambda acc, ch: acc ^ ch, body.encode("ascii", "ignore"), 0) == expected
+
+
+def parse_sentence(line):
+    """Parse one NMEA sentence of any talker ($GP, $GN, ...).
+    Returns (kind, fields) for RMC and GGA, otherwise None."""
+    if len(line) < 7 or line[0] != "$" or not nmea_checksum_ok(line):
+        return None
+    parts = line.split("*", 1)[0].split(",")
+    kind = parts[0][3:]
+
+    if kind == "RMC" and len(parts) >= 10:
+        fix = parts[2] == "A"
+        return kind, {
+            "time": parts[1],
+            "fix": fix,
+            "lat": dm_to_deg(parts[3], parts[4]) if fix else None,
+            "lon": dm_to_deg(parts[5], parts[6]) if fix else None,
+            "speed_kn": _float(parts[7]),
+            "course_deg": _float(parts[8]),
+        }
+
+    if kind == "GGA" and len(parts) >= 10:
+        fix = (_int(parts[6]) or 0) > 0
+        return kind, {
+            "time": parts[1],
+            "fix": fix,
+            "lat": dm_to_deg(parts[2], parts[3]) if fix else None,
+            "lon": dm_to_deg(parts[4], parts[5]) if fix else None,
+            "sats": _int(parts[7]),
+            "hdop": _float(parts[8]),
+            "alt": _float(parts[9]),
+        }
+
+    return None
+
+
+# ---- Haversine Distance (meters) ----
+def distance(a, b):
+    if not a or not b:
+        return 0
+    lat1, lon1 = a
+    lat2, lon2 = b
+    R = 6371000
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = math.radians(lat2 - lat1), math.radians(lon2 - lon1)
+    x = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * R * math.atan2(math.sqrt(x), math.sqrt(1 - x))
+
+
+class FixAssembler:
+    """Merges the sentences of one GPS cycle (same UTC time) into a single fix.
+
+    A cycle is complete as soon as every sentence type seen in the previous
+    cycle has arrived, so modules sending RMC+GGA and modules sending only
+    RMC both produce one fix per second without waiting for the next cycle.
+    """
+
+    def __init__(self):
+        self._expected = {"RMC", "GGA"}
+        self._time = None
+        self._seen = set()
+        self._fields = {}
+        self._last_pos = None
+        self._last_t = None
+
+    def feed(self, line):
+        """Feed one NMEA line. Returns the list of completed fixes (usually empty or one)."""
+        parsed = parse_sentence(line)
+        if not parsed:
+            return []
+        kind, fields = parsed
+        cycle_time = fields.pop("time")
+
+        done = []
+        if self._seen and cycle_time != self._time:
+            # Cycle ended without all expected sentences: learn what the module sends
+            self._expected = set(self._seen)
+            done.append(self._complete())
+
+        self._time = cycle_time
+        self._seen.add(kind)
+        fix = fields.pop("fix")
+        self._fields["fix"] = self._fields.get("fix", True) and fix
+        for key, value in fields.items():
+            if value is not None:
+                self._fields[key] = value
+        self._fields["nmea"] = line
+
+        if self._seen >= self._expected:
+            done.append(self._complete())
+        return done
+
+    def _complete(self):
+        fields, self._fields, self._seen = self._fields, {}, set()
+        now = time.time()
+        fix = {"ts": int(now * 1000), "fix": fields.pop("fix", False)}
+        if not fix["fix"] or fields.get("lat") is None or fields.get("lon") is None:
+            fields.pop("lat", None)
+            fields.pop("lon", None)
+            fix["fix"] = False
+        fix.update(fields)
+
+        # Derive speed from consecutive fixes if the module did not report it
+        if fix["fix"]:
+            pos = (fix["lat"], fix["lon"])
+            if "speed_kn" not in fix and self._last_pos and now > self._last_t:
+                kmh = distance(self._last_pos, pos) / (now - self._last_t) * 3.6
+                fix["speed_kn"] = kmh / 1.852
+            self._last_pos, self._last_t = pos, now
+        return fix
+
+
+# ---- Outputs ----
+class MqttOutput:
+    """Publishes every fix to the gateway and lock changes out-of-band.
+
+    With a track log, every valid fix is also stored locally. Fixes whose
+    live publish failed (broker unreachable) are uploaded in bulk after the
+    next (re)connect instead of being replayed one message per second.
+    """
+
+    def __init__(self, client, topic=MQTT_TOPIC, lock_topic=LOCK_TOPIC, track_log=None, bulk_topic=BULK_TOPIC):
+        self.client = client
+        self.topic = topic
+        self.lock_topic = lock_topic
+        self.track_log = track_log
+        self.bulk_topic = bulk_topic
+        self._backfill = None
+        self._first_published = False
+        self._alias_max = 0  # Topic Alias Maximum of the current connection (0 = no aliases)
+        self._aliases = {}  # topic -> alias, valid for the current connection only
+        self.start_backfill()  # Leftovers from before a restart
+
+    def _publish(self, topic, payload, qos, record=None, expiry=None):
+        """Publish with MQTT v5 properties. QoS 0 topics get an alias: the first
+        message sends topic + alias, later ones only the alias. (QoS 1 messages are
+        never aliased, paho re-sends them after a reconnect where aliases are reset.)
+        An alias counts as established only once the publish carrying the full topic
+        succeeded; any failed publish forgets all aliases (the connection is gone or
+        going, the broker resets them), as does every (re)connect."""
+        properties = Properties(PacketTypes.PUBLISH)
+        if record:
+            properties.UserProperty = [(key, str(record[key])) for key in ("device", "ts") if key in record]
+        if expiry:
+            properties.MessageExpiryInterval = expiry
+        aliases = self._aliases  # replaced (not cleared) on connect/disconnect by the MQTT thread
+        new_alias = None
+        sent_topic = topic
+        if qos == 0 and self._alias_max:
+            alias = aliases.get(topic)
+            if alias:
+                properties.TopicAlias = alias
+                sent_topic = ""
+            elif len(aliases) < self._alias_max:
+                properties.TopicAlias = new_alias = len(aliases) + 1
+        info = self.client.publish(sent_topic, payload, qos=qos, properties=properties)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self._aliases = {}
+        elif new_alias:
+            aliases[topic] = new_alias
+        return info
+
+    def handle_fix(self, record):
+        payload = json.dumps(record)
+        info = self._publish(self.topic, payload, 0, record, FIX_EXPIRY_SEC)
+        fix_log.info("Published payload: %s", payload)
+        if record["fix"] and not self._first_published and info.rc == mqtt.MQTT_ERR_SUCCESS:
+            self._first_published = True
+            log.info("[Startup] First fix published %.2fs after start", time.monotonic() - PROCESS_START)
+        if self.track_log and record["fix"]:
+            delivered = info.rc == mqtt.MQTT_ERR_SUCCESS
+            seq = self.track_log.append(record, delivered)
+            # Only advance while nothing is pending, otherwise the backfill owns the cursor
+            # (and skips this record, it is flagged as delivered)
+            if delivered and self.track_log.uploaded == seq:
+                self.track_log.mark_uploaded(seq + 1)
+
+    def handle_event(self, name, record):
+        if name == "lock":
+            self._publish(self.lock_topic, json.dumps(record), 1, record, LOCK_EXPIRY_SEC)
+        elif name == "connected":
+            self._aliases = {}
+            self._alias_max = record.get("topic_alias_max", 0)
+            self.start_backfill()
+        elif name == "disconnected":
+            self._alias_max = 0
+            self._aliases = {}
+
+    def start_backfill(self):
+        if not self.track_log or (self._backfill and self._backfill.is_alive()):
+            return
+        start, end = self.track_log.pending()
+        if start >= end:
+            return
+        self._backfill = threading.Thread(target=self._upload_pending, name="backfill", daemon=True)
+        self._backfill.start()
+
+    def _upload_pending(self):
+        """Upload missed fixes in BULK_RECORDS chunks (QoS 1), stop on the first failure"""
+        sent = 0
+        while True:
+            start, end = self.track_log.pending()
+            if start >= end:
+                break
+            end = min(end, start + BULK_RECORDS)
+            records = undelivered(self.track_log.read(start, end))
+            if not records:
+                self.track_log.mark_uploaded(end)
+                continue
+            try:
+                info = self._publish(self.bulk_topic, encode_bulk(records), 1, {"device": self.bulk_topic.split("/")[1]})
+                info.wait_for_publish(timeout=30)
+            except Exception as e:
+                log.warning("[Backfill] Upload failed: %s", e)
+                return
+            if not info.is_published():
+                log.warning("[Backfill] Upload not acknowledged, retrying after next reconnect")
+                return
+            self.track_log.mark_uploaded(end)
+            sent += len(records) // RECORD_SIZE
+        if sent:
+            log.info("[Backfill] Uploaded %s missed fixes", sent)
+
+    def close(self):
+        if self._backfill:
+            self._backfill.join(timeout=1)
+        if self.track_log:
+            self.track_log.close()
+
+
+class LogOutput:
+    """Appends every fix as one JSON line to a local file"""
+
+    def __init__(self, path):
+        self.file = open(path, "a", buffering=1)
+
+    def handle_fix(self, record):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def handle_event(self, name, record):
+        pass
+
+    def close(self):
+        self.file.close()
+
+
+class OledOutput:
+    """Drives the OLED from its own thread so refreshes are decoupled from the GPS rate"""
+
+    def __init__(self, daemon):
+        import busio
+        import digitalio
+        import adafruit_ssd1306
+        from board import D24, D25, D26, MOSI, SCK
+
+        from oled_display import DisplayRenderer
+
+        spi = busio.SPI(SCK, MOSI)
+        self.display = adafruit_ssd1306.SSD1306_SPI(
+            64, 48, spi,
+            dc=digitalio.DigitalInOut(D24), reset=digitalio.DigitalInOut(D25), cs=digitalio.DigitalInOut(D26)
+        )
+        self.renderer = DisplayRenderer(self.display)
+        self.daemon = daemon
+        self.speed_kmh = 0
+        self.contrast = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="oled", daemon=True)
+        self._thread.start()
+
+    def handle_fix(self, record):
+        self.speed_kmh = record.get("speed_kn", 0) * 1.852 if record["fix"] else 0
+        self._wake.set()
+
+    def handle_event(self, name, record):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(timeout=1)
+            self._wake.clear()
+            contrast = self.daemon.contrast
+            if contrast != self.contrast:
+                self.display.contrast(contrast)
+                self.contrast = contrast
+            self.renderer.show(self.daemon.stolen, self.daemon.locked, self.speed_kmh)
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+
+
+class LockButton:
+    """Edge-triggered lock toggle button on BUTTON_PIN"""
+
+    def __init__(self, daemon, pin=BUTTON_PIN):
+        import RPi.GPIO as GPIO
+
+        self.GPIO = GPIO
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        GPIO.add_event_detect(pin, GPIO.FALLING, callback=lambda channel: daemon.toggle_lock(),
+                              bouncetime=BUTTON_BOUNCE_MS)
+
+    def close(self):
+        self.GPIO.cleanup()
+
+
+# ---- Daemon ----
+class GpsDaemon:
+    """Reads the GPS once and fans every fix out to all configured outputs"""
+
+    def __init__(self, port=GPS_PORT, baud=BAUD, device=DEVICE_ID):
+        self.port = port
+        self.baud = baud
+        self.device = device
+        self.outputs = []
+        self.modules = []  # Hardware modules needing cleanup (button)
+        self.running = True
+        self._lock = threading.Lock()
+        self._locked = False
+        self._brightness = "unknown"
+        self._contrast = 255
+        self.status = None
+        self.state_sync = None
+        self.track_log = None  # set when the MQTT output keeps one (heartbeat backlog)
+        self._last_fix = {}
+
+    # ---- Shared state (thread-safe) ----
+    @property
+    def locked(self):
+        with self._lock:
+            return self._locked
+
+    @property
+    def contrast(self):
+        with self._lock:
+            return self._contrast
+
+    @property
+    def stolen(self):
+        return self.status.stolen if self.status else False
+
+    def toggle_lock(self):
+        """Called from the GPIO thread on a button press"""
+        with self._lock:
+            locked = not self._locked
+        log.info("[Button] Lockmode %s", 'ON' if locked else 'OFF')
+        self.set_locked(locked)
+
+    def set_locked(self, locked):
+        with self._lock:
+            if self._locked == locked:
+                return
+            self._locked = locked
+        self.emit("lock", {"device": self.device, "ts": int(time.time() * 1000), "lockmode": locked})
+        if self.state_sync:
+            self.state_sync.report(lockmode=locked)
+
+    def apply_delta(self, state):
+        """Desired state from the gateway shadow that differs from what we reported"""
+        if "lockmode" in state:
+            log.info("[Shadow] Remote lockmode %s", 'ON' if state['lockmode'] else 'OFF')
+            self.set_locked(bool(state["lockmode"]))
+        if "stolen" in state and self.status:
+            self.status.set_pushed(bool(state["stolen"]))
+        self.state_sync.report(lockmode=self.locked, stolen=self.stolen)
+
+    def set_brightness(self, brightness):
+        with self._lock:
+            self._brightness = brightness
+            if brightness == "dark":
+                self._contrast = 0  # Low contrast for dark conditions
+            elif brightness == "bright":
+                self._contrast = 255  # High contrast for bright conditions
+        log.info("[MQTT] Stored ambient brightness: %s", brightness)
+        self.emit("brightness", {"brightness": brightness})
+
+    def health(self):
+        """Heartbeat fields: quality of the newest fix and the not yet uploaded track log records"""
+        with self._lock:
+            fix = self._last_fix
+        fields = {"fix": fix.get("fix", False), "sats": fix.get("sats"),
+                  "hdop": round(fix["hdop"], 1) if fix.get("hdop") is not None else None}
+        if self.track_log:
+            start, end = self.track_log.pending()
+            fields["track_backlog"] = end - start
+        return fields
+
+    # ---- Fan-out ----
+    def add_output(self, output):
+        """Attach an output while the main loop runs (list is replaced under the lock, never
+        mutated, so readers iterate a snapshot; start_peripherals adds outputs in parallel)"""
+        with self._lock:
+            self.outputs = self.outputs + [output]
+
+    def add_module(self, module):
+        """Attach a hardware module for cleanup (same scheme as add_output)"""
+        with self._lock:
+            self.modules = self.modules + [module]
+
+    def emit(self, name, record):
+        for output in self.outputs:
+            try:
+                output.handle_event(name, record)
+            except Exception as e:
+                output_log.warning("Output %s failed on %s: %s", type(output).__name__, name, e)
+
+    def dispatch(self, fix):
+        with self._lock:
+            self._last_fix = fix
+            record = {
+                "device": self.device,
+                **fix,
+                "lockmode": self._locked,
+                "brightness": self._brightness,  # from Light Pi
+            }
+        for output in self.outputs:
+            try:
+                output.handle_fix(record)
+            except Exception as e:
+                output_log.warning("Output %s failed: %s", type(output).__name__, e)
+
+    # ---- MQTT ----
+    def connect_mqtt(self, host=MQTT_HOST, port=MQTT_PORT):
+        self.status = StatusSubscriber(self.device, STATUS_API, poll_interval=STATUS_CHECK_INTERVAL)
+        self.state_sync = DeviceStateSync(self.device)
+        self.state_sync.on_delta = self.apply_delta
+        self.state_sync.report(lockmode=self.locked, stolen=False)
+
+        def on_stolen(stolen):
+            self.emit("stolen", {"stolen": stolen})
+            self.state_sync.report(stolen=stolen)
+
+        self.status.on_change = on_stolen
+
+        def on_connect(client, userdata, flags, reason_code, properties):
+            log.info("Connected to MQTT broker with result code %s", reason_code)
+            client.subscribe(LIGHT_TOPIC)
+            self.status.subscribe(client)
+            self.state_sync.subscribe(client)
+            self.emit("connected", {"topic_alias_max": getattr(properties, "TopicAliasMaximum", 0)})
+
+        def on_disconnect(client, userdata, flags, reason_code, properties):
+            self.emit("disconnected", {})
+
+        def on_light(client, userdata, msg):
+            self.set_brightness(msg.payload.decode(errors="ignore"))
+
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"{self.device}-gps", protocol=mqtt.MQTTv5)
+        client.on_connect = on_connect
+        client.on_disconnect = on_disconnect
+        client.message_callback_add(LIGHT_TOPIC, on_light)
+        self.status.attach(client)
+        self.state_sync.attach(client)
+        client.connect_async(host, port, 60)  # Connect in the background, don't block startup
+        client.loop_start()  # Start background thread for MQTT
+        self.status.start()
+        self.mqtt_client = client
+        return client
+
+    # ---- Main loop ----
+    def open_serial(self):
+        try:
+            return serial.Serial(self.port, self.baud, timeout=1)
+        except (serial.SerialException, OSError) as e:
+            log.warning("GPS port %s unavailable (%s), retrying in %ss", self.port, e, SERIAL_RETRY_SEC)
+            return None
+
+    def run(self):
+        assembler = FixAssembler()
+        ser = None
+        retry_at = 0
+        last_dispatch = time.time()
+        try:
+            while self.running:
+                raw = b""
+                if ser is None and time.time() >= retry_at:
+                    ser = self.open_serial()
+                    retry_at = time.time() + SERIAL_RETRY_SEC
+                if ser is None:
+                    time.sleep(1)  # degraded: no GPS module, keep sending fix=false
+                else:
+                    try:
+                        raw = ser.readline()
+                    except (serial.SerialException, OSError) as e:
+                        log.warning("GPS port read failed (%s), reopening", e)
+                        ser.close()
+                        ser = None
+
+                if raw:
+                    for fix in assembler.feed(raw.decode("ascii", errors="ignore").strip()):
+                        self.dispatch(fix)
+                        last_dispatch = time.time()
+
+                # Always send something so the UI updates even without GPS data
+                if time.time() - last_dispatch >= NO_FIX_PUBLISH_SEC:
+                    self.dispatch({"ts": int(time.time() * 1000), "fix": False})
+                    last_dispatch = time.time()
+        finally:
+            if ser:
+                ser.close()
+
+    def close(self):
+        for output in self.outputs:
+            try:
+                output.close()
+            except Exception as e:
+                log.warning("Closing %s failed: %s", type(output).__name__, e)
+        for module in self.modules:
+            module.close()
+        if self.status:
+            self.status.stop()
+        if getattr(self, "mqtt_client", None):
+            self.mqtt_client.loop_stop()
+            self.mqtt_client.disconnect()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Unified GPS daemon")
+    parser.add_argument("--port", default=GPS_PORT, help="serial port of the GPS module")
+    parser.add_argument("--baud", type=int, default=BAUD)
+    parser.add_argument("--device", default=DEVICE_ID)
+    parser.add_argument("--mqtt-host", default=MQTT_HOST)
+    parser.add_argument("--mqtt-port", type=int, default=MQTT_PORT)
+    parser.add_argument("--headless", action="store_true", help="no OLED and no lock button")
+    parser.add_argument("--no-oled", action="store_true")
+    parser.add_argument("--no-button", action="store_true")
+    parser.add_argument("--log", metavar="PATH", help="append every fix as JSON line to PATH")
+    parser.add_argument("--track-log", metavar="PATH", default=TRACK_LOG_PATH,
+                        help="ring file for offline fixes (bulk upload on reconnect)")
+    parser.add_argument("--no-track-log", action="store_true")
+    return parser.parse_args(argv)
+
+
+def start_peripherals(daemon, args):
+    """Initialise the independent optional subsystems in parallel, in the background.
+    Each one attaches itself when ready; a failing one is skipped (degraded mode)."""
+    tasks = {}
+    if args.log:
+        tasks["log"] = lambda: daemon.add_output(LogOutput(args.log))
+    if not (args.headless or args.no_oled):
+        tasks["OLED"] = lambda: daemon.add_output(OledOutput(daemon))
+    if not (args.headless or args.no_button):
+        tasks["button"] = lambda: daemon.add_module(LockButton(daemon))
+
+    def init(name, task):
+        started = time.monotonic()
+        try:
+            task()
+            log.info("[Startup] %s ready in %.2fs", name, time.monotonic() - started)
+        except Exception as e:
+            log.warning("[Startup] %s unavailable (%s: %s), continuing without it", name, type(e).__name__, e)
+
+    pool = ThreadPoolExecutor(max_workers=max(len(tasks), 1), thread_name_prefix="init")
+    for name, task in tasks.items():
+        pool.submit(init, name, task)
+    pool.shutdown(wait=False)
+    return pool
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging("gps_daemon", limits={"output": (1 / 60, 5)}, sample={"fix": FIX_LOG_SAMPLE})
+    daemon = GpsDaemon(args.port, args.baud, args.device)
+
+    def stop(signum, frame):
+        log.info("Signal %s received. Stopping...", signum)
+        daemon.running = False
+
+    signal.signal(signal.SIGTERM, stop)
+    install_profiling("gps_daemon")
+
+    try:
+        client = daemon.connect_mqtt(args.mqtt_host, args.mqtt_port)
+        track_log = None
+        if not args.no_track_log:
+            try:
+                track_log = TrackLog(args.track_log)
+            except OSError as e:
+                log.warning("[Startup] Track log unavailable (%s), offline fixes will not be kept", e)
+        daemon.track_log = track_log
+        daemon.add_output(MqttOutput(client, track_log=track_log))
+        HeartbeatPublisher(client, daemon.device, "gps_daemon", daemon.health).start()
+        start_peripherals(daemon, args)
+
+        log.info("GPS daemon started (%s) after %.2fs", args.port, time.monotonic() - PROCESS_START)
+        daemon.run()
+    except KeyboardInterrupt:
+        log.info("Stopping...")
+    finally:
+        daemon.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
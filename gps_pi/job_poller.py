@@ -9,30 +9,44 @@ Stop methods:
 3. Send SIGTERM signal
 """
 
+import logging
 import time
 import requests
 import signal
 import sys
 import os
-import subprocess
+import threading
 import json
-from datetime import datetime
 from pathlib import Path
 
+from daemon_log import setup_logging
+from daemon_profile import profile_process, run as profile_self
+from heartbeat import HeartbeatPublisher, connect as connect_broker, system_metrics, unit_metrics
+from service_state import ServiceReconciler
+
+log = logging.getLogger("job_poller")
+poll_log = logging.getLogger("job_poller.poll")  # rate limited, repeats every cycle while offline
+
 # Configuration
 API_URL = "https://bike-api.dyntech.workers.dev"
 PI_ID = "pi9"
 POLL_INTERVAL = 5  # seconds
 STOP_FILE = "/tmp/stop_gps_pi"
+PROFILE_TARGETS = ("gps_daemon",)  # daemons that call daemon_profile.install(); "poller" profiles this process
+DESIRED_INTERVAL = 30  # seconds between desired-state syncs (service states)
+BROKER_HOST = "172.30.2.50"  # gateway broker
+BROKER_PORT = 1883
+HEALTH_UNITS = ("gps-reader",)  # units in the heartbeat (state, RSS)
 
 # Global flag for graceful shutdown
 running = True
+reconciler = None  # ServiceReconciler: desired vs. actual systemd unit states
 
 
 def signal_handler(signum, frame):
     """Handle SIGINT (CTRL+C) and SIGTERM signals"""
     global running
-    print(f"\n[{datetime.now()}] Signal {signum} received. Shutting down gracefully...")
+    log.info("Signal %s received. Shutting down gracefully...", signum)
     running = False
 
 
@@ -46,9 +60,9 @@ def remove_stop_file():
     if os.path.exists(STOP_FILE):
         try:
             os.remove(STOP_FILE)
-            print(f"[{datetime.now()}] Removed stop file: {STOP_FILE}")
+            log.info("Removed stop file: %s", STOP_FILE)
         except Exception as e:
-            print(f"[{datetime.now()}] Warning: Could not remove stop file: {e}")
+            log.warning("Could not remove stop file: %s", e)
 
 
 def poll_for_job():
@@ -61,25 +75,25 @@ def poll_for_job():
         )
 
         if response.status_code != 200:
-            print(f"[{datetime.now()}] Poll failed with status {response.status_code}")
+            poll_log.warning("Poll failed with status %s", response.status_code)
             return None
 
         data = response.json()
         job = data.get("job")
 
         if job:
-            print(f"[{datetime.now()}] Received job: {job['job_id']} (type: {job['type']})")
+            log.info("Received job: %s (type: %s)", job['job_id'], job['type'])
 
         return job
 
     except requests.exceptions.Timeout:
-        print(f"[{datetime.now()}] Poll request timed out")
+        poll_log.warning("Poll request timed out")
         return None
     except requests.exceptions.RequestException as e:
-        print(f"[{datetime.now()}] Poll request failed: {e}")
+        poll_log.warning("Poll request failed: %s", e)
         return None
     except Exception as e:
-        print(f"[{datetime.now()}] Unexpected error during poll: {e}")
+        poll_log.error("Unexpected error during poll: %s", e)
         return None
 
 
@@ -89,7 +103,7 @@ def execute_job(job):
     job_type = job["type"]
     params = job.get("params", {})
 
-    print(f"[{datetime.now()}] Executing job {job_id}...")
+    log.info("Executing job %s...", job_id)
 
     start_time = time.time()
 
@@ -104,11 +118,15 @@ def execute_job(job):
             result = stop_gps_reader(params)
             status = "done"
             output = result
+        elif job_type == "profile":
+            # Runs in the background, polling continues; reports its own result
+            start_profile(job_id, params)
+            return
         else:
             # Unknown job type
             status = "failed"
             output = f"Unknown job type: {job_type}"
-            print(f"[{datetime.now()}] {output}")
+            log.warning("%s", output)
 
         duration_ms = int((time.time() - start_time) * 1000)
 
@@ -118,88 +136,88 @@ def execute_job(job):
     except Exception as e:
         duration_ms = int((time.time() - start_time) * 1000)
         error_msg = f"Job execution failed: {str(e)}"
-        print(f"[{datetime.now()}] {error_msg}")
+        log.error("%s", error_msg)
         report_result(job_id, "failed", error_msg, duration_ms)
 
 
-def execute_gps_reader(params):
-    """Start GPS reader script via systemd service"""
-    device = params.get("device", "pi9")
-    print(f"[{datetime.now()}] Starting GPS reader service for device: {device}")
+def converge(unit, state):
+    """Make `state` the desired state of `unit` and act only if it differs (no restart if already there)"""
+    reconciler.set_desired(unit, state)
+    entry = reconciler.reconcile()[unit]
+    if (entry["actual"] == "active") != (state == "active"):
+        raise Exception(entry.get("error") or f"{unit} is {entry['actual']} (desired {state})")
+    return entry
 
-    try:
-        # Start the systemd service
-        result = subprocess.run(
-            ["sudo", "systemctl", "start", "gps-reader"],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
 
-        if result.returncode != 0:
-            raise Exception(f"Failed to start GPS reader service: {result.stderr}")
+def execute_gps_reader(params):
+    """Desired state: GPS reader service running"""
+    device = params.get("device", "pi9")
+    log.info("Starting GPS reader service for device: %s", device)
+    entry = converge("gps-reader", "active")
+    if entry["action"]:
+        log.info("GPS reader service started successfully")
+        return "GPS reader service started successfully"
+    return "GPS reader service already running"
 
-        # Wait a moment for service to initialize
-        time.sleep(2)
 
-        # Check service status
-        status_result = subprocess.run(
-            ["systemctl", "is-active", "gps-reader"],
-            capture_output=True,
-            text=True
-        )
+def stop_gps_reader(params):
+    """Desired state: GPS reader service stopped"""
+    entry = converge("gps-reader", "inactive")
+    if entry["action"]:
+        log.info("GPS reader service stopped successfully")
+        return "GPS reader service stopped successfully"
+    return "GPS reader service already stopped"
 
-        if status_result.stdout.strip() == "active":
-            print(f"[{datetime.now()}] GPS reader service started successfully")
-            return "GPS reader service started successfully"
-        else:
-            raise Exception(f"GPS reader service failed to start (status: {status_result.stdout.strip()})")
 
-    except subprocess.TimeoutExpired:
-        raise Exception("GPS reader service start timed out")
+def sync_desired_state():
+    """Fetch the desired service states, converge to them and report the result"""
+    try:
+        reconciler.fetch()
     except Exception as e:
-        print(f"[{datetime.now()}] Error starting GPS reader: {e}")
-        raise
+        poll_log.warning("Desired state fetch failed: %s", e)  # keep converging to the last document
+    try:
+        result = reconciler.reconcile()
+        reconciler.report(result)
+    except Exception as e:
+        poll_log.warning("Desired state sync failed: %s", e)
 
 
-def stop_gps_reader(params):
-    """Stop GPS reader service"""
-    print(f"[{datetime.now()}] Stopping GPS reader service...")
+def collect_health():
+    """Pi metrics plus state and RSS of the watched units (state from the reconciler's cache)"""
+    return {**system_metrics(), "services": unit_metrics(HEALTH_UNITS, reconciler.actual)}
 
-    try:
-        # Stop the systemd service
-        result = subprocess.run(
-            ["sudo", "systemctl", "stop", "gps-reader"],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
 
-        if result.returncode != 0:
-            raise Exception(f"Failed to stop GPS reader service: {result.stderr}")
+def start_health():
+    """Heartbeat of this Pi on the local broker (health/<pi>/system), collected by the gateway"""
+    client = connect_broker(f"{PI_ID}-poller", BROKER_HOST, BROKER_PORT)
+    HeartbeatPublisher(client, PI_ID, "system", collect_health).start()
+    return client
 
-        # Wait a moment
-        time.sleep(1)
 
-        # Check service status
-        status_result = subprocess.run(
-            ["systemctl", "is-active", "gps-reader"],
-            capture_output=True,
-            text=True
-        )
+def start_profile(job_id, params):
+    """Profile the poller or a local daemon for N seconds (cpu samples or tracemalloc)"""
+    threading.Thread(target=run_profile, args=(job_id, params), name="profile-job", daemon=True).start()
 
-        status = status_result.stdout.strip()
-        if status in ["inactive", "failed"]:
-            print(f"[{datetime.now()}] GPS reader service stopped successfully")
-            return "GPS reader service stopped successfully"
-        else:
-            raise Exception(f"GPS reader service failed to stop (status: {status})")
 
-    except subprocess.TimeoutExpired:
-        raise Exception("GPS reader service stop timed out")
+def run_profile(job_id, params):
+    start_time = time.time()
+    target = params.get("target", "poller")
+    mode = params.get("mode", "cpu")
+    seconds = params.get("seconds", 10)
+    log.info("Profiling %s (%s, %ss)", target, mode, seconds)
+    try:
+        if target == "poller":
+            output = {str(os.getpid()): profile_self(mode, seconds)}
+        elif target in PROFILE_TARGETS:
+            output = profile_process(target, mode, seconds)  # {pid: summary}, one per worker
+        else:
+            raise ValueError(f"Unknown profile target: {target}")
+        status = "done"
     except Exception as e:
-        print(f"[{datetime.now()}] Error stopping GPS reader: {e}")
-        raise
+        status = "failed"
+        output = f"Profile failed: {e}"
+        log.error("%s", output)
+    report_result(job_id, status, output, int((time.time() - start_time) * 1000))
 
 
 def report_result(job_id, status, output, duration_ms):
@@ -217,17 +235,19 @@ def report_result(job_id, status, output, duration_ms):
         )
 
         if response.status_code == 200:
-            print(f"[{datetime.now()}] Job {job_id} result reported: {status} ({duration_ms}ms)")
+            log.info("Job %s result reported: %s (%sms)", job_id, status, duration_ms)
         else:
-            print(f"[{datetime.now()}] Failed to report result: HTTP {response.status_code}")
+            log.warning("Failed to report result: HTTP %s", response.status_code)
 
     except Exception as e:
-        print(f"[{datetime.now()}] Error reporting result: {e}")
+        log.error("Error reporting result: %s", e)
 
 
 def main():
     """Main polling loop"""
-    global running
+    global running, reconciler
+
+    setup_logging("job_poller", limits={"poll": (1 / 60, 3)})
 
     # Register signal handlers
     signal.signal(signal.SIGINT, signal_handler)
@@ -235,25 +255,29 @@ def main():
 
     # Remove any existing stop file
     remove_stop_file()
+    reconciler = ServiceReconciler(API_URL, PI_ID)
+    health_client = start_health()
 
-    print(f"[{datetime.now()}] GPS Pi Job Poller started")
-    print(f"[{datetime.now()}] API URL: {API_URL}")
-    print(f"[{datetime.now()}] PI ID: {PI_ID}")
-    print(f"[{datetime.now()}] Poll interval: {POLL_INTERVAL}s")
-    print(f"[{datetime.now()}] Stop methods:")
-    print(f"  1. Press CTRL+C")
-    print(f"  2. Create file: {STOP_FILE}")
-    print(f"  3. Send SIGTERM: kill -TERM <pid>")
-    print()
+    log.info("GPS Pi Job Poller started")
+    log.info("API URL: %s", API_URL)
+    log.info("PI ID: %s", PI_ID)
+    log.info("Poll interval: %ss", POLL_INTERVAL)
+    log.info("Stop methods: CTRL+C, create file %s, or kill -TERM <pid>", STOP_FILE)
 
+    next_sync = 0
     try:
         while running:
             # Check for stop file
             if check_stop_file():
-                print(f"[{datetime.now()}] Stop file detected. Shutting down...")
+                log.info("Stop file detected. Shutting down...")
                 remove_stop_file()
                 break
 
+            # Converge services to the desired state (also heals lost start/stop jobs)
+            if time.monotonic() >= next_sync:
+                sync_desired_state()
+                next_sync = time.monotonic() + DESIRED_INTERVAL
+
             # Poll for new job
             job = poll_for_job()
 
@@ -268,11 +292,12 @@ def main():
                 time.sleep(1)
 
     except Exception as e:
-        print(f"[{datetime.now()}] Fatal error: {e}")
+        log.error("Fatal error: %s", e)
         return 1
 
     finally:
-        print(f"[{datetime.now()}] GPS Pi Job Poller stopped")
+        health_client.disconnect()
+        log.info("GPS Pi Job Poller stopped")
         remove_stop_file()
 
     return 0
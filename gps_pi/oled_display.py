@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+OLED renderer for the 64x48 SSD1306 on Pi9
+- Static screens ("LOCKED", "Tracking Bike...") are rendered once and cached
+- The speed screen is only re-rendered when the displayed text changes
+- The SPI transfer is skipped when the frame on the panel is already current
+"""
+
+from PIL import Image, ImageDraw, ImageFont
+
+WIDTH = 64
+HEIGHT = 48
+
+
+class DisplayRenderer:
+    """Pushes status screens to the OLED, touching the SPI bus only on change"""
+
+    def __init__(self, display, font=None):
+        self.display = display
+        self.font = font or ImageFont.load_default()
+        self._static = {
+            "stolen": self._render([((0, 10), "Tracking"), ((0, 22), "Bike...")]),
+            "locked": self._render([((10, 18), "LOCKED")]),
+        }
+        self._speed_text = None
+        self._speed_frame = None
+        self._shown = None  # Frame currently on the panel
+
+    def _render(self, lines):
+        img = Image.new("1", (WIDTH, HEIGHT))
+        draw = ImageDraw.Draw(img)
+        for pos, text in lines:
+            draw.text(pos, text, font=self.font, fill=255)
+        return img
+
+    def _speed(self, speed):
+        text = f"{speed:.1f} km/h"
+        if text != self._speed_text:
+            self._speed_text = text
+            self._speed_frame = self._render([((0, 0), text)])
+        return self._speed_frame
+
+    def show(self, is_stolen, locked, speed):
+        """Display the screen for the given state. Returns True if the panel was updated."""
+        if is_stolen:
+            frame = self._static["stolen"]
+        elif locked:
+            frame = self._static["locked"]
+        else:
+            frame = self._speed(speed)
+
+        if frame is self._shown:
+            return False
+
+        self.display.image(frame)
+        self.display.show()
+        self._shown = frame
+        return True
+
+    def invalidate(self):
+        """Force the next show() to push a frame (e.g. after a display reset)"""
+        self._shown = None
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Stolen status subscriber for Pi9
+- Prefers push: retained MQTT message on bike/<device>/status relayed by the gateway,
+  or a stolen delta of the device shadow (set_pushed)
+- Falls back to HTTP polling of /api/status when no push arrived recently,
+  using one persistent session (keep-alive, TLS reuse), ETag/If-None-Match
+  and exponential backoff on errors
+- Runs as a single long-lived thread instead of one thread per check
+- requests is imported on first HTTP use, so startup doesn't pay for it
+  while the gateway push works
+"""
+
+import json
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+PUSH_STALE_SEC = 150  # Gateway re-publishes every 60s; after this, poll HTTP
+POLL_INTERVAL = 10  # seconds between HTTP checks while push is unavailable
+MAX_BACKOFF = 300  # seconds, upper bound for retry delay after errors
+STARTUP_GRACE_SEC = 5  # wait for the retained push before the first HTTP check
+
+
+class StatusSubscriber:
+    """Tracks the stolen flag for one device from MQTT push or HTTP fallback"""
+
+    def __init__(self, device, api_url, poll_interval=POLL_INTERVAL):
+        self.device = device
+        self.topic = f"bike/{device}/status"
+        self.api_url = api_url
+        self.poll_interval = poll_interval
+        self.on_change = None  # Optional callback(stolen)
+
+        self._stolen = False
+        self._last_push = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._session = None  # requests.Session, created on first HTTP check
+        self._etag = None
+        self._thread = None
+
+    @property
+    def stolen(self):
+        with self._lock:
+            return self._stolen
+
+    def _set(self, stolen):
+        with self._lock:
+            changed = stolen != self._stolen
+            self._stolen = stolen
+        if changed:
+            log.info("[Status] Stolen status changed: %s", stolen)
+            if self.on_change:
+                self.on_change(stolen)
+
+    # ---- Push (MQTT) ----
+    def attach(self, client):
+        """Route status messages of the given paho client to this subscriber.
+        Call subscribe() from the client's on_connect so it survives reconnects."""
+        client.message_callback_add(self.topic, self.on_message)
+
+    def subscribe(self, client):
+        client.subscribe(self.topic, qos=1)
+
+    def on_message(self, client, userdata, msg):
+        try:
+            data = json.loads(msg.payload.decode())
+        except Exception as e:
+            log.warning("[Status] Invalid push message: %s", e)
+            return
+        self.set_pushed(bool(data.get("stolen", False)))
+
+    def set_pushed(self, stolen):
+        """Stolen flag received over the push channel"""
+        with self._lock:
+            self._last_push = time.time()
+        self._set(stolen)
+
+    def push_alive(self):
+        with self._lock:
+            return time.time() - self._last_push < PUSH_STALE_SEC
+
+    # ---- Fallback (HTTP) ----
+    def fetch(self):
+        """Conditional GET of /api/status. Returns True on success (200 or 304)."""
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        headers = {"If-None-Match": self._etag} if self._etag else {}
+        response = self._session.get(
+            self.api_url, params={"device": self.device}, headers=headers, timeout=5
+        )
+        if response.status_code == 304:
+            return True
+        if response.status_code != 200:
+            log.warning("[Status] HTTP status check failed: %s", response.status_code)
+            return False
+        self._etag = response.headers.get("ETag")
+        self._set(bool(response.json().get("stolen", False)))
+        return True
+
+    def _run(self):
+        delay = self.poll_interval
+        self._wake.wait(STARTUP_GRACE_SEC)
+        while not self._stop.is_set():
+            if self.push_alive():
+                delay = self.poll_interval
+            else:
+                try:
+                    ok = self.fetch()
+                except Exception as e:
+                    log.warning("[Status] HTTP status check failed: %s", e)
+                    ok = False
+                delay = self.poll_interval if ok else min(delay * 2, MAX_BACKOFF)
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="status-subscriber", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._session:
+            self._session.close()
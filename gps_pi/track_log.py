@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+On-device track log for Pi9
+Every valid fix is stored as a fixed-size binary record in a memory-mapped
+ring file, so rides outside gateway range are not lost. After a reconnect
+the records that did not reach the gateway are uploaded as a few
+zlib-compressed bulk messages (gateway/<device>/gps/bulk).
+
+File layout:
+  header (64 bytes): magic, version, record size, capacity, head, uploaded
+  records:           capacity * RECORD_SIZE, slot = seq % capacity
+
+head     = sequence number of the next record to write
+uploaded = every record with seq < uploaded reached the gateway
+Records published live are flagged FLAG_DELIVERED; the bulk upload skips
+them, so fixes published while a backfill is running are not sent twice.
+
+Bulk message layout (decoded by gateway/track_backfill.py):
+  BULK_HEADER (magic, version, record size, count) + zlib(records)
+"""
+
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+MAGIC = b"TRK1"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIQQ")  # magic, version, record size, capacity, head, uploaded
+HEADER_SIZE = 64
+
+# ts_ms, lat*1e7, lon*1e7, alt m, speed kn*100, course deg*100, sats, flags
+RECORD = struct.Struct("<QiihHHBB")
+RECORD_SIZE = RECORD.size
+FLAG_FIX = 0x01
+FLAG_LOCKMODE = 0x02
+FLAG_DELIVERED = 0x04  # published live, not part of a bulk upload
+
+BULK_MAGIC = b"TRKB"
+BULK_HEADER = struct.Struct("<4sHHI")  # magic, version, record size, count
+
+DEFAULT_CAPACITY = 172800  # two days at 1 Hz, ~4 MB
+
+
+def pack_record(fix, delivered=False):
+    flags = ((FLAG_FIX if fix.get("fix") else 0) | (FLAG_LOCKMODE if fix.get("lockmode") else 0)
+             | (FLAG_DELIVERED if delivered else 0))
+    return RECORD.pack(
+        int(fix["ts"]),
+        round((fix.get("lat") or 0) * 1e7),
+        round((fix.get("lon") or 0) * 1e7),
+        max(-32768, min(32767, round(fix.get("alt") or 0))),
+        min(65535, round((fix.get("speed_kn") or 0) * 100)),
+        round((fix.get("course_deg") or 0) * 100) % 36000,
+        min(255, fix.get("sats") or 0),
+        flags,
+    )
+
+
+def unpack_record(data, offset=0):
+    ts, lat, lon, alt, speed, course, sats, flags = RECORD.unpack_from(data, offset)
+    return {
+        "ts": ts,
+        "fix": bool(flags & FLAG_FIX),
+        "lat": lat / 1e7,
+        "lon": lon / 1e7,
+        "alt": alt,
+        "speed_kn": speed / 100,
+        "course_deg": course / 100,
+        "sats": sats,
+        "lockmode": bool(flags & FLAG_LOCKMODE),
+    }
+
+
+def undelivered(records):
+    """Packed records without the ones flagged as published live"""
+    return b"".join(records[i:i + RECORD_SIZE] for i in range(0, len(records), RECORD_SIZE)
+                    if not records[i + RECORD_SIZE - 1] & FLAG_DELIVERED)
+
+
+def encode_bulk(records):
+    """Compress a block of packed records into one bulk message"""
+    count = len(records) // RECORD_SIZE
+    return BULK_HEADER.pack(BULK_MAGIC, VERSION, RECORD_SIZE, count) + zlib.compress(records, 9)
+
+
+class TrackLog:
+    """Fixed-size ring of binary fix records backed by a memory-mapped file"""
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        self._lock = threading.Lock()
+        size = HEADER_SIZE + capacity * RECORD_SIZE
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            existing = os.fstat(fd).st_size
+            if existing != size:
+                os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        magic, version, rec_size, cap, head, uploaded = HEADER.unpack_from(self._mm, 0)
+        if magic == MAGIC and version == VERSION and rec_size == RECORD_SIZE and cap == capacity:
+            self.capacity, self.head, self.uploaded = cap, head, uploaded
+        else:
+            # New file or incompatible layout: start an empty ring
+            self.capacity, self.head, self.uploaded = capacity, 0, 0
+            self._write_header()
+
+    def _write_header(self):
+        HEADER.pack_into(self._mm, 0, MAGIC, VERSION, RECORD_SIZE, self.capacity, self.head, self.uploaded)
+
+    def append(self, fix, delivered=False):
+        """Store one fix (delivered: it was published live), returns its sequence number"""
+        with self._lock:
+            seq = self.head
+            offset = HEADER_SIZE + (seq % self.capacity) * RECORD_SIZE
+            self._mm[offset:offset + RECORD_SIZE] = pack_record(fix, delivered)
+            self.head = seq + 1
+            self._write_header()
+            return seq
+
+    def pending(self):
+        """(start, end) sequence range not yet uploaded, limited to what the ring still holds"""
+        with self._lock:
+            return max(self.uploaded, self.head - self.capacity), self.head
+
+    def read(self, start, end):
+        """Packed records for seq range [start, end)"""
+        with self._lock:
+            chunks = []
+            seq = max(start, self.head - self.capacity)
+            while seq < end:
+                slot = seq % self.capacity
+                n = min(end - seq, self.capacity - slot)
+                offset = HEADER_SIZE + slot * RECORD_SIZE
+                chunks.append(self._mm[offset:offset + n * RECORD_SIZE])
+                seq += n
+            return b"".join(chunks)
+
+    def mark_uploaded(self, seq):
+        """Every record before seq reached the gateway"""
+        with self._lock:
+            if seq > self.uploaded:
+                self.uploaded = min(seq, self.head)
+                self._write_header()
+
+    def close(self):
+        with self._lock:
+            self._mm.flush()
+            self._mm.close()
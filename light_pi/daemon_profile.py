@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+On-demand profiling (same file in gateway/, gps_pi/ and light_pi/)
+Lets the job poller look into a running daemon without SSH and without
+extra packages: a `profile` job samples the daemon for a few seconds and
+returns a compact summary as the job output.
+
+- cpu: a sampler thread reads every thread's stack (sys._current_frames)
+  SAMPLE_HZ times per second. Result: top functions (self/total %) and the
+  heaviest stacks in folded "a;b;c count" form (flamegraph.pl/speedscope)
+- mem: tracemalloc snapshots at start and end; top allocation growth by
+  line, plus current/peak traced memory
+- Bounded overhead: duration capped at MAX_SECONDS, sampling cost measured
+  and reported, stack table capped at MAX_STACKS entries, tracemalloc only
+  active during the job (and stopped again unless it was already on)
+
+Daemons opt in with one call after setup_logging():
+  from daemon_profile import install
+  install("forwarder")
+
+install() registers the process as PROFILE_DIR/<name>.<pid>.pid with its
+boot id and start time (/proc). The poller writes PROFILE_DIR/<name>.request
+({"id", "mode", "seconds"}) and sends SIGUSR2 only to registered processes
+whose pid still has the recorded boot id and start time (the default action
+of SIGUSR2 would kill a recycled pid); stale pid files are removed. The
+daemon profiles in a background thread and writes
+PROFILE_DIR/<name>.<pid>.<id>.json. profile_process() is the poller side.
+
+PROFILE_DIR is ~/.cache/bike-profile of the service user (home directory
+from the user database): the same path for daemons started at boot and for
+a poller restarted from an SSH session, and private (mode 0700, owner checked).
+"""
+
+import atexit
+import collections
+import glob
+import json
+import logging
+import os
+import pwd
+import signal
+import stat
+import sys
+import threading
+import time
+import tracemalloc
+
+log = logging.getLogger(__name__)
+
+PROFILE_DIR = os.path.join(pwd.getpwuid(os.getuid()).pw_dir, ".cache", "bike-profile")
+BOOT_ID_PATH = "/proc/sys/kernel/random/boot_id"
+MAX_SECONDS = 120
+SAMPLE_HZ = 100
+SWITCH_INTERVAL = 0.0005  # GIL switch interval while sampling (default 5 ms biases samples towards I/O waits)
+MAX_STACKS = 5000  # distinct stacks kept while sampling; the rest count as "[other]"
+TOP_FUNCTIONS = 20
+TOP_STACKS = 30
+TOP_ALLOCATIONS = 20
+TRACE_FRAMES = 10
+RESULT_GRACE_SEC = 10  # extra wait for the daemon's result after the profile duration
+
+_busy = threading.Lock()  # one profile per process at a time
+
+
+def _frame_name(code, lineno=None):
+    name = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+    return f"{name}:{lineno}" if lineno else name
+
+
+def _sample(own, names, stacks):
+    """Add one stack per thread to `stacks`; returns the time it took"""
+    started = time.perf_counter()
+    if len(names) != threading.active_count():
+        names.clear()
+        names.update((t.ident, t.name) for t in threading.enumerate())
+    for ident, frame in sys._current_frames().items():
+        if ident == own:
+            continue
+        parts = []
+        while frame is not None:
+            parts.append(_frame_name(frame.f_code, frame.f_lineno))
+            frame = frame.f_back
+        key = ";".join([names.get(ident, str(ident))] + parts[::-1])
+        if key in stacks or len(stacks) < MAX_STACKS:
+            stacks[key] += 1
+        else:
+            stacks["[other]"] += 1
+    return time.perf_counter() - started
+
+
+def sample_cpu(seconds, hz=SAMPLE_HZ):
+    """Sample the stacks of all other threads of this process"""
+    own = threading.get_ident()
+    names = {}
+    stacks = collections.Counter()
+    samples = 0
+    cost = 0.0
+    interval = 1.0 / hz
+    deadline = time.monotonic() + seconds
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(SWITCH_INTERVAL)
+    try:
+        while time.monotonic() < deadline:
+            samples += 1
+            cost += _sample(own, names, stacks)
+            time.sleep(max(0.0, interval - cost / samples))
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    total = sum(stacks.values()) or 1
+    own_count = collections.Counter()
+    total_count = collections.Counter()
+    for key, count in stacks.items():
+        frames = key.split(";")[1:]
+        if not frames:
+            continue
+        own_count[frames[-1].rsplit(":", 1)[0]] += count
+        for function in {f.rsplit(":", 1)[0] for f in frames}:
+            total_count[function] += count
+    return {
+        "mode": "cpu",
+        "seconds": seconds,
+        "samples": samples,
+        "overhead_pct": round(cost / seconds * 100, 2) if seconds else 0,
+        "top": [
+            {"function": f, "self_pct": round(own_count[f] / total * 100, 1),
+             "total_pct": round(c / total * 100, 1)}
+            for f, c in total_count.most_common(TOP_FUNCTIONS)
+        ],
+        "folded": [f"{k} {c}" for k, c in stacks.most_common(TOP_STACKS)],
+    }
+
+
+def sample_memory(seconds):
+    """Allocation growth over the period (tracemalloc)"""
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(TRACE_FRAMES)
+    try:
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+    own = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    diff = after.filter_traces(own).compare_to(before.filter_traces(own), "lineno")
+    return {
+        "mode": "mem",
+        "seconds": seconds,
+        "traced_kb": current // 1024,
+        "peak_kb": peak // 1024,
+        "top": [
+            {"line": f"{os.path.basename(s.traceback[0].filename)}:{s.traceback[0].lineno}",
+             "size_kb": round(s.size / 1024, 1), "growth_kb": round(s.size_diff / 1024, 1),
+             "count": s.count, "count_growth": s.count_diff}
+            for s in diff[:TOP_ALLOCATIONS]
+        ],
+    }
+
+
+def run(mode="cpu", seconds=10):
+    """Profile this process; returns the summary dict"""
+    seconds = max(1, min(float(seconds), MAX_SECONDS))
+    if not _busy.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        if mode == "mem":
+            result = sample_memory(seconds)
+        elif mode == "cpu":
+            result = sample_cpu(seconds)
+        else:
+            raise ValueError(f"Unknown profile mode: {mode}")
+    finally:
+        _busy.release()
+    result.update(pid=os.getpid(), threads=threading.active_count())
+    return result
+
+
+def _private_dir(create=False):
+    """PROFILE_DIR, only if it is a directory of this user that nobody else can write"""
+    if create:
+        os.makedirs(PROFILE_DIR, mode=0o700, exist_ok=True)
+    st = os.lstat(PROFILE_DIR)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(f"{PROFILE_DIR} is not a private directory (owner/mode), not using it")
+    return PROFILE_DIR
+
+
+def _start_time(pid):
+    """Start time of a process in clock ticks since boot, None if it is gone (or no /proc)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return int(f.read().rsplit(")", 1)[1].split()[19])  # field 22; comm may contain spaces
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _boot_id():
+    """Changes on every boot (pid files survive reboots in PROFILE_DIR)"""
+    try:
+        with open(BOOT_ID_PATH) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+# ---- Daemon side ----
+def install(name):
+    """Profile this daemon when SIGUSR2 arrives with a request for `name` (call from the main thread)"""
+    def handle(signum, frame):
+        threading.Thread(target=_serve, args=(name,), name="profile", daemon=True).start()
+
+    try:
+        pid_file = os.path.join(_private_dir(create=True), f"{name}.{os.getpid()}.pid")
+    except (OSError, RuntimeError) as e:
+        log.warning("Profiling not available: %s", e)
+        return
+    signal.signal(signal.SIGUSR2, handle)
+    with open(pid_file, "w") as f:
+        json.dump({"pid": os.getpid(), "boot": _boot_id(), "start": _start_time(os.getpid())}, f)
+    atexit.register(lambda: os.path.exists(pid_file) and os.remove(pid_file))
+
+
+def _serve(name):
+    try:
+        with open(os.path.join(PROFILE_DIR, f"{name}.request")) as f:
+            request = json.load(f)
+    except (OSError, ValueError) as e:
+        log.warning("Profile request for %s unreadable: %s", name, e)
+        return
+    log.info("Profiling %s (%s, %ss)", name, request.get("mode"), request.get("seconds"))
+    try:
+        result = run(request.get("mode", "cpu"), request.get("seconds", 10))
+    except Exception as e:
+        result = {"error": str(e), "pid": os.getpid()}
+    path = os.path.join(PROFILE_DIR, f"{name}.{os.getpid()}.{request.get('id')}.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(result, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+# ---- Poller side ----
+def registered_pids(name):
+    """PIDs of live processes that called install(name) (e.g. all forwarder workers)"""
+    if not os.path.lexists(PROFILE_DIR):
+        return []  # no daemon ever installed
+    pids = []
+    for path in glob.glob(os.path.join(_private_dir(), f"{name}.*.pid")):
+        try:
+            with open(path) as f:
+                registered = json.load(f)
+            pid = int(path.rsplit(".", 2)[1])
+        except (OSError, ValueError):
+            registered, pid = {}, None
+        start = _start_time(pid) if pid else None
+        if (start is None or registered.get("pid") != pid or registered.get("start") != start
+                or registered.get("boot") != _boot_id()):
+            os.remove(path)  # crashed without cleanup, pid since reused, or not written by install()
+            continue
+        pids.append(pid)
+    return pids
+
+
+def profile_process(name, mode="cpu", seconds=10):
+    """Ask every process installed as `name` for a profile; returns {pid: summary}"""
+    seconds = max(1, min(float(seconds), MAX_SECONDS))
+    pids = registered_pids(name)
+    if not pids:
+        raise RuntimeError(f"{name} is not running (or started without profiling support)")
+
+    request_id = str(int(time.time() * 1000))
+    with open(os.path.join(PROFILE_DIR, f"{name}.request"), "w") as f:
+        json.dump({"id": request_id, "mode": mode, "seconds": seconds}, f)
+    for pid in pids:
+        os.kill(pid, signal.SIGUSR2)
+
+    results = {}
+    deadline = time.time() + seconds + RESULT_GRACE_SEC
+    while time.time() < deadline and len(results) < len(pids):
+        time.sleep(0.5)
+        for path in glob.glob(os.path.join(PROFILE_DIR, f"{name}.*.{request_id}.json")):
+            pid = path.rsplit(".", 3)[1]
+            if pid not in results:
+                with open(path) as f:
+                    results[pid] = json.load(f)
+                os.remove(path)
+    for pid in pids:
+        results.setdefault(str(pid), {"error": "no result in time"})
+    return results
@@ -2,32 +2,46 @@
 """
 Light Module Job Poller
 - Polls backend for jobs to start/stop the rear light service
-- Expected job types: start_light_module / stop_light_module
+- Expected job types: start_light_module / stop_light_module / profile
 - Expects a systemd service called "bike-light"
 """
 
+import logging
 import time
 import requests
 import signal
 import sys
 import os
-import subprocess
-from datetime import datetime
+import threading
 from pathlib import Path
 
+from daemon_log import setup_logging
+from daemon_profile import profile_process, run as profile_self
+from heartbeat import HeartbeatPublisher, connect as connect_broker, system_metrics, unit_metrics
+from service_state import ServiceReconciler
+
+log = logging.getLogger("job_poller")
+poll_log = logging.getLogger("job_poller.poll")  # rate limited, repeats every cycle while offline
+
 # Configuration
 API_URL = "https://bike-api.dyntech.workers.dev"
 PI_ID = "lightpi"
 POLL_INTERVAL = 5  # seconds
 STOP_FILE = "/tmp/stop_light_pi"
+PROFILE_TARGETS = ()  # daemons that call daemon_profile.install(); "poller" profiles this process
+DESIRED_INTERVAL = 30  # seconds between desired-state syncs (service states)
 SERVICE_NAME = "bike-light"
+BROKER_HOST = "172.30.2.50"  # gateway broker
+BROKER_PORT = 1883
+HEALTH_UNITS = (SERVICE_NAME,)  # units in the heartbeat (state, RSS)
 
 running = True
+reconciler = None  # ServiceReconciler: desired vs. actual systemd unit states
 
 
 def signal_handler(signum, frame):
     global running
-    print(f"\n[{datetime.now()}] Signal {signum} received. Shutting down gracefully...")
+    log.info("Signal %s received. Shutting down gracefully...", signum)
     running = False
 
 
@@ -39,9 +53,9 @@ def remove_stop_file():
     if os.path.exists(STOP_FILE):
         try:
             os.remove(STOP_FILE)
-            print(f"[{datetime.now()}] Removed stop file: {STOP_FILE}")
+            log.info("Removed stop file: %s", STOP_FILE)
         except Exception as e:
-            print(f"[{datetime.now()}] Warning: Could not remove stop file: {e}")
+            log.warning("Could not remove stop file: %s", e)
 
 
 def poll_for_job():
@@ -53,25 +67,25 @@ def poll_for_job():
         )
 
         if response.status_code != 200:
-            print(f"[{datetime.now()}] Poll failed with status {response.status_code}")
+            poll_log.warning("Poll failed with status %s", response.status_code)
             return None
 
         data = response.json()
         job = data.get("job")
 
         if job:
-            print(f"[{datetime.now()}] Received job: {job['job_id']} (type: {job['type']})")
+            log.info("Received job: %s (type: %s)", job['job_id'], job['type'])
 
         return job
 
     except requests.exceptions.Timeout:
-        print(f"[{datetime.now()}] Poll request timed out")
+        poll_log.warning("Poll request timed out")
         return None
     except requests.exceptions.RequestException as e:
-        print(f"[{datetime.now()}] Poll request failed: {e}")
+        poll_log.warning("Poll request failed: %s", e)
         return None
     except Exception as e:
-        print(f"[{datetime.now()}] Unexpected error during poll: {e}")
+        poll_log.error("Unexpected error during poll: %s", e)
         return None
 
 
@@ -80,7 +94,7 @@ def execute_job(job):
     job_type = job["type"]
     params = job.get("params", {})
 
-    print(f"[{datetime.now()}] Executing job {job_id}...")
+    log.info("Executing job %s...", job_id)
 
     start_time = time.time()
 
@@ -93,10 +107,14 @@ def execute_job(job):
             result = stop_light()
             status = "done"
             output = result
+        elif job_type == "profile":
+            # Runs in the background, polling continues; reports its own result
+            start_profile(job_id, params)
+            return
         else:
             status = "failed"
             output = f"Unknown job type: {job_type}"
-            print(f"[{datetime.now()}] {output}")
+            log.warning("%s", output)
 
         duration_ms = int((time.time() - start_time) * 1000)
         report_result(job_id, status, output, duration_ms)
@@ -104,56 +122,80 @@ def execute_job(job):
     except Exception as e:
         duration_ms = int((time.time() - start_time) * 1000)
         error_msg = f"Job execution failed: {str(e)}"
-        print(f"[{datetime.now()}] {error_msg}")
+        log.error("%s", error_msg)
         report_result(job_id, "failed", error_msg, duration_ms)
 
 
+def converge(unit, state):
+    """Make `state` the desired state of `unit` and act only if it differs (no restart if already there)"""
+    reconciler.set_desired(unit, state)
+    entry = reconciler.reconcile()[unit]
+    if (entry["actual"] == "active") != (state == "active"):
+        raise Exception(entry.get("error") or f"{unit} is {entry['actual']} (desired {state})")
+    return entry
+
+
 def start_light():
-    """Start the light service via systemd."""
-    print(f"[{datetime.now()}] Starting {SERVICE_NAME} service")
-
-    result = subprocess.run(
-        ["sudo", "systemctl", "start", SERVICE_NAME],
-        capture_output=True,
-        text=True,
-        timeout=10
-    )
-    if result.returncode != 0:
-        raise Exception(f"Failed to start service: {result.stderr}")
-
-    time.sleep(1)
-    status = subprocess.run(
-        ["systemctl", "is-active", SERVICE_NAME],
-        capture_output=True,
-        text=True
-    )
-    if status.stdout.strip() == "active":
-        return f"{SERVICE_NAME} started"
-    raise Exception(f"{SERVICE_NAME} did not start (status: {status.stdout.strip()})")
+    """Desired state: light service running"""
+    entry = converge(SERVICE_NAME, "active")
+    return f"{SERVICE_NAME} started" if entry["action"] else f"{SERVICE_NAME} already running"
 
 
 def stop_light():
-    """Stop the light service via systemd."""
-    print(f"[{datetime.now()}] Stopping {SERVICE_NAME} service")
-
-    result = subprocess.run(
-        ["sudo", "systemctl", "stop", SERVICE_NAME],
-        capture_output=True,
-        text=True,
-        timeout=10
-    )
-    if result.returncode != 0:
-        raise Exception(f"Failed to stop service: {result.stderr}")
-
-    time.sleep(1)
-    status = subprocess.run(
-        ["systemctl", "is-active", SERVICE_NAME],
-        capture_output=True,
-        text=True
-    )
-    if status.stdout.strip() in ["inactive", "failed"]:
-        return f"{SERVICE_NAME} stopped"
-    raise Exception(f"{SERVICE_NAME} did not stop (status: {status.stdout.strip()})")
+    """Desired state: light service stopped"""
+    entry = converge(SERVICE_NAME, "inactive")
+    return f"{SERVICE_NAME} stopped" if entry["action"] else f"{SERVICE_NAME} already stopped"
+
+
+def sync_desired_state():
+    """Fetch the desired service states, converge to them and report the result"""
+    try:
+        reconciler.fetch()
+    except Exception as e:
+        poll_log.warning("Desired state fetch failed: %s", e)  # keep converging to the last document
+    try:
+        result = reconciler.reconcile()
+        reconciler.report(result)
+    except Exception as e:
+        poll_log.warning("Desired state sync failed: %s", e)
+
+
+def collect_health():
+    """Pi metrics plus state and RSS of the watched units (state from the reconciler's cache)"""
+    return {**system_metrics(), "services": unit_metrics(HEALTH_UNITS, reconciler.actual)}
+
+
+def start_health():
+    """Heartbeat of this Pi on the local broker (health/<pi>/system), collected by the gateway"""
+    client = connect_broker(f"{PI_ID}-poller", BROKER_HOST, BROKER_PORT)
+    HeartbeatPublisher(client, PI_ID, "system", collect_health).start()
+    return client
+
+
+def start_profile(job_id, params):
+    """Profile the poller or a local daemon for N seconds (cpu samples or tracemalloc)"""
+    threading.Thread(target=run_profile, args=(job_id, params), name="profile-job", daemon=True).start()
+
+
+def run_profile(job_id, params):
+    start_time = time.time()
+    target = params.get("target", "poller")
+    mode = params.get("mode", "cpu")
+    seconds = params.get("seconds", 10)
+    log.info("Profiling %s (%s, %ss)", target, mode, seconds)
+    try:
+        if target == "poller":
+            output = {str(os.getpid()): profile_self(mode, seconds)}
+        elif target in PROFILE_TARGETS:
+            output = profile_process(target, mode, seconds)  # {pid: summary}, one per worker
+        else:
+            raise ValueError(f"Unknown profile target: {target}")
+        status = "done"
+    except Exception as e:
+        status = "failed"
+        output = f"Profile failed: {e}"
+        log.error("%s", output)
+    report_result(job_id, status, output, int((time.time() - start_time) * 1000))
 
 
 def report_result(job_id, status, output, duration_ms):
@@ -169,33 +211,43 @@ def report_result(job_id, status, output, duration_ms):
             timeout=10
         )
         if response.status_code == 200:
-            print(f"[{datetime.now()}] Job {job_id} result reported: {status} ({duration_ms}ms)")
+            log.info("Job %s result reported: %s (%sms)", job_id, status, duration_ms)
         else:
-            print(f"[{datetime.now()}] Failed to report result: HTTP {response.status_code}")
+            log.warning("Failed to report result: HTTP %s", response.status_code)
     except Exception as e:
-        print(f"[{datetime.now()}] Error reporting result: {e}")
+        log.error("Error reporting result: %s", e)
 
 
 def main():
-    global running
+    global running, reconciler
+
+    setup_logging("job_poller", limits={"poll": (1 / 60, 3)})
 
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
     remove_stop_file()
+    reconciler = ServiceReconciler(API_URL, PI_ID)
+    health_client = start_health()
 
-    print(f"[{datetime.now()}] Light Job Poller started")
-    print(f"[{datetime.now()}] API URL: {API_URL}")
-    print(f"[{datetime.now()}] PI ID: {PI_ID}")
-    print(f"[{datetime.now()}] Poll interval: {POLL_INTERVAL}s")
+    log.info("Light Job Poller started")
+    log.info("API URL: %s", API_URL)
+    log.info("PI ID: %s", PI_ID)
+    log.info("Poll interval: %ss", POLL_INTERVAL)
 
+    next_sync = 0
     try:
         while running:
             if check_stop_file():
-                print(f"[{datetime.now()}] Stop file detected. Shutting down...")
+                log.info("Stop file detected. Shutting down...")
                 remove_stop_file()
                 break
 
+            # Converge services to the desired state (also heals lost start/stop jobs)
+            if time.monotonic() >= next_sync:
+                sync_desired_state()
+                next_sync = time.monotonic() + DESIRED_INTERVAL
+
             job = poll_for_job()
             if job:
                 execute_job(job)
@@ -206,10 +258,11 @@ def main():
                 time.sleep(1)
 
     except Exception as e:
-        print(f"[{datetime.now()}] Fatal error: {e}")
+        log.error("Fatal error: %s", e)
         return 1
     finally:
-        print(f"[{datetime.now()}] Light Job Poller stopped")
+        health_client.disconnect()
+        log.info("Light Job Poller stopped")
         remove_stop_file()
     return 0
 
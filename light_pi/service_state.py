@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Desired service state for the job pollers (same file in gateway/, gps_pi/ and light_pi/)
+The backend keeps one document per Pi with the systemd units it wants
+running or stopped: {"services": {"mqtt-forwarder": "active"}, "version": 7}.
+Start/stop jobs update that document; the poller converges the Pi to it.
+
+- fetch(): conditional GET /api/desired?pi_id=<id> (ETag), cheap when unchanged
+- reconcile(): compares the desired states with the actual unit states and
+  only starts/stops units that differ; units already in the desired state
+  are never restarted, units not in the document are left alone
+- report(): sends the converged state to /api/desired/report, only when it
+  changed since the last report
+- A lost job (the backend keeps one pending job per Pi) is harmless: the
+  next fetch brings the document and reconcile() fixes the difference. A unit
+  that crashed is started again the same way
+- Unit states are cached for STATE_CACHE_SEC (own start/stop refresh them)
+- The document is kept in DESIRED_PATH, so the Pi converges after a reboot
+  even while the backend is unreachable
+"""
+
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+
+import requests
+
+log = logging.getLogger(__name__)
+
+DESIRED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "desired_state.json")
+STATES = ("active", "inactive")
+STATE_CACHE_SEC = 30
+SETTLE_SEC = 2  # wait after start/stop before checking the result
+SYSTEMCTL_TIMEOUT = 10
+
+
+def unit_state(unit):
+    """systemctl is-active: active, inactive, failed, activating, ..."""
+    result = subprocess.run(["systemctl", "is-active", unit], capture_output=True, text=True,
+                            timeout=SYSTEMCTL_TIMEOUT)
+    return result.stdout.strip() or "unknown"
+
+
+class ServiceReconciler:
+    """Converges the Pi's systemd units to the desired-state document"""
+
+    def __init__(self, api_url, pi_id, path=DESIRED_PATH):
+        self.api_url = api_url
+        self.pi_id = pi_id
+        self.path = path
+        self.desired = {}  # unit -> "active" | "inactive"
+        self.version = 0
+        self._etag = None
+        self._actual = {}  # unit -> (state, monotonic time of the check)
+        self._reported = None
+        self._lock = threading.Lock()  # jobs and the poll loop both reconcile
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.desired = dict(data.get("services") or {})
+            self.version = data.get("version", 0)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log.warning("Desired state file unreadable, starting empty: %s", e)
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"services": self.desired, "version": self.version}, f)
+        os.replace(tmp, self.path)
+
+    # ---- Desired state ----
+    def set_desired(self, unit, state):
+        """Local change (from a start/stop job); the backend document has it too"""
+        if state not in STATES:
+            raise ValueError(f"Invalid state for {unit}: {state}")
+        with self._lock:
+            if self.desired.get(unit) != state:
+                self.desired[unit] = state
+                self._save()
+
+    def fetch(self):
+        """Get the backend document if it changed; returns True when it did"""
+        headers = {"If-None-Match": self._etag} if self._etag else {}
+        response = requests.get(f"{self.api_url}/api/desired", params={"pi_id": self.pi_id},
+                                headers=headers, timeout=10)
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+        data = response.json()
+        services = {u: s for u, s in (data.get("services") or {}).items() if s in STATES}
+        with self._lock:
+            self._etag = response.headers.get("ETag")
+            changed = services != self.desired or data.get("version", 0) != self.version
+            if changed:
+                log.info("Desired state v%s: %s", data.get("version", 0), services)
+                self.desired = services
+                self.version = data.get("version", 0)
+                self._save()
+        return changed
+
+    # ---- Actual state ----
+    def actual(self, unit, max_age=STATE_CACHE_SEC):
+        cached = self._actual.get(unit)
+        if cached and time.monotonic() - cached[1] < max_age:
+            return cached[0]
+        state = unit_state(unit)
+        self._actual[unit] = (state, time.monotonic())
+        return state
+
+    def reconcile(self):
+        """Start/stop the units that differ; returns {unit: {"desired", "actual", "action"[, "error"]}}"""
+        with self._lock:
+            result = {}
+            for unit, desired in self.desired.items():
+                actual = self.actual(unit)
+                entry = result[unit] = {"desired": desired, "actual": actual, "action": None}
+                # "failed"/"activating" count as not active; stopping a failed unit is not needed
+                if (actual == "active") == (desired == "active"):
+                    continue
+                action = "start" if desired == "active" else "stop"
+                entry["action"] = action
+                log.info("%s is %s, desired %s: %s", unit, actual, desired, action)
+                try:
+                    run = subprocess.run(["sudo", "systemctl", action, unit], capture_output=True, text=True,
+                                         timeout=SYSTEMCTL_TIMEOUT)
+                    if run.returncode != 0:
+                        entry["error"] = run.stderr.strip() or f"systemctl {action} failed"
+                    time.sleep(SETTLE_SEC)
+                except subprocess.TimeoutExpired:
+                    entry["error"] = f"systemctl {action} timed out"
+                entry["actual"] = self.actual(unit, max_age=0)
+                if "error" in entry:
+                    log.warning("%s: %s", unit, entry["error"])
+            return result
+
+    @staticmethod
+    def converged(result):
+        return all((e["actual"] == "active") == (e["desired"] == "active") for e in result.values())
+
+    # ---- Reporting ----
+    def report(self, result):
+        """Send the actual states to the backend if they changed since the last report"""
+        body = {
+            "pi_id": self.pi_id,
+            "version": self.version,
+            "services": {unit: entry["actual"] for unit, entry in result.items()},
+            "converged": self.converged(result),
+            "errors": {unit: entry["error"] for unit, entry in result.items() if "error" in entry},
+        }
+        if body == self._reported:
+            return
+        response = requests.post(f"{self.api_url}/api/desired/report", json=body, timeout=10)
+        response.raise_for_status()
+        self._reported = body
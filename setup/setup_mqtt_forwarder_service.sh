@@ -31,6 +31,7 @@ Type=simple
 User=$CURRENT_USER
 WorkingDirectory=$SCRIPT_DIR
 ExecStart=/usr/bin/python3 $SCRIPT_DIR/mqtt_forwarder.py
+ExecReload=/bin/kill -HUP \$MAINPID
 Restart=on-failure
 RestartSec=5
 StandardOutput=journal